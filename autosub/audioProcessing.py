@@ -3,12 +3,13 @@
 
 import sys
 import shlex
+import tempfile
 import subprocess
 import numpy as np
-from os.path import basename
 
 # Local import
 import logger
+import profiler
 
 try:
     from shlex import quote
@@ -18,22 +19,100 @@ except ImportError:
 _logger = logger.setup_applevel_logger(__name__)
 
 
-def extract_audio(input_file, audio_file_name):
-    """Extract audio from input video file and save to audio/ in root dir
+def window_options(start=None, duration=None):
+    """FFMPEG input options that only read [start, start + duration) seconds of the input"""
+
+    options = []
+    if start:
+        options += ["-ss", f"{start:.3f}"]
+    if duration is not None:
+        options += ["-t", f"{duration:.3f}"]
+    return options
+
+
+def extract_audio(input_file, audio_file_name, start=None, duration=None):
+    """Extract audio from input video file and save it as a 16kHz mono WAV file
 
     Args:
         input_file : input video file
         audio_file_name : save audio WAV file with same filename as video file
+        start, duration : (opt) only extract this window of the input, in seconds
     """
 
     try:
-        command = ["ffmpeg", "-hide_banner", "-loglevel", "warning", "-i", input_file, "-ac", "1", "-ar", "16000",
-                   "-vn", "-f", "wav", audio_file_name]
-        ret = subprocess.run(command).returncode
-        _logger.info(f"Extracted audio to audio/{basename(audio_file_name)}")
+        command = (["ffmpeg", "-hide_banner", "-loglevel", "warning"] + window_options(start, duration) +
+                   ["-i", input_file, "-ac", "1", "-ar", "16000", "-vn", "-f", "wav", audio_file_name])
+        with profiler.stage("extract_audio"):
+            ret = subprocess.run(command).returncode
     except Exception as e:
         _logger.error(str(e))
         sys.exit(1)
+    if ret != 0:
+        _logger.error(f"FFMPEG failed to extract audio from {input_file} (exit status {ret})")
+        sys.exit(1)
+    _logger.info(f"Extracted audio to {audio_file_name}")
+
+
+def probe_duration(input_file):
+    """Get the duration of a media file with FFPROBE
+
+    Args:
+        input_file : input video file
+
+    Returns:
+        duration in seconds, None if it can't be determined
+    """
+
+    command = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of",
+               "default=noprint_wrappers=1:nokey=1", input_file]
+    try:
+        result = subprocess.run(command, stdin=subprocess.DEVNULL, capture_output=True, text=True)
+        return float(result.stdout.strip()) if result.returncode == 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def stream_audio(input_file, sampling_rate=16000, block_size=16000 * 10, start=None, duration=None):
+    """Decode the audio of the input file with FFMPEG and yield it as it is
+    decoded, as blocks of 16-bit mono PCM read from FFMPEG's stdout. No
+    intermediate WAV file is written.
+
+    Args:
+        input_file : input video file
+        sampling_rate : output sampling rate, DeepSpeech expects 16kHz
+        block_size : number of samples per block
+        start, duration : (opt) only decode this window of the input, in seconds
+
+    Yields:
+        numpy buffer : int16 audio samples
+
+    Raises:
+        RuntimeError : if FFMPEG exits with a non-zero status
+    """
+
+    command = (["ffmpeg", "-hide_banner", "-loglevel", "warning"] + window_options(start, duration) +
+               ["-i", input_file, "-ac", "1", "-ar", str(sampling_rate), "-vn", "-f", "s16le", "-acodec",
+                "pcm_s16le", "pipe:1"])
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=stderr)
+        try:
+            while True:
+                with profiler.stage("decode"):
+                    data = process.stdout.read(2 * block_size)
+                if not data:
+                    break
+                yield np.frombuffer(data[:len(data) - len(data) % 2], np.int16)
+            ret = process.wait()
+        finally:
+            # stop FFMPEG if the consumer gave up early
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+        if ret != 0:
+            stderr.seek(0)
+            message = stderr.read().decode(errors="replace").strip()
+            raise RuntimeError(f"FFMPEG returned non-zero status {ret}: {message}")
 
 
 def convert_samplerate(audio_path, desired_sample_rate):
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+from collections import namedtuple
+
+# Local imports
+import logger
+from utils import sort_alphanumeric
+from audioProcessing import probe_duration
+
+_logger = logger.setup_applevel_logger(__name__)
+
+# Outcome of one input of a batch: duration of its audio (None if unknown), processing
+# wall time in seconds, and the error message of a failed input
+FileResult = namedtuple("FileResult", ["input_file", "duration", "elapsed", "ok", "error"])
+
+
+def collect_inputs(files=None, input_dir=None, manifest=None):
+    """List the input files of a batch, in the order given and without duplicates
+
+    Args:
+        files : list of input files
+        input_dir : directory whose files (and files of its subdirectories) are added
+        manifest : text file listing input files, one per line. Blank lines and lines
+                   starting with # are skipped, relative paths are relative to the manifest
+
+    Returns:
+        inputs : list of input file paths. Missing files are kept, so they are reported as
+                 failures of the batch
+    """
+
+    inputs = list(files or [])
+    if input_dir is not None:
+        if not os.path.isdir(input_dir):
+            _logger.warn(f"Invalid input directory: {input_dir}")
+        for root, dirs, names in os.walk(input_dir):
+            dirs[:] = sort_alphanumeric([d for d in dirs if not d.startswith(".")])
+            inputs += [os.path.join(root, name) for name in sort_alphanumeric(names) if not name.startswith(".")]
+    if manifest is not None:
+        base = os.path.dirname(os.path.abspath(manifest))
+        try:
+            with open(manifest) as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        inputs.append(os.path.join(base, os.path.expanduser(line)))
+        except OSError as e:
+            _logger.warn(f"Can't read manifest {manifest}: {e}")
+
+    seen = set()
+    unique = []
+    for input_file in inputs:
+        key = os.path.abspath(input_file)
+        if key not in seen:
+            seen.add(key)
+            unique.append(input_file)
+    return unique
+
+
+def unique_prefixes(inputs):
+    """Names the subtitle files of each input after it, numbering inputs with the same
+    file name so that their subtitles don't overwrite each other
+
+    Returns:
+        prefixes : dict of input file to subtitle file name, without extension
+    """
+
+    prefixes = {}
+    used = set()
+    for input_file in inputs:
+        base = os.path.splitext(os.path.basename(input_file))[0]
+        prefix, count = base, 1
+        while prefix in used:
+            count += 1
+            prefix = f"{base}_{count}"
+        used.add(prefix)
+        prefixes[input_file] = prefix
+    return prefixes
+
+
+def run_batch(inputs, process):
+    """Process every input, longest first (durations from FFPROBE, inputs of unknown
+    duration last). A failing input is logged and the batch goes on with the next one.
+
+    Args:
+        inputs : list of input files
+        process : function called with each input file
+
+    Returns:
+        results : list of FileResult, in processing order
+    """
+
+    durations = {input_file: probe_duration(input_file) for input_file in inputs}
+    order = sorted(inputs, key=lambda f: -durations[f] if durations[f] is not None else float("inf"))
+
+    results = []
+    batch_start = time.perf_counter()
+    for number, input_file in enumerate(order, 1):
+        _logger.info(f"[{number}/{len(order)}] Input file: {input_file}")
+        start = time.perf_counter()
+        error = None
+        try:
+            if not os.path.isfile(input_file):
+                raise FileNotFoundError(f"Invalid file: {input_file}")
+            process(input_file)
+        except SystemExit as e:
+            # the single file code paths exit on errors they have already logged
+            error = f"exit status {e.code}"
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            _logger.error(f"{input_file} failed: {error}")
+        results.append(FileResult(input_file, durations[input_file], time.perf_counter() - start, error is None,
+                                  error))
+    log_summary(results, time.perf_counter() - batch_start)
+    return results
+
+
+def log_summary(results, wall_time):
+    """Log the per-file and aggregate throughput of a batch"""
+
+    _logger.info("Batch summary:")
+    for result in results:
+        if not result.ok:
+            _logger.info(f"  FAILED  {result.input_file} ({result.error})")
+        elif result.duration:
+            _logger.info(f"  ok      {result.input_file}: {result.duration:.1f}s of audio in {result.elapsed:.1f}s "
+                         f"({result.duration / result.elapsed:.1f}x real time)")
+        else:
+            _logger.info(f"  ok      {result.input_file}: {result.elapsed:.1f}s")
+
+    done = [result for result in results if result.ok]
+    audio = sum(result.duration for result in done if result.duration)
+    _logger.info(f"{len(done)} of {len(results)} files transcribed in {wall_time:.1f}s, "
+                 f"{audio / 3600:.2f} hours of audio ({audio / wall_time if wall_time else 0:.1f}x real time, "
+                 f"{len(done) / wall_time * 3600 if wall_time else 0:.0f} files/hour)")
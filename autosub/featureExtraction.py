@@ -1,12 +1,36 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import functools
+from collections import namedtuple
+
 import numpy as np
-from scipy.fftpack import fft
-from scipy.fftpack.realtransforms import dct
 
 eps = 0.00000001
 
+# Feature groups in the order they appear in the feature matrix
+FEATURE_GROUPS = (
+    ("zcr", ["zcr"]),
+    ("energy", ["energy"]),
+    ("energy_entropy", ["energy_entropy"]),
+    ("spectral", ["spectral_centroid", "spectral_spread", "spectral_entropy",
+                  "spectral_flux", "spectral_rolloff"]),
+    ("mfcc", ["mfcc_{0:d}".format(i) for i in range(1, 14)]),
+    ("chroma", ["chroma_{0:d}".format(i) for i in range(1, 13)] +
+     ["chroma_std"]),
+)
+# Groups that need the fft of the frame
+SPECTRAL_GROUPS = ("spectral", "mfcc", "chroma")
+
+# Feature profiles selectable by feature_extraction(). Every profile keeps
+# the energy feature, which silence_removal() uses to pick training frames.
+FEATURE_PROFILES = {
+    "energy": ("energy",),
+    "energy+zcr+spectral": ("zcr", "energy", "energy_entropy", "spectral"),
+    "mfcc": ("energy", "mfcc"),
+    "full": tuple(group for group, _ in FEATURE_GROUPS),
+}
+
 
 def zero_crossing_rate(frame):
     """Computes zero crossing rate of frame
@@ -194,6 +218,8 @@ def mfcc(fft_magnitude, fbank, num_mfcc_feats):
          compact and suitable for the pyAudioAnalysis Lib
     """
 
+    from scipy.fftpack.realtransforms import dct
+
     mspec = np.log10(np.dot(fft_magnitude, fbank.T) + eps)
     ceps = dct(mspec, type=2, norm='ortho', axis=-1)[:num_mfcc_feats]
     return ceps
@@ -219,51 +245,101 @@ def chroma_features_init(num_fft, sampling_rate):
 
 
 def chroma_features(signal, sampling_rate, num_fft):
-    # TODO: 1 complexity
-    # TODO: 2 bug with large windows
+    """Computes the 12 chroma values of a frame as a single product with the
+    cached chroma projection (see spectral_tables)
+    """
 
-    num_chroma, num_freqs_per_chroma = \
-        chroma_features_init(num_fft, sampling_rate)
+    chroma_proj = spectral_tables(sampling_rate, num_fft).chroma_proj
+    if chroma_proj is None:
+        raise ValueError("Window too short to compute chroma features")
     chroma_names = ['A', 'A#', 'B', 'C', 'C#', 'D',
                     'D#', 'E', 'F', 'F#', 'G', 'G#']
     spec = signal ** 2
-    if num_chroma.max() < num_chroma.shape[0]:
-        C = np.zeros((num_chroma.shape[0],))
-        C[num_chroma] = spec
-        C /= num_freqs_per_chroma[num_chroma]
-    else:
-        I = np.nonzero(num_chroma > num_chroma.shape[0])[0][0]
-        C = np.zeros((num_chroma.shape[0],))
-        C[num_chroma[0:I - 1]] = spec
-        C /= num_freqs_per_chroma
-    final_matrix = np.zeros((12, 1))
-    newD = int(np.ceil(C.shape[0] / 12.0) * 12)
-    C2 = np.zeros((newD,))
-    C2[0:C.shape[0]] = C
-    C2 = C2.reshape(int(C2.shape[0] / 12), 12)
-    # for i in range(12):
-    #    finalC[i] = np.sum(C[i:C.shape[0]:12])
-    final_matrix = np.matrix(np.sum(C2, axis=0)).T
+    final_matrix = np.matrix(np.dot(spec, chroma_proj)).T
     final_matrix /= spec.sum()
-
-    #    ax = plt.gca()
-    #    plt.hold(False)
-    #    plt.plot(finalC)
-    #    ax.set_xticks(range(len(chromaNames)))
-    #    ax.set_xticklabels(chromaNames)
-    #    xaxis = np.arange(0, 0.02, 0.01);
-    #    ax.set_yticks(range(len(xaxis)))
-    #    ax.set_yticklabels(xaxis)
-    #    plt.show(block=False)
-    #    plt.draw()
     return chroma_names, final_matrix
 
 
+def chroma_matrix(num_fft, sampling_rate):
+    """Builds the (num_fft x 12) projection matrix that maps a power spectrum
+    to the 12 chroma values computed by chroma_features(), so that the
+    chroma of a whole batch of frames is a single matrix product
+
+    Args:
+        num_fft : number of fft bins per frame
+        sampling_rate : the sampling freq (in Hz)
+
+    Returns:
+        projection (numpy.ndarray) : (num_fft x 12) matrix
+    """
+
+    num_chroma, num_freqs_per_chroma = \
+        chroma_features_init(num_fft, sampling_rate)
+    if num_chroma.max() >= num_chroma.shape[0]:
+        raise ValueError("Window too short to compute chroma features")
+
+    # chroma_features() assigns C[num_chroma] = spec, so each position of C
+    # holds the last bin mapped to it (negative chroma indices wrap around)
+    positions = num_chroma % num_fft
+    _, last_rev = np.unique(positions[::-1], return_index=True)
+    bins = num_fft - 1 - last_rev
+    positions = positions[bins]
+
+    # ... then divides position j by num_freqs_per_chroma[num_chroma[j]] and
+    # folds positions modulo 12
+    divisor = num_freqs_per_chroma[num_chroma[positions]]
+    projection = np.zeros((num_fft, 12))
+    projection[bins, positions % 12] = 1.0 / divisor
+    return projection
+
+
+
+# Lookup tables shared by every frame of a given (sampling_rate, num_fft)
+SpectralTables = namedtuple("SpectralTables", [
+    "fbank", "chroma_proj", "centroid_axis", "rolloff_axis"])
+
+
+@functools.lru_cache(maxsize=8)
+def spectral_tables(sampling_rate, num_fft):
+    """Builds the frequency-domain tables used by the spectral, MFCC and
+    chroma features. Results are memoized, so files sharing the same
+    parameters never rebuild them; the arrays are read-only.
+
+    Args:
+        sampling_rate : the sampling freq (in Hz)
+        num_fft : number of fft bins per frame
+
+    Returns:
+        SpectralTables : fbank is the MFCC filter bank (see
+                         mfcc_filter_banks), chroma_proj the chroma projection
+                         (see chroma_matrix, None if the window is too short),
+                         centroid_axis the bin frequencies (in Hz) and
+                         rolloff_axis the bin positions as a fraction of num_fft
+    """
+
+    fbank, _ = mfcc_filter_banks(sampling_rate, num_fft)
+    try:
+        chroma_proj = chroma_matrix(num_fft, sampling_rate)
+    except ValueError:
+        chroma_proj = None
+    centroid_axis = np.arange(1, num_fft + 1) * \
+        (sampling_rate / (2.0 * num_fft))
+    rolloff_axis = np.arange(num_fft) / float(num_fft)
+
+    tables = SpectralTables(fbank, chroma_proj, centroid_axis, rolloff_axis)
+    for table in tables:
+        if table is not None:
+            table.setflags(write=False)
+    return tables
+
 """ Windowing and feature extraction """
 
 
-def feature_extraction(signal, sampling_rate, window, step, deltas=True):
-    """This function implements the shor-term windowing process.
+def feature_extraction_framewise(signal, sampling_rate, window, step,
+                                 deltas=True):
+    """Reference per-frame implementation of feature_extraction(), kept to
+    validate the batched engine against. This function implements the
+    shor-term windowing process.
     For each short-term window a set of features is extracted.
     This results to a sequence of feature vectors, stored in a np matrix.
 
@@ -291,13 +367,15 @@ def feature_extraction(signal, sampling_rate, window, step, deltas=True):
     signal_max = (np.abs(signal)).max()
     signal = (signal - dc_offset) / (signal_max + 0.0000000001)
 
+    from scipy.fftpack import fft
+
     number_of_samples = len(signal)  # total number of samples
     current_position = 0
     count_fr = 0
     num_fft = int(window / 2)
 
-    # compute the triangular filter banks used in the mfcc calculation
-    fbank, freqs = mfcc_filter_banks(sampling_rate, num_fft)
+    # the triangular filter banks used in the mfcc calculation
+    fbank = spectral_tables(sampling_rate, num_fft).fbank
 
     n_time_spectral_feats = 8
     n_harmonic_feats = 0
@@ -405,3 +483,288 @@ def feature_extraction(signal, sampling_rate, window, step, deltas=True):
 
     features = np.concatenate(features, 1)
     return features, feature_names
+
+
+def frame_signal(signal, window, step):
+    """Returns a strided (n_frames x window) view of the signal, holding the
+    same short-term windows as the per-frame loop (no data is copied)
+
+    Args:
+        signal : 1-D signal
+        window : the short-term window size (in samples)
+        step : the short-term window step (in samples)
+    """
+
+    if len(signal) < window:
+        return np.empty((0, window), dtype=signal.dtype)
+    return np.lib.stride_tricks.sliding_window_view(signal, window)[::step]
+
+
+def _block_entropy(frames, frame_energy, n_short_blocks=10):
+    """Entropy of the sub-block energies of every row (see energy_entropy)
+    """
+
+    sub_win_len = frames.shape[1] // n_short_blocks
+    sub_wins = frames[:, :sub_win_len * n_short_blocks].reshape(
+        frames.shape[0], n_short_blocks, sub_win_len)
+    s = np.sum(sub_wins ** 2, axis=2) / (frame_energy[:, None] + eps)
+    return -np.sum(s * np.log2(s + eps), axis=1)
+
+
+def short_term_features(frames, sampling_rate, tables,
+                        fft_magnitude_previous=None, groups=None):
+    """Computes the base short-term features for a batch of frames with
+    whole-matrix operations. Only the requested feature groups are computed;
+    the fft is skipped entirely when no spectral group is requested.
+
+    Args:
+        frames : (n_frames x window) matrix of normalized samples
+        sampling_rate : the sampling freq (in Hz)
+        tables : SpectralTables of the frames (see spectral_tables)
+        fft_magnitude_previous : (opt) fft magnitude of the frame preceding
+                                 the batch, used in spectral flux
+        groups : (opt) feature groups to compute (see FEATURE_GROUPS),
+                 defaults to all of them
+
+    Returns:
+        features (numpy.ndarray) : (n_frames x n_feats) feature matrix
+        fft_magnitude (numpy.ndarray) : fft magnitude of the last frame
+                                        (None if no fft was computed)
+    """
+
+    if groups is None:
+        groups = FEATURE_PROFILES["full"]
+    n_frames, window = frames.shape
+    columns = []
+
+    # time-domain features
+    frame_energy = np.sum(frames ** 2, axis=1)
+    if "zcr" in groups:
+        columns.append(np.sum(np.abs(np.diff(np.sign(frames), axis=1)),
+                              axis=1) / 2 / np.float64(window - 1.0))
+    if "energy" in groups:
+        columns.append(frame_energy / np.float64(window))
+    if "energy_entropy" in groups:
+        columns.append(_block_entropy(frames, frame_energy))
+
+    if not set(groups) & set(SPECTRAL_GROUPS):
+        return np.column_stack(columns), None
+
+    # one real fft over all frames
+    num_fft = tables.fbank.shape[1]
+    fft_magnitude = np.abs(np.fft.rfft(frames, axis=1))[:, :num_fft]
+    fft_magnitude /= num_fft
+    spec = fft_magnitude ** 2
+    spec_energy = np.sum(spec, axis=1)
+
+    if "spectral" in groups:
+        # spectral centroid / spread
+        ind = tables.centroid_axis
+        Xt = fft_magnitude / fft_magnitude.max(axis=1, keepdims=True)
+        den = np.sum(Xt, axis=1) + eps
+        centroid = np.dot(Xt, ind) / den
+        spread = np.sqrt(np.sum(((ind - centroid[:, None]) ** 2) * Xt,
+                                axis=1) / den)
+        columns.append(centroid / (sampling_rate / 2.0))
+        columns.append(spread / (sampling_rate / 2.0))
+
+        # spectral entropy
+        columns.append(_block_entropy(fft_magnitude, spec_energy))
+
+        # spectral flux against the previous frame (the first frame of the
+        # signal is compared against itself)
+        if fft_magnitude_previous is None:
+            fft_magnitude_previous = fft_magnitude[0]
+        previous = np.vstack((fft_magnitude_previous, fft_magnitude[:-1]))
+        fft_sum = np.sum(fft_magnitude + eps, axis=1, keepdims=True)
+        previous_sum = np.sum(previous + eps, axis=1, keepdims=True)
+        columns.append(np.sum((fft_magnitude / fft_sum -
+                               previous / previous_sum) ** 2, axis=1))
+
+        # spectral rolloff
+        above = (np.cumsum(spec, axis=1) + eps) > \
+            0.90 * spec_energy[:, None]
+        columns.append(np.where(above.any(axis=1),
+                                tables.rolloff_axis[above.argmax(axis=1)],
+                                0.0))
+
+    if "mfcc" in groups:
+        from scipy.fftpack.realtransforms import dct
+
+        mspec = np.log10(np.dot(fft_magnitude, tables.fbank.T) + eps)
+        columns.append(dct(mspec, type=2, norm='ortho', axis=-1)[:, :13])
+
+    if "chroma" in groups:
+        chroma = np.dot(spec, tables.chroma_proj) / spec_energy[:, None]
+        columns.append(chroma)
+        columns.append(chroma.std(axis=1))
+
+    return np.column_stack(columns), fft_magnitude[-1]
+
+
+def feature_names_for(groups, deltas=True):
+    """Returns the names of the features computed for the given groups,
+    in the order they appear in the feature matrix
+    """
+
+    feature_names = []
+    for group, names in FEATURE_GROUPS:
+        if group in groups:
+            feature_names += names
+    if deltas:
+        feature_names = feature_names + ["delta " + f for f in feature_names]
+    return feature_names
+
+
+def normalization_params(blocks):
+    """Computes the DC offset and peak amplitude used to normalize a signal
+    before feature extraction, in a single pass over its sample blocks
+
+    Args:
+        blocks : iterable of signal sample blocks (a whole signal is a single
+                 block)
+
+    Returns:
+        dc_offset, signal_max : mean and max absolute value of the signal
+                                scaled by 1 / 2 ** 15
+    """
+
+    total = 0.0
+    count = 0
+    signal_max = 0.0
+    for block in blocks:
+        if len(block) == 0:
+            continue
+        total += np.sum(block, dtype=np.float64)
+        count += len(block)
+        signal_max = max(signal_max, float(np.max(block)), -float(np.min(block)))
+    if count == 0:
+        return 0.0, 0.0
+    return total / count / (2.0 ** 15), signal_max / (2.0 ** 15)
+
+
+def frame_stream(blocks, window, step):
+    """Frames a stream of signal blocks. Samples needed by windows that
+    straddle a block edge are carried over to the next block, so the frames
+    are exactly those of frame_signal() over the concatenated signal.
+
+    Args:
+        blocks : iterable of 1-D signal sample blocks
+        window : the short-term window size (in samples)
+        step : the short-term window step (in samples)
+
+    Yields:
+        frames : (n_frames x window) matrices of consecutive frames
+    """
+
+    pending = None
+    skip = 0
+    for block in blocks:
+        if skip:
+            dropped = min(skip, len(block))
+            block = block[dropped:]
+            skip -= dropped
+        pending = block if pending is None or len(pending) == 0 else \
+            np.concatenate((pending, block))
+        frames = frame_signal(pending, window, step)
+        if frames.shape[0] == 0:
+            continue
+        yield frames
+        consumed = frames.shape[0] * step
+        skip = max(0, consumed - len(pending))
+        pending = pending[consumed:].copy()
+
+
+def feature_blocks(frame_blocks, sampling_rate, window, dc_offset,
+                   signal_max, deltas=True, profile="full"):
+    """Computes the features of consecutive batches of raw frames, carrying
+    the spectral flux and delta state across batches
+
+    Args:
+        frame_blocks : iterable of (n_frames x window) raw sample matrices
+        sampling_rate : the sampling freq (in Hz)
+        window : the short-term window size (in samples)
+        dc_offset, signal_max : normalization (see normalization_params)
+        deltas : (opt) True/False if delta features are to be computed
+        profile : (opt) one of FEATURE_PROFILES
+
+    Yields:
+        features (numpy.ndarray) : (n_feats x n_frames) feature blocks
+    """
+
+    if profile not in FEATURE_PROFILES:
+        raise ValueError(f"Unknown feature profile: {profile}")
+    groups = FEATURE_PROFILES[profile]
+
+    tables = spectral_tables(sampling_rate, int(window / 2))
+    if "chroma" in groups and tables.chroma_proj is None:
+        raise ValueError("Window too short to compute chroma features")
+
+    fft_magnitude_previous = None
+    feature_vector_prev = None
+    for frames in frame_blocks:
+        if frames.shape[0] == 0:
+            continue
+        # signal normalization
+        frames = np.double(frames) / (2.0 ** 15)
+        frames = (frames - dc_offset) / (signal_max + 0.0000000001)
+        block, fft_magnitude_previous = short_term_features(
+            frames, sampling_rate, tables, fft_magnitude_previous, groups)
+        if deltas:
+            # delta of the first frame of the signal is zero
+            first = feature_vector_prev is None
+            if first:
+                feature_vector_prev = block[0]
+            previous = np.vstack((feature_vector_prev, block[:-1]))
+            delta = block - previous
+            if first:
+                delta[0] = 0.0
+            feature_vector_prev = block[-1]
+            block = np.hstack((block, delta))
+        yield block.T
+
+
+def feature_extraction(signal, sampling_rate, window, step, deltas=True,
+                       profile="full", block_frames=2048):
+    """This function implements the short-term windowing process.
+    The raw signal is framed as a strided view, and up to block_frames
+    windows are normalized and turned into features at once, which bounds
+    the size of the intermediate arrays. With the "full" profile this
+    matches feature_extraction_framewise() within floating point tolerance.
+
+    Args:
+        signal : the input signal samples
+        sampling_rate : the sampling freq (in Hz)
+        window : the short-term window size (in samples)
+        step : the short-term window step (in samples)
+        deltas : (opt) True/False if delta features are to be computed
+        profile : (opt) one of FEATURE_PROFILES, features left out of the
+                  profile are not computed at all
+        block_frames : (opt) number of frames processed per batch
+
+    Returns:
+        features (numpy.ndarray) : contains features
+                                (n_feats x numOfShortTermWindows)
+        feature_names (list) : contains feature names
+    """
+
+    if profile not in FEATURE_PROFILES:
+        raise ValueError(f"Unknown feature profile: {profile}")
+    window = int(window)
+    step = int(step)
+
+    dc_offset, signal_max = normalization_params([signal])
+    feature_names = feature_names_for(FEATURE_PROFILES[profile], deltas)
+
+    frames = frame_signal(signal, window, step)
+    n_frames = frames.shape[0]
+    features = np.empty((len(feature_names), n_frames))
+    frame_blocks = (frames[start:start + block_frames]
+                    for start in range(0, n_frames, block_frames))
+    start = 0
+    for block in feature_blocks(frame_blocks, sampling_rate, window,
+                                dc_offset, signal_max, deltas, profile):
+        features[:, start:start + block.shape[1]] = block
+        start += block.shape[1]
+
+    return features, feature_names
@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import signal
+import concurrent.futures
+
+import numpy as np
+
+# Local imports
+import logger
+import profiler
+from utils import create_model
+from writeToFile import Cue
+from tokenTimeline import TokenTimeline
+
+_logger = logger.setup_applevel_logger(__name__)
+
+# STT model of a worker process, see transcribe_segments
+_worker_model = None
+
+
+def ds_transcribe(ds, audio):
+    """Run sttWithMetadata() on a segment and copy out its tokens, so the result
+    no longer references the STT metadata objects (and can be sent between processes)
+
+    Args:
+        ds : DeepSpeech Model
+        audio : int16 segment samples
+
+    Returns:
+        tokens : tokenTimeline.TokenTimeline, start times relative to the segment
+    """
+
+    with profiler.stage("inference"):
+        metadata = ds.sttWithMetadata(audio)
+    return TokenTimeline.from_metadata(metadata)
+
+
+def transcribe_segment(ds, segment, cache=None):
+    """ds_transcribe() a segment, looking it up in the cache first, and record its
+    latency in the run profile
+
+    Args:
+        ds : DeepSpeech Model
+        segment : segmentAudio.Segment holding the audio samples
+        cache : (opt) transcriptCache.TranscriptCache, a hit skips inference
+
+    Returns:
+        tokens : see ds_transcribe
+    """
+
+    start = time.perf_counter()
+    tokens = cache.get(segment.audio) if cache is not None else None
+    cached = tokens is not None
+    if not cached:
+        tokens = ds_transcribe(ds, segment.audio)
+        if cache is not None:
+            cache.put(segment.audio, tokens)
+    profiler.segment(segment.duration, time.perf_counter() - start, cached)
+    return tokens
+
+
+def transcript_cues(tokens, segment, split_duration, line_count):
+    """Split the transcript of a segment into subtitle lines
+
+    Args:
+        tokens : tokenTimeline.TokenTimeline of the segment
+        segment : segmentAudio.Segment the tokens were inferred from
+        split_duration: for long audio segments, split the subtitle based on this number of seconds
+        line_count : number of the first subtitle line
+
+    Returns:
+        cues : list of writeToFile.Cue
+    """
+
+    segment_start = segment.start_time
+    # start times on the input timeline, and those of the word boundaries for VTT word cues
+    starts = segment_start + tokens.starts.astype(np.float64)
+    lines = tokens.split(split_duration)
+    word_bounds = np.searchsorted(tokens.spaces, lines).tolist()
+    cues = []
+    for number, (first, last) in enumerate(lines):
+        # a line starts where the previous one ended
+        start = starts[lines[number - 1][1] - 1] if number else segment_start
+        word_starts = starts[tokens.spaces[word_bounds[number][0]:word_bounds[number][1]]].tolist()
+        cues.append(Cue(line_count + number, float(start), float(starts[last - 1]), tokens.chars[first:last],
+                        tuple([segment_start] + word_starts), number == len(lines) - 1))
+    return cues
+
+
+def write_transcript(tokens, segment, writer, split_duration, line_count):
+    """Write the tokens inferred for a segment as one or more subtitle lines
+
+    Args:
+        tokens : tokenTimeline.TokenTimeline (see ds_transcribe)
+        segment : segmentAudio.Segment the tokens were inferred from
+        writer : writeToFile.SubtitleWriter
+        split_duration: for long audio segments, split the subtitle based on this number of seconds
+        line_count : number of the first subtitle line written
+
+    Returns:
+        line_count : number of the next subtitle line
+    """
+
+    cues = transcript_cues(tokens, segment, split_duration, line_count)
+    writer.write(cues, segment, tokens)
+    return line_count + len(cues)
+
+
+def ds_process_audio(ds, segment, writer, split_duration, line_count=1, cache=None):
+    """sttWithMetadata() will run DeepSpeech inference on each speech segment
+    returned by remove_silent_segments. The segment start offset is used to
+    place its subtitles on the timeline.
+
+    Args:
+        ds : DeepSpeech Model
+        segment : segmentAudio.Segment holding the audio samples
+        writer : writeToFile.SubtitleWriter
+        split_duration: for long audio segments, split the subtitle based on this number of seconds
+        line_count : number of the first subtitle line written
+        cache : (opt) transcriptCache.TranscriptCache
+
+    Returns:
+        line_count : number of the next subtitle line
+    """
+
+    tokens = transcribe_segment(ds, segment, cache)
+    with profiler.stage("writing"):
+        return write_transcript(tokens, segment, writer, split_duration, line_count)
+
+
+# Tokens this close to the end of the audio fed to a stream may still change with the next
+# chunk, so lines ending there are not committed yet
+STABLE_MARGIN = 1.0
+
+
+def ds_stream_transcribe(ds, audio, sampling_rate, chunk_seconds, split_duration):
+    """Feed a segment to an STT stream in chunks and yield its transcript as it becomes
+    stable. After every chunk, intermediateDecodeWithMetadata() is run and the complete
+    subtitle lines that end at least STABLE_MARGIN seconds before the end of the audio fed
+    so far, and that the previous intermediate decode agreed on, are committed. The final
+    transcript keeps the committed lines as they were, should the last decode revise them.
+
+    Args:
+        ds : DeepSpeech Model
+        audio : int16 segment samples
+        sampling_rate : sampling rate of the audio
+        chunk_seconds : seconds of audio fed between intermediate decodes
+        split_duration : see transcript_cues, a committed prefix ends at a line break
+
+    Yields:
+        tokens, final : tokenTimeline.TokenTimeline of the committed prefix of the transcript,
+                        which only grows, and whether it is the whole transcript
+    """
+
+    chunk = max(1, int(chunk_seconds * sampling_rate))
+    stream = ds.createStream()
+    committed, previous = TokenTimeline("", []), None
+    for offset in range(0, len(audio), chunk):
+        with profiler.stage("inference"):
+            stream.feedAudioContent(audio[offset:offset + chunk])
+        if offset + chunk >= len(audio):
+            break
+        with profiler.stage("inference"):
+            current = TokenTimeline.from_metadata(stream.intermediateDecodeWithMetadata())
+        stable_until = (offset + chunk) / sampling_rate - STABLE_MARGIN
+        stable = len(committed)
+        if previous is not None and current.startswith(committed):
+            # every line but the last ends at a word boundary, the last one may still grow
+            for _, last in current.split(split_duration)[:-1]:
+                if current.starts[last - 1] > stable_until or not previous.startswith(current[:last]):
+                    break
+                stable = last
+        previous = current
+        if stable > len(committed):
+            committed = current[:stable]
+            yield committed, False
+    with profiler.stage("inference"):
+        tokens = TokenTimeline.from_metadata(stream.finishStreamWithMetadata())
+    if not tokens.startswith(committed):
+        # keep the committed tokens, followed by the words decoded after them
+        rest = tokens[int(np.searchsorted(tokens.starts, committed.starts[-1], side="right")):]
+        tokens = committed + rest[len(rest.chars) - len(rest.chars.lstrip(" ")):]
+    yield tokens, True
+
+
+def stream_process_audio(ds, segment, writer, split_duration, chunk_seconds, line_count=1, cache=None):
+    """ds_process_audio() through the STT stream API: a segment longer than chunk_seconds is
+    decoded in chunks (see ds_stream_transcribe), and the subtitle lines of its start are
+    written and flushed to the outputs while the rest is still being decoded.
+
+    Args:
+        ds : DeepSpeech Model
+        segment : segmentAudio.Segment holding the audio samples
+        writer : writeToFile.SubtitleWriter
+        split_duration: for long audio segments, split the subtitle based on this number of seconds
+        chunk_seconds : seconds of audio fed between intermediate decodes
+        line_count : number of the first subtitle line written
+        cache : (opt) transcriptCache.TranscriptCache
+
+    Returns:
+        line_count : number of the next subtitle line
+    """
+
+    if segment.duration <= chunk_seconds:
+        return ds_process_audio(ds, segment, writer, split_duration, line_count, cache)
+    start = time.perf_counter()
+    tokens = cache.get(segment.audio) if cache is not None else None
+    if tokens is not None:
+        profiler.segment(segment.duration, time.perf_counter() - start, True)
+        with profiler.stage("writing"):
+            return write_transcript(tokens, segment, writer, split_duration, line_count)
+
+    written = 0
+    for tokens, final in ds_stream_transcribe(ds, segment.audio, segment.sampling_rate, chunk_seconds,
+                                              split_duration):
+        with profiler.stage("writing"):
+            cues = transcript_cues(tokens, segment, split_duration, line_count)
+            if final:
+                writer.write(cues[written:], segment, tokens)
+            else:
+                # more lines of the segment follow the committed ones
+                writer.write([cue._replace(last=False) for cue in cues[written:]])
+                writer.flush()
+            written = len(cues)
+    profiler.segment(segment.duration, time.perf_counter() - start)
+    if cache is not None:
+        cache.put(segment.audio, tokens)
+    return line_count + written
+
+
+def _init_worker(engine, model, scorer, profile=False):
+    """Pool initializer: every worker process loads its own model, and profiles its stages
+    if the run is profiled"""
+
+    global _worker_model
+    # the parent turns SIGTERM into SystemExit to clean up, workers are just terminated
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if profile:
+        # the stages of the worker go back with every job, see job_result
+        profiler.enable()
+    try:
+        _worker_model = create_model(engine, model, scorer)
+    except SystemExit:
+        # create_model exits on an invalid model, which would break the pool without saying why
+        _worker_model = None
+
+
+def _transcribe_job(job):
+    """Worker task: (index, audio) -> (index, tokens, inference seconds, stage totals of
+    the worker since its previous task, see profiler.take_stages)"""
+
+    index, audio = job
+    if _worker_model is None:
+        raise RuntimeError("Worker process failed to load the model")
+    start = time.perf_counter()
+    tokens = ds_transcribe(_worker_model, audio)
+    return index, tokens, time.perf_counter() - start, profiler.take_stages()
+
+
+def create_pool(jobs, engine, model, scorer):
+    """Start a pool of inference worker processes, each loading its own model. Unlike
+    multiprocessing.Pool, which replaces a killed worker and loses its task, the pool
+    breaks when a worker dies, so the jobs waiting on it fail (see job_result)
+
+    Args:
+        jobs : number of worker processes
+        engine, model, scorer : see utils.create_model
+    """
+
+    profile = profiler.current() is not None
+    return concurrent.futures.ProcessPoolExecutor(jobs, initializer=_init_worker,
+                                                  initargs=(engine, model, scorer, profile))
+
+
+def stop_pool(pool):
+    """Stop the worker processes of a pool of create_pool at once, abandoning their segments"""
+
+    # shutdown() alone would wait for the segments in progress
+    for process in list((pool._processes or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=True)
+
+
+def job_result(future):
+    """Result of a _transcribe_job submitted to a pool of create_pool, whose worker stage
+    timings are added to the profile of the run
+
+    Returns:
+        index, tokens, latency : see _transcribe_job
+
+    Raises:
+        RuntimeError : if the job failed, or a worker process died (killed, or out of memory)
+    """
+
+    try:
+        index, tokens, latency, stages = future.result()
+    except concurrent.futures.process.BrokenProcessPool as e:
+        raise RuntimeError("An inference worker process died, it was killed or ran out of memory") from e
+    profiler.add_stages(stages)
+    return index, tokens, latency
+
+
+def transcribe_segments(segments, jobs, engine, model, scorer, cache=None, pool=None, finished=None,
+                        on_done=None):
+    """Run inference on the segments in a pool of worker processes, each with its own model.
+    Segments are scheduled longest first, and the results are yielded in timeline order
+    as soon as every earlier segment is done.
+
+    Args:
+        segments : list of segmentAudio.Segment, in timeline order
+        jobs : number of worker processes
+        engine, model, scorer : see utils.create_model
+        cache : (opt) transcriptCache.TranscriptCache, only the misses are sent to the workers
+        pool : (opt) running worker pool (see create_pool) to reuse, instead of starting one
+        finished : (opt) tokens of the segments transcribed by an interrupted run, keyed by
+                   their (start, end) limits (see writeToFile.read_journal)
+        on_done : (opt) function called with (segment, tokens) as soon as a worker has
+                  transcribed a segment, before the earlier segments are done
+
+    Yields:
+        segment, tokens : see ds_transcribe
+    """
+
+    results = {}
+    if finished:
+        for i, segment in enumerate(segments):
+            if (segment.start, segment.end) in finished:
+                results[i] = finished[segment.start, segment.end]
+    if cache is not None:
+        for i, segment in enumerate(segments):
+            if i in results:
+                continue
+            start = time.perf_counter()
+            tokens = cache.get(segment.audio)
+            if tokens is not None:
+                results[i] = tokens
+                profiler.segment(segment.duration, time.perf_counter() - start, True)
+    order = sorted((i for i in range(len(segments)) if i not in results),
+                   key=lambda i: segments[i].end - segments[i].start, reverse=True)
+    work = iter(order)
+    next_index = 0
+
+    def ready():
+        nonlocal next_index
+        while next_index in results:
+            yield segments[next_index], results.pop(next_index)
+            next_index += 1
+
+    yield from ready()
+    if not order:
+        return
+    own_pool = pool is None
+    if own_pool:
+        pool = create_pool(jobs, engine, model, scorer)
+    try:
+        running = set()
+        while True:
+            # keep every worker busy, with one segment queued behind it
+            for i in work:
+                running.add(pool.submit(_transcribe_job, (i, np.asarray(segments[i].audio))))
+                if len(running) >= 2 * jobs:
+                    break
+            if not running:
+                break
+            done, running = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                index, tokens, latency = job_result(future)
+                profiler.segment(segments[index].duration, latency)
+                if cache is not None:
+                    cache.put(segments[index].audio, tokens)
+                if on_done is not None:
+                    on_done(segments[index], tokens)
+                results[index] = tokens
+                yield from ready()
+    finally:
+        if own_pool:
+            stop_pool(pool)
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import socket
+import contextlib
+from collections import deque
+
+import numpy as np
+
+# Local imports
+import logger
+from utils import create_model, remove_socket
+from inference import write_transcript
+from writeToFile import SubtitleWriter
+from segmentAudio import Segment
+from tokenTimeline import TokenTimeline
+
+_logger = logger.setup_applevel_logger(__name__)
+
+# Endpoint events, see EndpointDetector.process
+START, AUDIO, END = "start", "audio", "end"
+
+
+@contextlib.contextmanager
+def open_source(source):
+    """Open the raw PCM input of --live
+
+    Args:
+        source : "-" for stdin, "tcp://HOST:PORT" or "unix://PATH" to listen on a local
+                 socket and read from the first client that connects
+
+    Yields:
+        binary file object
+
+    Raises:
+        ValueError : for an unsupported source, or if something other than a socket is at
+                     the UNIX socket path
+    """
+
+    if source == "-":
+        yield sys.stdin.buffer
+        return
+
+    if source.startswith("tcp://"):
+        host, _, port = source[len("tcp://"):].rpartition(":")
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        address = (host or "127.0.0.1", int(port))
+    elif source.startswith("unix://"):
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        address = source[len("unix://"):]
+        remove_socket(address)
+    else:
+        raise ValueError(f"Unsupported live source: {source}")
+
+    try:
+        server.bind(address)
+        server.listen(1)
+        _logger.info(f"Waiting for audio on {source}")
+        connection, _ = server.accept()
+        with connection, connection.makefile("rb") as stream:
+            yield stream
+    finally:
+        server.close()
+        if server.family == socket.AF_UNIX:
+            remove_socket(address)
+
+
+def read_pcm(stream, block_size=1600):
+    """Read 16-bit little endian mono PCM as it arrives
+
+    Args:
+        stream : binary file object
+        block_size : maximum number of samples per block
+
+    Yields:
+        int16 sample blocks, as soon as any audio is available
+    """
+
+    read = getattr(stream, "read1", stream.read)
+    carry = b""
+    while True:
+        data = read(block_size * 2)
+        if not data:
+            return
+        data = carry + data
+        usable = len(data) - len(data) % 2
+        carry = data[usable:]
+        if usable:
+            yield np.frombuffer(data[:usable], dtype="<i2").astype(np.int16, copy=False)
+
+
+class EndpointDetector:
+    """Online speech endpoint detection on short frame energies. The noise floor follows the
+    quietest recent frames (falling quickly, rising slowly), and frames louder than the floor
+    by threshold_db are voiced. An utterance opens after onset_seconds of voiced frames and
+    closes after hangover_seconds without any, or when it reaches max_utterance_seconds.
+    """
+
+    def __init__(self, sampling_rate=16000, frame_seconds=0.02, threshold_db=9.0, min_energy_db=20.0,
+                 adapt_seconds=10.0, onset_seconds=0.06, hangover_seconds=0.5, padding_seconds=0.2,
+                 max_utterance_seconds=15.0):
+        self.frame_length = int(sampling_rate * frame_seconds)
+        self.threshold_db = threshold_db
+        self.min_energy_db = min_energy_db
+        self.rise = frame_seconds / adapt_seconds
+        self.onset_frames = max(1, int(round(onset_seconds / frame_seconds)))
+        self.hangover_frames = max(1, int(round(hangover_seconds / frame_seconds)))
+        self.max_frames = int(max_utterance_seconds / frame_seconds)
+
+        self.floor_db = None
+        self.pending = np.zeros(0, dtype=np.int16)
+        # sample offset of the next frame
+        self.position = 0
+        # frames before the utterance onset, fed to the recognizer when it opens
+        self.history = deque(maxlen=self.onset_frames + int(round(padding_seconds / frame_seconds)))
+        self.voiced_run = 0
+        self.in_speech = False
+        self.silent_run = 0
+        self.utterance_frames = 0
+        # sample offset of the end of the last voiced frame
+        self.speech_end = 0
+
+    def _energies(self, frames):
+        power = np.mean(np.square(frames, dtype=np.float64), axis=1)
+        return 10 * np.log10(power + 1e-10)
+
+    def process(self, block):
+        """Run the detector over a block of samples
+
+        Args:
+            block : int16 sample block
+
+        Returns:
+            events : list of (START, start_sample), (AUDIO, samples) and (END, end_sample) in
+                     stream order, consecutive utterance frames are merged into one AUDIO event
+        """
+
+        samples = np.concatenate((self.pending, block)) if len(self.pending) else block
+        n_frames = len(samples) // self.frame_length
+        frames = samples[:n_frames * self.frame_length].reshape(n_frames, self.frame_length)
+        self.pending = samples[n_frames * self.frame_length:].copy()
+
+        events = []
+        run = []
+
+        def flush_run():
+            if run:
+                events.append((AUDIO, np.concatenate(run)))
+                run.clear()
+
+        for frame, energy in zip(frames, self._energies(frames)):
+            if self.floor_db is None or energy < self.floor_db:
+                self.floor_db = energy if self.floor_db is None else self.floor_db + 0.5 * (energy - self.floor_db)
+            else:
+                self.floor_db += self.rise * (energy - self.floor_db)
+            voiced = energy > max(self.floor_db + self.threshold_db, self.min_energy_db)
+            self.voiced_run = self.voiced_run + 1 if voiced else 0
+            if voiced:
+                self.speech_end = self.position + self.frame_length
+
+            if not self.in_speech:
+                self.history.append(frame)
+                if self.voiced_run >= self.onset_frames:
+                    self.in_speech = True
+                    self.silent_run = 0
+                    self.utterance_frames = len(self.history)
+                    start = self.position + self.frame_length - len(self.history) * self.frame_length
+                    events.append((START, start))
+                    run.extend(self.history)
+                    self.history.clear()
+            else:
+                run.append(frame)
+                self.utterance_frames += 1
+                self.silent_run = 0 if voiced else self.silent_run + 1
+                if self.silent_run >= self.hangover_frames or self.utterance_frames >= self.max_frames:
+                    flush_run()
+                    events.append((END, self.position + self.frame_length))
+                    self.in_speech = False
+            self.position += self.frame_length
+
+        flush_run()
+        return events
+
+    def flush(self):
+        """Close the open utterance at the end of the stream
+
+        Returns:
+            events : see process
+        """
+
+        events = []
+        if self.in_speech:
+            if len(self.pending):
+                events.append((AUDIO, self.pending))
+            events.append((END, self.position + len(self.pending)))
+            self.in_speech = False
+        self.position += len(self.pending)
+        self.pending = np.zeros(0, dtype=np.int16)
+        return events
+
+
+def run_live(source, output_format, split_duration, engine, model, scorer, sampling_rate=16000,
+             partial_interval=1.0, output=None, **detector_args):
+    """Caption a live PCM feed: speech endpoints are detected online, every utterance is decoded
+    with a Coqui STT stream while it is spoken, and its cues are written as soon as it closes
+
+    Args:
+        source : see open_source
+        output_format : "srt" or "vtt"
+        split_duration : for long utterances, split the subtitle based on this number of seconds
+        engine, model, scorer : see utils.create_model
+        sampling_rate : sampling rate of the input PCM
+        partial_interval : seconds of utterance audio between logged partial transcripts
+        output : file object the cues are written to (default: stdout)
+        detector_args : passed to EndpointDetector
+
+    Returns:
+        latencies : per cue delay (in seconds) between receiving the last voiced audio of the
+                    utterance and writing its cue
+    """
+
+    if output is None:
+        output = sys.stdout
+    ds = create_model(engine, model, scorer)
+    if ds.sampleRate() != sampling_rate:
+        _logger.warn(f"Model expects {ds.sampleRate()} Hz audio, input is {sampling_rate} Hz")
+
+    writer = SubtitleWriter({output_format: output}, flush=True)
+
+    detector = EndpointDetector(sampling_rate, **detector_args)
+    partial_samples = int(partial_interval * sampling_rate)
+    line_count = 1
+    latencies = []
+    stream = None
+    start = 0
+    fed = 0
+    last_partial = 0
+
+    # (stream position after the block, time it was received) of the blocks of the utterance
+    arrivals = deque()
+
+    def close_utterance(end):
+        nonlocal stream, line_count
+        tokens = TokenTimeline.from_metadata(stream.finishStreamWithMetadata())
+        stream = None
+        segment = Segment(start, end, sampling_rate, None)
+        next_line = write_transcript(tokens, segment, writer, split_duration, line_count)
+        if next_line > line_count:
+            received = next((t for position, t in arrivals if position >= detector.speech_end), arrivals[-1][1])
+            latency = time.perf_counter() - received
+            latencies.append(latency)
+            _logger.info(f"Cue {line_count} [{segment.start_time:.2f}s - {segment.end_time:.2f}s] "
+                         f"latency {latency * 1000:.0f} ms")
+        line_count = next_line
+
+    with open_source(source) as pcm:
+        blocks = read_pcm(pcm)
+        position = 0
+        while True:
+            block = next(blocks, None)
+            if block is not None:
+                position += len(block)
+            arrivals.append((position, time.perf_counter()))
+            events = detector.flush() if block is None else detector.process(block)
+            for event, value in events:
+                if event == START:
+                    stream = ds.createStream()
+                    start, fed, last_partial = value, 0, 0
+                elif event == AUDIO:
+                    stream.feedAudioContent(value)
+                    fed += len(value)
+                    if fed - last_partial >= partial_samples:
+                        last_partial = fed
+                        text = TokenTimeline.from_metadata(stream.intermediateDecodeWithMetadata()).chars
+                        _logger.info(f"Partial [{start / sampling_rate:.2f}s]: {text}")
+                else:
+                    close_utterance(value)
+            if stream is None:
+                arrivals.clear()
+            if block is None:
+                break
+
+    if latencies:
+        _logger.info(f"{len(latencies)} captioned utterances, latency mean {np.mean(latencies) * 1000:.0f} ms, "
+                     f"max {np.max(latencies) * 1000:.0f} ms")
+    return latencies
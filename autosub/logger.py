@@ -2,12 +2,14 @@ import sys
 import logging
 
 APP_NAME = "AutoSub"
+# Stream the application loggers write to, see log_to_stderr
+_log_stream = sys.stdout
 
 def setup_applevel_logger(logger_name = APP_NAME, file_name=None): 
     logger = logging.getLogger(logger_name)
     logger.setLevel(logging.INFO)
     formatter = logging.Formatter("[%(levelname)s] %(message)s") #%(name)s |
-    sh = logging.StreamHandler(sys.stdout)
+    sh = logging.StreamHandler(_log_stream)
     sh.setFormatter(formatter)
     logger.handlers.clear()
     logger.addHandler(sh)
@@ -17,5 +19,16 @@ def setup_applevel_logger(logger_name = APP_NAME, file_name=None):
         logger.addHandler(fh)
     return logger
 
+def log_to_stderr():
+    """Move every application logger to stderr, keeping stdout free for subtitles"""
+    global _log_stream
+    _log_stream = sys.stderr
+    for logger in logging.Logger.manager.loggerDict.values():
+        if not isinstance(logger, logging.Logger):
+            continue
+        for handler in logger.handlers:
+            if type(handler) is logging.StreamHandler and handler.stream is sys.stdout:
+                handler.setStream(sys.stderr)
+
 def get_logger(module_name):    
    return logging.getLogger(APP_NAME).getChild(module_name)
\ No newline at end of file
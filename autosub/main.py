@@ -4,83 +4,321 @@
 import os
 import re
 import sys
-import wave
+import signal
+import sqlite3
 import argparse
+import multiprocessing
 
 import numpy as np
-from tqdm import tqdm
 
 # Local imports
 import logger
+import profiler
 from utils import *
-from writeToFile import write_to_file
-from audioProcessing import extract_audio
-from segmentAudio import remove_silent_segments
+from inference import ds_process_audio, stream_process_audio, write_transcript, transcribe_segments, create_pool, stop_pool
+from audioProcessing import extract_audio, stream_audio, probe_duration
+from segmentAudio import remove_silent_segments, segment_audio_stream, read_audio_file, Segment, VAD_ENGINES
+from pipeline import run_pipeline
+from live import run_live
+from featureExtraction import FEATURE_PROFILES
+from transcriptCache import TranscriptCache, DEFAULT_CACHE_FILE, model_identity
+from batch import collect_inputs, unique_prefixes, run_batch
+from writeToFile import SubtitleFiles, journal_file, read_journal
+from sharding import plan_shards, ShardWriter, shard_file, write_shard, find_shards, merge_shards
 
 _logger = logger.setup_applevel_logger(__name__)
 
-# Line count for SRT file
-line_count = 1
 
+def run_header(args, input_file, ds_model, ds_scorer):
+    """Identify the input file and the settings its segments and tokens depend on, so that
+    the journal of a run is only resumed by the same run"""
 
-def ds_process_audio(ds, audio_file, output_file_handle_dict, split_duration):
-    """sttWithMetadata() will run DeepSpeech inference on each audio file 
-    generated after remove_silent_segments. These files contain start and end 
-    timings in their title which we use in srt file. 
+    stat = os.stat(input_file)
+    return {"input": os.path.abspath(input_file), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            "model": model_identity(ds_model, ds_scorer).hex(), "vad": args.vad,
+            "feature_profile": args.feature_profile, "stream": args.stream, "pipe": args.pipe,
+            "pipeline": args.pipeline, "vad_window": args.vad_window if args.pipeline else None,
+            "max_segment_seconds": args.max_segment_seconds}
+
+
+def load_progress(journal, header):
+    """Progress of an interrupted run from its journal, None if there is none or if it was
+    written by a run of another input or with other settings"""
+
+    if not os.path.isfile(journal):
+        return None
+    try:
+        progress = read_journal(journal)
+    except (OSError, ValueError) as e:
+        _logger.warn(f"Can't resume from {journal}, starting over: {e}")
+        return None
+    if progress.header != header:
+        _logger.warn(f"{journal} was written for another input file or other settings, starting over")
+        return None
+    return progress
+
+
+def resumed_segments(args, input_file, audio_file_name, progress):
+    """Segments of an interrupted run, rebuilt from the limits in its journal. The audio is
+    only extracted again if some of them are still to be transcribed."""
+
+    sampling_rate = progress.sampling_rate
+    if all(limits in progress.tokens for limits in progress.segments):
+        return [Segment(start, end, sampling_rate, None) for start, end in progress.segments]
+    if args.pipe:
+        try:
+            blocks = list(stream_audio(input_file, sampling_rate))
+        except RuntimeError as e:
+            _logger.error(str(e))
+            sys.exit(1)
+        signal = np.concatenate(blocks) if blocks else np.zeros(0, np.int16)
+    else:
+        extract_audio(input_file, audio_file_name)
+        _, signal = read_audio_file(audio_file_name)
+    return [Segment(start, end, sampling_rate, signal[start:end]) for start, end in progress.segments]
+
+
+def transcribe_file(args, input_file, audio_file_name, video_prefix, ds_model, ds_scorer, writer, cache=None,
+                    ds=None, pool=None, progress=None, window=None):
+    """Extract, segment and transcribe the input file one stage after the other, reusing
+    the model ds (or the worker pool with --jobs) when given, and the segments and tokens
+    journaled by an interrupted run (progress). Only the (start, duration) window of the
+    input in seconds is transcribed when given."""
+
+    start, duration = window if window is not None else (None, None)
+
+    segment_prefix = None
+    if args.keep_segments:
+        segment_directory = os.path.join(args.output_dir, "segments")
+        os.makedirs(segment_directory, exist_ok=True)
+        segment_prefix = os.path.join(segment_directory, video_prefix)
+
+    if progress is not None and progress.segments is not None:
+        _logger.info("Reusing the silent parts found by the interrupted run")
+        segments = resumed_segments(args, input_file, audio_file_name, progress)
+    elif args.pipe:
+        _logger.info("Splitting on silent parts while decoding audio")
+        try:
+            with profiler.stage("segmentation"):
+                segments = segment_audio_stream(stream_audio(input_file, start=start, duration=duration), 16000, profile=args.feature_profile,
+                                                file_prefix=segment_prefix, vad=args.vad,
+                                                max_segment_seconds=args.max_segment_seconds)
+        except RuntimeError as e:
+            _logger.error(str(e))
+            sys.exit(1)
+    else:
+        extract_audio(input_file, audio_file_name, start, duration)
+
+        _logger.info("Splitting on silent parts in audio file")
+        with profiler.stage("segmentation"):
+            segments = remove_silent_segments(audio_file_name, profile=args.feature_profile, streaming=args.stream,
+                                              file_prefix=segment_prefix, vad=args.vad,
+                                              max_segment_seconds=args.max_segment_seconds)
+    if progress is None or progress.segments is None:
+        writer.record_segments(segments)
+
+    finished = progress.tokens if progress is not None else {}
+    from tqdm import tqdm
+
+    _logger.info("Running inference...")
+    line_count = 1
+    if args.jobs > 1:
+        try:
+            for segment, tokens in tqdm(transcribe_segments(segments, args.jobs, args.engine, ds_model, ds_scorer,
+                                                            cache, pool, finished, writer.record_tokens),
+                                        total=len(segments)):
+                with profiler.stage("writing"):
+                    line_count = write_transcript(tokens, segment, writer, args.split_duration, line_count)
+        except RuntimeError as e:
+            _logger.error(str(e))
+            sys.exit(1)
+    else:
+        for segment in tqdm(segments):
+            tokens = finished.get((segment.start, segment.end))
+            if tokens is not None:
+                with profiler.stage("writing"):
+                    line_count = write_transcript(tokens, segment, writer, args.split_duration, line_count)
+                continue
+            if ds is None:
+                ds = create_model(args.engine, ds_model, ds_scorer)
+            if args.stream_inference:
+                line_count = stream_process_audio(ds, segment, writer, args.split_duration, args.stream_inference,
+                                                  line_count, cache)
+            else:
+                line_count = ds_process_audio(ds, segment, writer, args.split_duration, line_count, cache)
+
+
+def open_cache(args, ds_model, ds_scorer):
+    """TranscriptCache of --cache, None if it is disabled or can't be opened"""
+
+    if args.cache is None:
+        return None
+    try:
+        return TranscriptCache(args.cache, ds_model, ds_scorer, int(args.cache_size * 1024 ** 2))
+    except (sqlite3.Error, OSError) as e:
+        _logger.warn(f"Transcript cache disabled, can't open {args.cache}: {e}")
+        return None
+
+
+def transcribe_shard(args, input_file, video_prefix, audio_directory, ds_model, ds_scorer, index, count, directory,
+                     cache=None, ds=None, pool=None):
+    """Transcribe window index of count of the input file (see sharding.plan_shards) and
+    save its transcript in directory, for merge_shard_files"""
+
+    duration = probe_duration(input_file)
+    if duration is None:
+        _logger.error(f"Can't shard {input_file}, FFPROBE can't find its duration")
+        sys.exit(1)
+    start, end = plan_shards(duration, count, args.shard_overlap)[index - 1]
+    _logger.info(f"Shard {index} of {count} of {input_file}: {start:.1f}s to {end:.1f}s")
+    sampling_rate = 16000
+    writer = ShardWriter(index, count, (int(round(start * sampling_rate)), int(round(end * sampling_rate))),
+                         sampling_rate)
+    audio_file_name = os.path.join(audio_directory, f"{video_prefix}.shard-{index}.wav")
+    transcribe_file(args, input_file, audio_file_name, video_prefix, ds_model, ds_scorer, writer, cache, ds, pool,
+                    window=(start, end - start))
+    os.makedirs(directory, exist_ok=True)
+    path = shard_file(directory, video_prefix, index, count)
+    write_shard(path, writer.transcript())
+    _logger.info(f"Shard transcript saved to {path}")
+
+
+def _shard_process(args, input_file, video_prefix, audio_directory, ds_model, ds_scorer, index):
+    """Local process standing in for a machine running --shard index/--shards"""
+
+    cache = open_cache(args, ds_model, ds_scorer)
+    try:
+        transcribe_shard(args, input_file, video_prefix, audio_directory, ds_model, ds_scorer, index, args.shards,
+                         audio_directory, cache)
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def run_local_shards(args, input_file, video_prefix, audio_directory, ds_model, ds_scorer):
+    """Transcribe the --shards windows of the input file in as many local processes, each
+    loading its own model, and leave their transcripts in the scratch directory"""
+
+    processes = [multiprocessing.Process(target=_shard_process, name=f"shard-{index}",
+                                         args=(args, input_file, video_prefix, audio_directory, ds_model, ds_scorer,
+                                               index))
+                 for index in range(1, args.shards + 1)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+                process.join()
+    failed = [index for index, process in enumerate(processes, 1) if process.exitcode != 0]
+    if failed:
+        _logger.error(f"Shards {failed} of {args.shards} of {input_file} failed")
+        sys.exit(1)
+
+
+def merge_shard_files(args, input_file, video_prefix, directory, ds_model, ds_scorer):
+    """Write the subtitles of the input file from the transcripts of its shards in directory,
+    numbering the subtitle lines of the whole input"""
+
+    try:
+        shards = find_shards(directory, video_prefix)
+    except (OSError, ValueError) as e:
+        _logger.error(f"Can't merge the shards of {input_file}: {e}")
+        sys.exit(1)
+    _logger.info(f"Merging {len(shards)} shards of {input_file}")
+    writer = SubtitleFiles(args.output_dir, video_prefix, args.format,
+                           header=run_header(args, input_file, ds_model, ds_scorer))
+    try:
+        line_count = 1
+        with profiler.stage("writing"):
+            for segment, tokens in merge_shards(shards):
+                line_count = write_transcript(tokens, segment, writer, args.split_duration, line_count)
+    except BaseException:
+        writer.close(commit=False)
+        raise
+    with profiler.stage("writing"):
+        writer.close()
+
+
+def process_file(args, input_file, video_prefix, audio_directory, ds_model, ds_scorer, cache=None, ds=None,
+                 pool=None):
+    """Write the subtitles of one input file to the output directory
 
     Args:
-        ds : DeepSpeech Model
-        audio_file : audio file
-        output_file_handle_dict : Mapping of subtitle format (eg, 'srt') to open file_handle
-        split_duration: for long audio segments, split the subtitle based on this number of seconds
+        args : parsed command line arguments
+        input_file : input video file
+        video_prefix : name of the subtitle files, without extension
+        audio_directory : scratch directory the audio is extracted to
+        ds_model, ds_scorer : model and scorer files
+        cache : (opt) transcriptCache.TranscriptCache
+        ds : (opt) loaded model to reuse
+        pool : (opt) running worker pool to reuse with --jobs (see inference.create_pool)
     """
 
-    global line_count
-    fin = wave.open(audio_file, 'rb')
-    audio = np.frombuffer(fin.readframes(fin.getnframes()), np.int16)
-    fin.close()
-
-    metadata = ds.sttWithMetadata(audio)
-    limits = audio_file.split(os.sep)[-1][:-4].split("_")[-1].split("-")
-
-    # Run-on sentences are inferred as a single block, so write the sentence out as multiple separate lines
-    # based on a user-provided split duration.
-    current_token_index = 0
-    split_start_index = 0
-    previous_end_time = 0
-    # timestamps of word boundaries
-    cues = [float(limits[0])]
-    num_tokens = len(metadata.transcripts[0].tokens)
-    # Walk over each character in the current audio segment's inferred text
-    while current_token_index < num_tokens:
-        token = metadata.transcripts[0].tokens[current_token_index]
-        # If at a word boundary, get the timestamp for VTT cue data
-        if token.text == " ":
-            cues += [float(limits[0]) + token.start_time]
-        # time duration is exceeded and at the next word boundary
-        needs_split = ((token.start_time - previous_end_time) > split_duration) and token.text == " "
-        is_final_character = current_token_index + 1 == num_tokens
-        # Write out the line
-        if needs_split or is_final_character:
-            # Determine the timestamps
-            split_limits = [float(limits[0]) + previous_end_time, float(limits[0]) + token.start_time]
-            # Convert character list to string. Upper bound has plus 1 as python list slices are [inclusive, exclusive]
-            split_inferred_text = ''.join(
-                [x.text for x in metadata.transcripts[0].tokens[split_start_index:current_token_index + 1]])
-            write_to_file(output_file_handle_dict, split_inferred_text, line_count, split_limits, cues)
-            # Reset and update indexes for the next subtitle split
-            previous_end_time = token.start_time
-            split_start_index = current_token_index + 1
-            cues = [float(limits[0])]
-            line_count += 1
-        current_token_index += 1
-
-    if "txt" in output_file_handle_dict.keys():
-        output_file_handle_dict["txt"].write("\n\n")
+    if args.shard is not None:
+        index, count = args.shard
+        transcribe_shard(args, input_file, video_prefix, audio_directory, ds_model, ds_scorer, index, count,
+                         args.output_dir, cache, ds, pool)
+        return
+    if args.shards is not None:
+        run_local_shards(args, input_file, video_prefix, audio_directory, ds_model, ds_scorer)
+        merge_shard_files(args, input_file, video_prefix, audio_directory, ds_model, ds_scorer)
+        return
+    if args.merge_shards:
+        merge_shard_files(args, input_file, video_prefix, args.output_dir, ds_model, ds_scorer)
+        return
+
+    audio_file_name = os.path.join(audio_directory, video_prefix + ".wav")
+    journal = journal_file(args.output_dir, video_prefix)
+    header = run_header(args, input_file, ds_model, ds_scorer)
+    progress = None
+    if args.resume:
+        progress = load_progress(journal, header)
+        if progress is None and not os.path.isfile(journal) and all(
+                os.path.isfile(os.path.join(args.output_dir, f"{video_prefix}.{format}")) for format in args.format):
+            _logger.info(f"{input_file} is already transcribed, skipping")
+            return
+        if progress is not None:
+            _logger.info(f"Resuming from {journal}, {len(progress.tokens)} segments already transcribed")
+    elif os.path.isfile(journal):
+        _logger.info(f"Starting over, the progress of an interrupted run in {journal} is discarded (see --resume)")
+    writer = SubtitleFiles(args.output_dir, video_prefix, args.format, header=header, progress=progress)
+    finished = progress.tokens if progress is not None else {}
+
+    try:
+        if args.pipeline:
+            _logger.info("Running overlapped decoding, silence detection and inference...")
+            try:
+                run_pipeline(input_file, writer, args.split_duration, args.engine, ds_model, ds_scorer,
+                             jobs=args.jobs, profile=args.feature_profile, window_seconds=args.vad_window,
+                             vad=args.vad, max_segment_seconds=args.max_segment_seconds, cache=cache, ds=ds,
+                             pool=pool, finished=finished)
+            except RuntimeError as e:
+                _logger.error(str(e))
+                sys.exit(1)
+        else:
+            transcribe_file(args, input_file, audio_file_name, video_prefix, ds_model, ds_scorer, writer, cache, ds,
+                            pool, progress)
+    except BaseException:
+        writer.close(commit=False)
+        raise
+    with profiler.stage("writing"):
+        writer.close()
+
+
+def shard_spec(value):
+    """Parse the K/N argument of --shard"""
+
+    match = re.fullmatch(r"(\d+)/(\d+)", value)
+    if match is None or not 1 <= int(match.group(1)) <= int(match.group(2)):
+        raise argparse.ArgumentTypeError(f"expected K/N with 1 <= K <= N, got {value}")
+    return int(match.group(1)), int(match.group(2))
 
 
 def main():
-    global line_count
     supported_output_formats = ["srt", "vtt", "txt"]
     supported_engines = ["stt"]
 
@@ -93,22 +331,136 @@ def main():
     parser.add_argument("--dry-run", dest="dry_run", action="store_true",
                         help="Perform dry-run to verify options prior to running. Also useful to instantiate \
                             cuda/tensorflow cache prior to running multiple times")
+    parser.add_argument("--vad", choices=list(VAD_ENGINES), default="svm",
+                        help="Silence detection engine: svm trains a classifier on each file, energy (energy and \
+                            zero crossing rate) and flux (spectral change) are much faster on clean audio (default: svm)")
+    parser.add_argument("--feature-profile", dest="feature_profile", choices=list(FEATURE_PROFILES), default="full",
+                        help="Features used by the svm engine to detect silent parts. Smaller profiles are faster \
+                            (default: full)")
+    parser.add_argument("--max-segment-seconds", dest="max_segment_seconds", type=float,
+                        help="Split speech segments longer than this at their quietest frames, so that no single \
+                            inference call gets very slow or memory hungry (default: no limit)")
+    parser.add_argument("--stream-inference", dest="stream_inference", type=float, metavar="SECONDS",
+                        help="Decode speech segments longer than SECONDS in chunks of SECONDS through the STT stream \
+                            API, writing the subtitles of their start while the rest is still being decoded")
+    parser.add_argument("--stream", dest="stream", action="store_true",
+                        help="Find silent parts reading the audio in blocks, with bounded memory for very long files")
+    parser.add_argument("--pipe", dest="pipe", action="store_true",
+                        help="Read the audio from FFMPEG's output while it is decoded, without writing a WAV file")
+    parser.add_argument("--pipeline", dest="pipeline", action="store_true",
+                        help="Overlap decoding, silence detection, inference and writing, so subtitles start appearing \
+                            while the file is still being decoded")
+    parser.add_argument("--vad-window", dest="vad_window", type=float, default=300,
+                        help="With --pipeline, length in seconds of the windows silence is detected on (default: 300)")
+    parser.add_argument("--keep-segments", dest="keep_segments", action="store_true",
+                        help="Also write every speech segment to a WAV file in the segments/ subdirectory of the \
+                            output directory, for debugging")
+    parser.add_argument("--output-dir", dest="output_dir", default=os.path.join(os.getcwd(), "output"),
+                        help="Directory the subtitle files are written to (default: output/ in the current directory)")
+    parser.add_argument("--tmp-dir", dest="tmp_dir",
+                        help="Directory for the private scratch space of the run (eg, a tmpfs mount), which is \
+                            deleted on exit (default: the system temp directory, see TMPDIR)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue the interrupted run of an input from the journal in the output directory, \
+                            skipping the segments it already transcribed. Inputs whose subtitles are complete are \
+                            skipped")
+    parser.add_argument("--live", nargs="?", const="-", metavar="SOURCE",
+                        help="Caption 16 kHz mono 16-bit PCM as it arrives, from stdin (default) or from a client \
+                            of a local socket given as tcp://HOST:PORT or unix://PATH. Cues are written to stdout")
+    parser.add_argument("--serve", metavar="ADDRESS",
+                        help="Run as a transcription service on HOST:PORT or unix://PATH, keeping models loaded \
+                            between jobs (see autosub/server.py for the HTTP API)")
+    parser.add_argument("--server-models", dest="server_models", type=int, default=1,
+                        help="With --serve, number of models kept loaded (default: 1)")
+    parser.add_argument("--server-concurrency", dest="server_concurrency", type=int,
+                        help="With --serve, number of jobs run at once (default: one per model)")
+    parser.add_argument("--server-queue", dest="server_queue", type=int, default=100,
+                        help="With --serve, number of waiting jobs before new ones are refused (default: 100)")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of worker processes running inference, each loads its own model (default: 1)")
+    parser.add_argument("--shards", type=int, metavar="N",
+                        help="Cut every input into N time windows, transcribe them in N local processes and merge \
+                            their transcripts. Silence is detected in each window on its own, so the subtitles can \
+                            differ from an unsharded run, most with the default svm VAD. Use --vad energy to stay \
+                            closest to it")
+    parser.add_argument("--shard", type=shard_spec, metavar="K/N",
+                        help="Only transcribe window K of N of every input, and save its transcript to the output \
+                            directory as <name>.shard-K-of-N.json. Run every shard, on one machine each, then \
+                            --merge-shards")
+    parser.add_argument("--merge-shards", dest="merge_shards", action="store_true",
+                        help="Write the subtitles of every input from the shard transcripts in the output directory")
+    parser.add_argument("--shard-overlap", dest="shard_overlap", type=float, default=10,
+                        help="Seconds of audio shared by neighbouring shards, so that speech at the cuts is \
+                            transcribed whole (default: 10)")
+    parser.add_argument("--cache", nargs="?", const=DEFAULT_CACHE_FILE, metavar="FILE",
+                        help=f"Reuse the transcripts of segments with identical audio from an SQLite cache file \
+                            (default file: {DEFAULT_CACHE_FILE})")
+    parser.add_argument("--cache-size", dest="cache_size", type=float, default=512,
+                        help="Size limit of the transcript cache in MB, least recently used entries are evicted \
+                            (default: 512)")
+    parser.add_argument("--profile", metavar="REPORT",
+                        help="Write a JSON report of the run to this file: wall and CPU time of each stage, latency \
+                            of every segment and real-time factor")
+    parser.add_argument("--cprofile", metavar="FILE",
+                        help="Also run under cProfile and dump its stats to this file, for pstats or snakeviz")
     parser.add_argument("--engine", choices=supported_engines, nargs="?", default="stt",
                         help="Select Coqui STT for inference. Latter is default")
     parser.add_argument("--file", required=False, help="Input video file")
+    parser.add_argument("--files", nargs="+", metavar="FILE",
+                        help="Transcribe several input files in one run, loading the model only once")
+    parser.add_argument("--input-dir", dest="input_dir",
+                        help="Transcribe every file in this directory and its subdirectories")
+    parser.add_argument("--manifest",
+                        help="Transcribe the files listed in this text file, one path per line")
     parser.add_argument("--model", required=False, default="coqui-v1.0.0-english-huge-vocabulary.tflite",
                         help="Input *.pbmm or *.tflite model file (default: coqui-v1.0.0-english-huge-vocabulary.tflite)")
     parser.add_argument("--scorer", required=False, default="coqui-v1.0.0-english-huge-vocabulary.scorer",
                         help="Input *.scorer file (default: coqui-v1.0.0-english-huge-vocabulary.scorer)")
     
     args = parser.parse_args()
-    
+    if args.profile is not None:
+        profiler.enable()
+    if args.live is not None:
+        # stdout carries the subtitles
+        logger.log_to_stderr()
+
     #print(sys.argv[0:])
     _logger.info(f"ARGS: {args}")
 
     ds_model = get_model(args, "model")
     ds_scorer = get_model(args, "scorer")
 
+    if args.max_segment_seconds is not None and args.max_segment_seconds <= 0:
+        _logger.error("--max-segment-seconds must be positive")
+        sys.exit(1)
+    sharding = [option for option, value in (("--shards", args.shards is not None),
+                                             ("--shard", args.shard is not None),
+                                             ("--merge-shards", args.merge_shards)) if value]
+    if len(sharding) > 1:
+        _logger.error(f"Choose one of {' or '.join(sharding)}")
+        sys.exit(1)
+    if sharding:
+        if args.shards is not None and args.shards < 1:
+            _logger.error("--shards must be at least 1")
+            sys.exit(1)
+        if args.shard_overlap < 0:
+            _logger.error("--shard-overlap can't be negative")
+            sys.exit(1)
+        if args.pipeline or args.resume:
+            _logger.error(f"{sharding[0]} can't be combined with --pipeline or --resume")
+            sys.exit(1)
+        if args.vad == "svm" and not args.merge_shards:
+            _logger.warn("The svm VAD is trained on each shard's window, so the subtitles can differ from an "
+                         "unsharded run. --vad energy stays closest to it")
+    if args.stream_inference is not None:
+        if args.stream_inference <= 0:
+            _logger.error("--stream-inference must be positive")
+            sys.exit(1)
+        if args.jobs > 1 or args.pipeline:
+            _logger.error("--stream-inference decodes one segment at a time, it can't be combined with --jobs "
+                          "or --pipeline")
+            sys.exit(1)
+
     if args.dry_run:
         create_model(args.engine, ds_model, ds_scorer) 
         if args.file is not None:
@@ -116,7 +468,47 @@ def main():
                 _logger.warn(f"Invalid file: {args.file}")
         sys.exit(0)
 
-    if args.file is not None:
+    if args.live is not None:
+        live_formats = [format for format in args.format if format != "txt"]
+        if len(live_formats) != 1:
+            _logger.error("--live writes a single subtitle format to stdout, choose one of --format srt or vtt")
+            sys.exit(1)
+        try:
+            run_live(args.live, live_formats[0], args.split_duration, args.engine, ds_model, ds_scorer)
+        except (OSError, ValueError) as e:
+            _logger.error(f"Live captioning failed: {e}")
+            sys.exit(1)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    if args.serve is not None:
+        # the HTTP server modules are only needed by --serve
+        from server import TranscriptionService, run_server
+
+        cache = open_cache(args, ds_model, ds_scorer)
+        service = TranscriptionService(lambda: create_model(args.engine, ds_model, ds_scorer), args.server_models,
+                                       args.server_concurrency, args.server_queue, profile=args.feature_profile,
+                                       vad=args.vad, max_segment_seconds=args.max_segment_seconds, cache=cache)
+        try:
+            run_server(args.serve, service)
+        except (OSError, ValueError) as e:
+            _logger.error(f"Can't serve on {args.serve}: {e}")
+            sys.exit(1)
+        sys.exit(0)
+
+    if args.pipe and args.stream:
+        _logger.error("--stream reads the extracted WAV several times and can't be combined with --pipe")
+        sys.exit(1)
+
+    batch = args.files or args.input_dir or args.manifest
+    if batch:
+        inputs = collect_inputs(([args.file] if args.file else []) + (args.files or []), args.input_dir,
+                                args.manifest)
+        if not inputs:
+            _logger.error("No input files found")
+            sys.exit(1)
+    elif args.file is not None:
         if os.path.isfile(args.file):
             input_file = args.file
             _logger.info(f"Input file: {args.file}")
@@ -124,49 +516,70 @@ def main():
             _logger.error(f"Invalid file: {args.file}")
             sys.exit(1)
     else:
-        _logger.error("One or more of --file or --dry-run are required")
+        _logger.error("One or more of --file, --files, --input-dir, --manifest or --dry-run are required")
         sys.exit(1)
 
-    base_directory = os.getcwd()
-    output_directory = os.path.join(base_directory, "output")
-    audio_directory = os.path.join(base_directory, "audio")
-    video_prefix = os.path.splitext(os.path.basename(input_file))[0]
-    audio_file_name = os.path.join(audio_directory, video_prefix + ".wav")
-    
-    os.makedirs(output_directory, exist_ok=True)
-    os.makedirs(audio_directory, exist_ok=True)
-    output_file_handle_dict = {}
-
-    for format in args.format:
-        output_filename = os.path.join(output_directory, video_prefix + "." + format)
-        # print("Creating file: " + output_filename)
-        output_file_handle_dict[format] = open(output_filename, "w")
-        # For VTT format, write header
-        if format == "vtt":
-            output_file_handle_dict[format].write("WEBVTT\n")
-            output_file_handle_dict[format].write("Kind: captions\n\n")
+    cache = open_cache(args, ds_model, ds_scorer)
 
-    clean_folder(audio_directory)
-    extract_audio(input_file, audio_file_name)
+    # exit through SystemExit on SIGTERM, so the scratch directory is removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    with profiler.cprofile(args.cprofile), scratch_directory(args.tmp_dir) as audio_directory:
+        if batch:
+            # the model (or the worker pool) is loaded once and reused for every input
+            ds, pool = None, None
+            if args.shards is not None or args.merge_shards:
+                # local shard processes load their own model, merging needs none
+                pass
+            elif args.jobs > 1:
+                pool = create_pool(args.jobs, args.engine, ds_model, ds_scorer)
+            else:
+                ds = create_model(args.engine, ds_model, ds_scorer)
+            prefixes = unique_prefixes(inputs)
 
-    _logger.info("Splitting on silent parts in audio file")
-    remove_silent_segments(audio_file_name)
+            def process(input_file):
+                nonlocal pool
+                audio_file_name = os.path.join(audio_directory, prefixes[input_file] + ".wav")
+                try:
+                    process_file(args, input_file, prefixes[input_file], audio_directory, ds_model, ds_scorer,
+                                 cache, ds, pool)
+                except (Exception, SystemExit):
+                    if pool is not None:
+                        # a worker may have died on this input, which breaks the pool for the next ones
+                        stop_pool(pool)
+                        pool = create_pool(args.jobs, args.engine, ds_model, ds_scorer)
+                    raise
+                finally:
+                    # don't let extracted audio pile up over thousands of inputs
+                    if os.path.isfile(audio_file_name):
+                        os.remove(audio_file_name)
 
-    audiofiles = [file for file in os.listdir(audio_directory) if file.startswith(video_prefix)]
-    audiofiles = sort_alphanumeric(audiofiles)
-    audiofiles.remove(os.path.basename(audio_file_name))
-
-    _logger.info("Running inference...")
-    ds = create_model(args.engine, ds_model, ds_scorer) 
-
-    for filename in tqdm(audiofiles):
-        audio_segment_path = os.path.join(audio_directory, filename)
-        ds_process_audio(ds, audio_segment_path, output_file_handle_dict, split_duration=args.split_duration)
+            try:
+                results = run_batch(inputs, process)
+            finally:
+                if pool is not None:
+                    stop_pool(pool)
+        else:
+            video_prefix = os.path.splitext(os.path.basename(input_file))[0]
+            process_file(args, input_file, video_prefix, audio_directory, ds_model, ds_scorer, cache)
 
-    for format in output_file_handle_dict:
-        file_handle = output_file_handle_dict[format]
-        _logger.info(f"{format.upper()}, file saved to, {file_handle.name}")
-        file_handle.close()
+    if cache is not None:
+        _logger.info(cache.summary())
+        cache.close()
+    if args.profile is not None:
+        run_profile = profiler.current()
+        if batch:
+            for result in results:
+                if result.ok:
+                    run_profile.add_input(result.input_file, result.duration)
+        else:
+            run_profile.add_input(input_file, probe_duration(input_file))
+        try:
+            run_profile.write(args.profile)
+            _logger.info(f"Run profile saved to {args.profile}")
+        except OSError as e:
+            _logger.warn(f"Can't write the run profile to {args.profile}: {e}")
+    if batch and not all(result.ok for result in results):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import queue
+import threading
+
+# Local imports
+import logger
+import profiler
+from utils import create_model
+from audioProcessing import stream_audio
+from segmentAudio import stream_segments
+from tokenTimeline import TokenTimeline
+from inference import transcribe_segment, write_transcript, create_pool, stop_pool, job_result, _transcribe_job
+
+_logger = logger.setup_applevel_logger(__name__)
+
+# End of stream marker passed down the queues
+_DONE = object()
+
+
+class _Stopped(Exception):
+    """Raised in a stage when another stage failed"""
+
+
+def _put(out_queue, item, stop):
+    """Put with back-pressure, giving up when the pipeline is stopped"""
+
+    while not stop.is_set():
+        try:
+            out_queue.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+    raise _Stopped()
+
+
+def _drain(in_queue, stop):
+    """Yield the items of a queue until the end of stream marker, or until the
+    pipeline is stopped, as the marker may be discarded then"""
+
+    while not stop.is_set():
+        try:
+            item = in_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        yield item
+
+
+def _stage(name, items, out_queue, stop, errors):
+    """Thread body: push items to out_queue, always ending with _DONE"""
+
+    try:
+        for item in items:
+            _put(out_queue, item, stop)
+    except _Stopped:
+        pass
+    except BaseException as e:
+        errors.append((name, e))
+        stop.set()
+    finally:
+        # stops FFMPEG if the decode stage ends early
+        items.close()
+        while True:
+            try:
+                out_queue.put(_DONE, timeout=0.1)
+                break
+            except queue.Full:
+                # nobody reads anymore once stopped, make room for the marker
+                if stop.is_set():
+                    try:
+                        out_queue.get_nowait()
+                    except queue.Empty:
+                        pass
+
+
+def _transcribed(segments, engine, model, scorer, pool, cache, ds, finished):
+    """Inference stage: yields (segment, tokens), or (segment, Future) for the segments
+    sent to a worker pool"""
+
+    if pool is not None:
+        for segment in segments:
+            if (segment.start, segment.end) in finished:
+                yield segment, finished[segment.start, segment.end]
+                continue
+            start = time.perf_counter()
+            tokens = cache.get(segment.audio) if cache is not None else None
+            if tokens is not None:
+                profiler.segment(segment.duration, time.perf_counter() - start, True)
+            else:
+                tokens = pool.submit(_transcribe_job, (segment.start, segment.audio))
+            yield segment, tokens
+        return
+    if ds is None:
+        # loads while the decode and segmentation stages are already running
+        ds = create_model(engine, model, scorer)
+    for segment in segments:
+        tokens = finished.get((segment.start, segment.end))
+        if tokens is None:
+            tokens = transcribe_segment(ds, segment, cache)
+        yield segment, tokens
+
+
+def run_pipeline(input_file, writer, split_duration, engine, model, scorer, jobs=1,
+                 profile="full", window_seconds=300, queue_size=8, sampling_rate=16000, vad="svm",
+                 max_segment_seconds=None, cache=None, ds=None, pool=None, finished=None):
+    """Transcribe a file with decoding, silence detection, inference and subtitle writing
+    overlapped: each stage runs in its own thread and hands its results to the next one
+    through a bounded queue, so the first segments are transcribed while later audio is
+    still being decoded, and the queue bounds cap memory use.
+
+    Args:
+        input_file : input video file
+        writer : writeToFile.SubtitleWriter
+        split_duration : for long audio segments, split the subtitle based on this number of seconds
+        engine, model, scorer : see utils.create_model
+        jobs : number of inference worker processes, 1 runs inference in a thread
+        profile : feature profile used for silence detection
+        window_seconds : length of the silence detection windows (see segmentAudio.stream_segments)
+        queue_size : capacity of each queue between stages
+        sampling_rate : sampling rate of the decoded audio
+        vad : silence detection engine (see segmentAudio.VAD_ENGINES)
+        max_segment_seconds : (opt) longer segments are split (see segmentAudio.split_long_segments)
+        cache : (opt) transcriptCache.TranscriptCache
+        ds : (opt) loaded model to reuse, with jobs=1
+        pool : (opt) running worker pool to reuse (see inference.create_pool), with jobs > 1
+        finished : (opt) tokens of the segments transcribed by an interrupted run, keyed by
+                   their (start, end) limits. Every VAD engine finds the same segments in the
+                   same audio (the svm classifier is seeded, see trainAudio.train_svm), so
+                   the segments are found again and only their inference is skipped
+
+    Returns:
+        line_count : number of subtitle lines written
+    """
+
+    audio_queue = queue.Queue(queue_size)
+    segment_queue = queue.Queue(queue_size)
+    result_queue = queue.Queue(queue_size)
+    stop = threading.Event()
+    errors = []
+
+    own_pool = pool is None and jobs > 1
+    if own_pool:
+        # worker models load in parallel with decoding
+        pool = create_pool(jobs, engine, model, scorer)
+    elif jobs <= 1:
+        pool = None
+
+    stages = [
+        ("decode", stream_audio(input_file, sampling_rate), audio_queue),
+        ("segmentation", stream_segments(_drain(audio_queue, stop), sampling_rate, window_seconds, profile=profile,
+                                         vad=vad, max_segment_seconds=max_segment_seconds),
+         segment_queue),
+        ("inference", _transcribed(_drain(segment_queue, stop), engine, model, scorer, pool, cache, ds, finished or {}), result_queue),
+    ]
+    threads = [threading.Thread(target=_stage, args=(name, items, out_queue, stop, errors), name=name,
+                                daemon=True)
+               for name, items, out_queue in stages]
+
+    from tqdm import tqdm
+
+    start_time = time.perf_counter()
+    line_count = 1
+    try:
+        for thread in threads:
+            thread.start()
+        for segment, tokens in tqdm(_drain(result_queue, stop)):
+            if not isinstance(tokens, TokenTimeline):
+                _, tokens, latency = job_result(tokens)
+                profiler.segment(segment.duration, latency)
+                if cache is not None:
+                    cache.put(segment.audio, tokens)
+            with profiler.stage("writing"):
+                line_count = write_transcript(tokens, segment, writer, split_duration, line_count)
+            if line_count > 1 and start_time is not None:
+                _logger.info(f"First subtitle after {time.perf_counter() - start_time:.2f}s")
+                start_time = None
+    except BaseException as e:
+        errors.append(("writing", e))
+    finally:
+        stop.set()
+        # unblock stages waiting on a full queue, the ones reading a queue
+        # return on the stop event whether or not its marker was discarded
+        for _, _, out_queue in stages:
+            while not out_queue.empty():
+                out_queue.get_nowait()
+        for thread in threads:
+            thread.join()
+        if own_pool:
+            stop_pool(pool)
+
+    if errors:
+        name, error = errors[0]
+        if isinstance(error, (SystemExit, KeyboardInterrupt)):
+            raise error
+        raise RuntimeError(f"Pipeline {name} stage failed: {error}") from error
+    return line_count - 1
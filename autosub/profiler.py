@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import json
+import time
+import cProfile
+import resource
+import datetime
+import threading
+import contextlib
+
+import numpy as np
+
+# Profile of the current run, None unless enabled with --profile
+_current = None
+
+
+class RunProfile:
+    """Wall and CPU time spent in each stage of a run, and the inference latency of every
+    segment. CPU time is the process CPU time while the stage ran, so with --pipeline it
+    includes the stages running at the same time in other threads. Stages can nest (eg,
+    decoding runs inside feature extraction when the audio is streamed): the "self_wall"
+    of a stage excludes the stages nested in it on the same thread. With --jobs, the
+    stages of the inference worker processes (model loading and inference) are added
+    too, so the wall time of a stage can add up to more than that of the run.
+    """
+
+    def __init__(self):
+        self.started = datetime.datetime.now(datetime.timezone.utc)
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stages = {}
+        self.segments = []
+        self.inputs = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        # wall time of the stages nested in the running ones of this thread
+        nested = self._local.__dict__.setdefault("nested", [])
+        nested.append(0.0)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            self_wall = wall - nested.pop()
+            if nested:
+                nested[-1] += wall
+            with self._lock:
+                totals = self.stages.setdefault(name, {"wall": 0.0, "self_wall": 0.0, "cpu": 0.0, "calls": 0})
+                totals["wall"] += wall
+                totals["self_wall"] += self_wall
+                totals["cpu"] += cpu
+                totals["calls"] += 1
+
+    def take_stages(self):
+        """The stage totals recorded so far, which are cleared (see add_stages)"""
+
+        with self._lock:
+            stages, self.stages = self.stages, {}
+        return stages
+
+    def add_stages(self, stages):
+        """Add stage totals recorded by another process, see take_stages"""
+
+        with self._lock:
+            for name, totals in stages.items():
+                mine = self.stages.setdefault(name, {"wall": 0.0, "self_wall": 0.0, "cpu": 0.0, "calls": 0})
+                for key, value in totals.items():
+                    mine[key] += value
+
+    def add_segment(self, duration, latency, cached=False):
+        with self._lock:
+            self.segments.append((duration, latency, cached))
+
+    def add_input(self, input_file, duration):
+        with self._lock:
+            self.inputs.append({"file": input_file, "duration": duration})
+
+    def report(self):
+        """The profile as a JSON-serializable dict"""
+
+        wall = time.perf_counter() - self._wall_start
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        # ru_maxrss is in kB on Linux and in bytes on macOS
+        rss_unit = 1 if sys.platform == "darwin" else 1024
+        audio = sum(i["duration"] for i in self.inputs if i["duration"])
+
+        durations = np.array([d for d, _, _ in self.segments], dtype=np.float64)
+        latencies = np.array([l for _, l, _ in self.segments], dtype=np.float64)
+        cached = np.array([c for _, _, c in self.segments], dtype=bool)
+        inferred = durations[~cached].sum()
+
+        def distribution(values):
+            if len(values) == 0:
+                return None
+            return {"mean": float(np.mean(values)), "p50": float(np.percentile(values, 50)),
+                    "p95": float(np.percentile(values, 95)), "max": float(np.max(values))}
+
+        return {
+            "started": self.started.isoformat(),
+            "wall_time": wall,
+            "cpu_time": time.process_time() - self._cpu_start,
+            "children_cpu_time": children.ru_utime + children.ru_stime,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_unit / 1024 ** 2,
+            "inputs": self.inputs,
+            "audio_duration": audio,
+            "real_time_factor": wall / audio if audio else None,
+            "stages": {name: dict(totals) for name, totals in
+                       sorted(self.stages.items(), key=lambda item: -item[1]["wall"])},
+            "segments": {
+                "count": len(self.segments),
+                "cached": int(cached.sum()),
+                "speech_duration": float(durations.sum()),
+                "duration": distribution(durations),
+                "latency": distribution(latencies[~cached]),
+                "inference_real_time_factor": float(latencies[~cached].sum() / inferred) if inferred else None,
+            },
+            "segment_details": [{"duration": round(float(d), 3), "latency": float(l), "cached": bool(c)}
+                                for d, l, c in self.segments],
+        }
+
+    def write(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+
+def enable():
+    """Start profiling the run, see current()"""
+
+    global _current
+    _current = RunProfile()
+    return _current
+
+
+def current():
+    """RunProfile of the run, None if profiling is disabled"""
+
+    return _current
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Time a stage of the run, a no-op unless profiling is enabled"""
+
+    if _current is None:
+        yield
+        return
+    with _current.stage(name):
+        yield
+
+
+@contextlib.contextmanager
+def cprofile(path=None):
+    """Run the block under cProfile and dump its stats to path (for pstats or snakeviz),
+    a no-op if path is None"""
+
+    if path is None:
+        yield
+        return
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
+
+
+def take_stages():
+    """Stage totals recorded by this process since the last call, for a worker process to
+    send them to the process running the profile. None unless profiling is enabled"""
+
+    return _current.take_stages() if _current is not None else None
+
+
+def add_stages(stages):
+    """Add the stage totals of a worker process (see take_stages) to the profile of the
+    run, a no-op unless profiling is enabled"""
+
+    if _current is not None and stages:
+        _current.add_stages(stages)
+
+
+def segment(duration, latency, cached=False):
+    """Record the inference latency of a segment of duration seconds, a no-op unless
+    profiling is enabled"""
+
+    if _current is not None:
+        _current.add_segment(duration, latency, cached)
@@ -2,43 +2,128 @@
 # -*- coding: utf-8 -*-
 
 import os
+import wave
+import struct
+import tempfile
 import numpy as np
+from collections import namedtuple
 
-from pydub import AudioSegment
-import scipy.io.wavfile as wavfile
 
 # Local imports
 import logger
+import profiler
 import trainAudio as TA
 import featureExtraction as FE
 
 _logger = logger.setup_applevel_logger(__name__)
 
 
-def read_audio_file(input_file):
+class Segment(namedtuple("Segment", ["start", "end", "sampling_rate", "audio"])):
+    """A speech segment: [start, end) sample offsets in the input audio and
+    a view of its samples
+    """
+
+    __slots__ = ()
+
+    @property
+    def start_time(self):
+        return self.start / self.sampling_rate
+
+    @property
+    def end_time(self):
+        return self.end / self.sampling_rate
+
+    @property
+    def duration(self):
+        return (self.end - self.start) / self.sampling_rate
+
+
+def read_wav_mmap(input_file):
+    """This function memory-maps the PCM payload of a 16-bit WAV file, so the
+    samples are a zero-copy view of the file instead of a decoded copy
+
+    Args:
+        input_file : audio from input video file
+
+    Returns:
+        sampling_rate, signal : signal is a read-only int16 numpy memmap
+                                (n_samples,) or (n_samples, n_channels), or
+                                (-1, None) if the file is not 16-bit PCM
+    """
+
+    file_size = os.path.getsize(input_file)
+    with open(input_file, 'rb') as fin:
+        header = fin.read(12)
+        if len(header) < 12 or header[0:4] != b'RIFF' or header[8:12] != b'WAVE':
+            return -1, None
+        fmt = None
+        while True:
+            chunk = fin.read(8)
+            if len(chunk) < 8:
+                return -1, None
+            chunk_id = chunk[0:4]
+            chunk_size = struct.unpack('<I', chunk[4:8])[0]
+            if chunk_id == b'fmt ':
+                fmt = struct.unpack('<HHIIHH', fin.read(16))
+                fin.seek(chunk_size - 16 + chunk_size % 2, os.SEEK_CUR)
+            elif chunk_id == b'data':
+                data_offset = fin.tell()
+                break
+            else:
+                fin.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+    # 1: PCM, 0xFFFE: WAVE_FORMAT_EXTENSIBLE
+    if fmt is None or fmt[0] not in (1, 0xFFFE) or fmt[5] != 16:
+        return -1, None
+    audio_format, channels, sampling_rate, _, block_align, _ = fmt
+
+    # streamed WAVs may carry a placeholder data size
+    data_size = min(chunk_size, file_size - data_offset)
+    n_samples = data_size // block_align
+    if n_samples == 0:
+        return sampling_rate, np.zeros(0, dtype=np.int16)
+    signal = np.memmap(input_file, dtype='<i2', mode='r', offset=data_offset,
+                       shape=(n_samples * channels,))
+    if channels > 1:
+        signal = signal.reshape(n_samples, channels)
+    return sampling_rate, signal
+
+
+def read_audio_file(input_file, use_mmap=True):
     """This function returns a numpy array that stores the audio samples of a
-    specified WAV file
+    specified WAV file. 16-bit PCM WAVs are memory-mapped (see read_wav_mmap),
+    other files are decoded with pydub
 
     Args:
         input_file : audio from input video file
+        use_mmap : memory-map 16-bit PCM WAV files. Defaults to True.
     """
 
+    if use_mmap:
+        try:
+            sampling_rate, signal = read_wav_mmap(input_file)
+            if signal is not None:
+                return sampling_rate, signal
+        except (OSError, ValueError, struct.error) as e:
+            _logger.warn(f"Could not memory-map {input_file}: {e}")
+
+    # pydub and the scipy modules below are imported where they are used, to keep
+    # them out of the startup of runs that don't need them
+    from pydub import AudioSegment
+
     sampling_rate = -1
     signal = np.array([])
     try:
         audiofile = AudioSegment.from_file(input_file)
         data = np.array([])
         if audiofile.sample_width == 2:
-            data = np.fromstring(audiofile._data, np.int16)
+            data = np.frombuffer(audiofile._data, np.int16)
         elif audiofile.sample_width == 4:
-            data = np.fromstring(audiofile._data, np.int32)
+            data = np.frombuffer(audiofile._data, np.int32)
 
         if data.size > 0:
             sampling_rate = audiofile.frame_rate
-            temp_signal = []
-            for chn in list(range(audiofile.channels)):
-                temp_signal.append(data[chn::audiofile.channels])
-            signal = np.array(temp_signal).T
+            signal = data.reshape(-1, audiofile.channels)
     except:
         _logger.error("File not found or other I/O error. (DECODING FAILED)")
 
@@ -47,6 +132,34 @@ def read_audio_file(input_file):
     return sampling_rate, signal
 
 
+def read_audio_blocks(input_file, block_size=16000 * 60):
+    """This function yields the samples of a PCM WAV file in blocks, so that
+    long files can be processed without loading them in memory
+
+    Args:
+        input_file : audio from input video file
+        block_size : number of samples per block
+    """
+
+    with wave.open(input_file, 'rb') as fin:
+        channels = fin.getnchannels()
+        sample_width = fin.getsampwidth()
+        if sample_width == 2:
+            dtype = np.int16
+        elif sample_width == 4:
+            dtype = np.int32
+        else:
+            raise ValueError(f"Unsupported sample width: {sample_width}")
+        while True:
+            data = fin.readframes(block_size)
+            if not data:
+                break
+            block = np.frombuffer(data, dtype)
+            if channels > 1:
+                block = stereo_to_mono(block.reshape(-1, channels))
+            yield block
+
+
 def smooth_moving_avg(signal, window=11):
     window = int(window)
     if signal.ndim != 1:
@@ -78,38 +191,113 @@ def stereo_to_mono(signal):
     return signal
 
 
-def silence_removal(signal, sampling_rate, st_win, st_step, smooth_window=0.5,
-                    weight=0.5):
-    """Event Detection (silence removal)
+def group_onsets(indices, st_step, min_duration=0.2, max_gap=2):
+    """Groups sorted onset frame indices into segments: a new segment starts
+    wherever two consecutive indices are more than max_gap frames apart
+
+    Args:
+        indices : sorted frame indices detected as onset
+        st_step : window step in seconds
+        min_duration : segments not longer than this (in seconds) are dropped
+        max_gap : largest index gap inside a segment
+
+    Returns:
+        seg_limits : list of segment limits in seconds
+    """
+
+    indices = np.asarray(indices)
+    if len(indices) == 0:
+        return []
+    breaks = np.nonzero(np.diff(indices) > max_gap)[0]
+    starts = indices[np.r_[0, breaks + 1]]
+    ends = indices[np.r_[breaks, len(indices) - 1]]
+    seg_limits = np.column_stack((starts * st_step, ends * st_step))
+    keep = seg_limits[:, 1] - seg_limits[:, 0] > min_duration
+    return seg_limits[keep].tolist()
+
+
+def split_long_segments(seg_limits, energy, st_step, max_seconds):
+    """Split the segments longer than max_seconds at their lowest energy
+    frames, so that no piece is longer than max_seconds. A segment is cut
+    between half and all of max_seconds from its start, and not in its last
+    quarter of max_seconds, so pieces don't get very short. Consecutive
+    pieces share their limit, so no audio is lost or duplicated.
+
+    Args:
+        seg_limits : list of segment limits in seconds
+        energy : short-term energy of the frames, frame i starting at
+                 i * st_step seconds
+        st_step : window step in seconds
+        max_seconds : longest segment, None or 0 for no limit
+
+    Returns:
+        seg_limits : list of segment limits in seconds
+    """
+
+    if not max_seconds:
+        return seg_limits
+    pieces = []
+    for start, end in seg_limits:
+        while end - start > max_seconds:
+            first = int(np.ceil((start + max_seconds / 2) / st_step))
+            last = int(min(start + max_seconds, end - max_seconds / 4) / st_step)
+            window = energy[first:last + 1]
+            if len(window):
+                split = (first + int(np.argmin(window))) * st_step
+            else:
+                split = start + max_seconds
+            pieces.append([start, split])
+            start = split
+        pieces.append([start, end])
+    return pieces
+
+
+def limit_segment_length(seg_limits, signal, sampling_rate, st_step,
+                         max_seconds):
+    """split_long_segments() for engines that keep no energy track: the
+    frame energy is computed from the signal, only over the long segments
 
     Args:
+        seg_limits : list of segment limits in seconds
         signal : the input audio signal
         sampling_rate : sampling freq
-        st_win, st_step : window size and step in seconds
-        smoothWindow : (optinal) smooth window (in seconds)
-        weight : (optinal) weight factor (0 < weight < 1) the higher, the more strict
-        plot : (optinal) True if results are to be plotted
+        st_step : window step in seconds
+        max_seconds : longest segment, None or 0 for no limit
 
     Returns:
-        seg_limits : list of segment limits in seconds (e.g [[0.1, 0.9],
-                [1.4, 3.0]] means that the resulting segments
-                are (0.1 - 0.9) seconds and (1.4, 3.0) seconds
+        seg_limits : list of segment limits in seconds
     """
 
-    if weight >= 1:
-        weight = 0.99
-    if weight <= 0:
-        weight = 0.01
-
-    # Step 1: feature extraction
+    if not max_seconds or all(end - start <= max_seconds
+                              for start, end in seg_limits):
+        return seg_limits
     signal = stereo_to_mono(signal)
-    st_feats, _ = FE.feature_extraction(signal, sampling_rate,
-                                        st_win * sampling_rate,
-                                        st_step * sampling_rate)
+    step = int(st_step * sampling_rate)
+    energy = np.zeros(len(signal) // step)
+    for start, end in seg_limits:
+        if end - start > max_seconds:
+            first = int(start / st_step)
+            last = min(len(energy), int(np.ceil(end / st_step)))
+            frames = signal[first * step:last * step].reshape(-1, step)
+            energy[first:last] = np.mean(np.square(frames, dtype=np.float64),
+                                         axis=1)
+    return split_long_segments(seg_limits, energy, st_step, max_seconds)
 
-    # Step 2: train binary svm classifier of low vs high energy frames
-    # keep only the energy short-term sequence (2nd feature)
-    st_energy = st_feats[1, :]
+
+def train_onset_classifier(st_feats, energy_row):
+    """Trains a binary svm classifier of low vs high energy frames
+
+    Args:
+        st_feats : (n_feats x n_frames) short-term feature matrix
+        energy_row : row of st_feats holding the short-term energy
+
+    Returns:
+        svm : the trained svm (class 1 is ONSET)
+        mean, std : normalization of the feature vectors
+    """
+
+    # keep only the energy short-term sequence
+    st_energy = st_feats[energy_row, :]
     en = np.sort(st_energy)
     # number of 10% of the total short-term windows
     st_windows_fraction = int(len(en) / 10)
@@ -133,76 +321,609 @@ def silence_removal(signal, sampling_rate, st_win, st_step, smooth_window=0.5,
     # (ONSET vs SILENCE)
     features_norm, mean, std = TA.normalize_features(features)
     svm = TA.train_svm(features_norm, 1.0)
+    return svm, mean, std
+
+
+def onset_threshold(prob_on_set, weight):
+    """Finds the onset probability threshold as a weighted average of the
+    top 10% and lower 10% of the (smoothed) onset probabilities
+    """
+
+    prog_on_set_sort = np.sort(prob_on_set)
+    nt = int(prog_on_set_sort.shape[0] / 10)
+    return (np.mean((1 - weight) * prog_on_set_sort[0:nt]) +
+            weight * np.mean(prog_on_set_sort[-nt::]))
+
+
+def silence_removal(signal, sampling_rate, st_win, st_step, smooth_window=0.5,
+                    weight=0.5, profile="full", max_segment_seconds=None):
+    """Event Detection (silence removal)
+
+    Args:
+        signal : the input audio signal
+        sampling_rate : sampling freq
+        st_win, st_step : window size and step in seconds
+        smoothWindow : (optinal) smooth window (in seconds)
+        weight : (optinal) weight factor (0 < weight < 1) the higher, the more strict
+        profile : (optinal) feature profile used to train the svm, see
+                  featureExtraction.FEATURE_PROFILES
+        max_segment_seconds : (optinal) longer segments are split, see
+                              split_long_segments
+
+    Returns:
+        seg_limits : list of segment limits in seconds (e.g [[0.1, 0.9],
+                [1.4, 3.0]] means that the resulting segments
+                are (0.1 - 0.9) seconds and (1.4, 3.0) seconds
+    """
+
+    # Step 1: feature extraction
+    signal = stereo_to_mono(signal)
+    with profiler.stage("feature_extraction"):
+        st_feats, feature_names = FE.feature_extraction(
+            signal, sampling_rate, st_win * sampling_rate,
+            st_step * sampling_rate, profile=profile)
+
+    return segment_features(st_feats, feature_names, st_step, smooth_window,
+                            weight, max_segment_seconds)
+
+
+def segment_features(st_feats, feature_names, st_step, smooth_window=0.5,
+                     weight=0.5, max_segment_seconds=None):
+    """Steps 2-5 of silence_removal(): finds the speech segments given the
+    short-term features of the whole signal
+
+    Args:
+        st_feats : (n_feats x n_frames) short-term feature matrix
+        feature_names : names of the rows of st_feats
+        st_step : window step in seconds
+        smooth_window : (optinal) smooth window (in seconds)
+        weight : (optinal) weight factor (0 < weight < 1) the higher, the more strict
+        max_segment_seconds : (optinal) longer segments are split at their
+                              lowest energy frames
+
+    Returns:
+        seg_limits : list of segment limits in seconds
+    """
+
+    if weight >= 1:
+        weight = 0.99
+    if weight <= 0:
+        weight = 0.01
 
-    # Step 3: compute onset probability based on the trained svm
-    prob_on_set = []
-    for index in range(st_feats.shape[1]):
-        # for each frame
-        cur_fv = (st_feats[:, index] - mean) / std
+    # Step 2: train binary svm classifier of low vs high energy frames
+    with profiler.stage("svm_training"):
+        svm, mean, std = train_onset_classifier(
+            st_feats, feature_names.index("energy"))
+
+    # Step 3: compute onset probability based on the trained svm,
+    # normalizing and scoring all frames in a single batch
+    with profiler.stage("frame_scoring"):
+        frames_norm = (st_feats.T - mean) / std
         # get svm probability (that it belongs to the ONSET class)
-        prob_on_set.append(svm.predict_proba(cur_fv.reshape(1, -1))[0][1])
-    prob_on_set = np.array(prob_on_set)
+        prob_on_set = svm.predict_proba(frames_norm)[:, 1]
 
     # smooth probability:
     prob_on_set = smooth_moving_avg(prob_on_set, smooth_window / st_step)
 
     # Step 4A: detect onset frame indices:
-    prog_on_set_sort = np.sort(prob_on_set)
-
-    # find probability Threshold as a weighted average
-    # of top 10% and lower 10% of the values
-    nt = int(prog_on_set_sort.shape[0] / 10)
-    threshold = (np.mean((1 - weight) * prog_on_set_sort[0:nt]) +
-                 weight * np.mean(prog_on_set_sort[-nt::]))
+    threshold = onset_threshold(prob_on_set, weight)
 
-    max_indices = np.where(prob_on_set > threshold)[0]
     # get the indices of the frames that satisfy the thresholding
-    index = 0
-    seg_limits = []
-    time_clusters = []
+    max_indices = np.where(prob_on_set > threshold)[0]
 
     # Step 4B: group frame indices to onset segments
-    while index < len(max_indices):
-        # for each of the detected onset indices
-        cur_cluster = [max_indices[index]]
-        if index == len(max_indices) - 1:
-            break
-        while max_indices[index + 1] - cur_cluster[-1] <= 2:
-            cur_cluster.append(max_indices[index + 1])
-            index += 1
-            if index == len(max_indices) - 1:
+    # Step 5: Post process: remove very small segments:
+    seg_limits = group_onsets(max_indices, st_step, min_duration=0.2)
+    return split_long_segments(seg_limits,
+                               st_feats[feature_names.index("energy")],
+                               st_step, max_segment_seconds)
+
+
+def _frame_chunks(signal, sampling_rate, st_win, st_step, block_frames=4096):
+    """Yields consecutive batches of at most block_frames short-term frames of
+    the signal, scaled to [-1, 1], so memory stays bounded on long signals
+    """
+
+    frames = FE.frame_signal(signal, int(st_win * sampling_rate),
+                             int(st_step * sampling_rate))
+    for i in range(0, frames.shape[0], block_frames):
+        yield np.double(frames[i:i + block_frames]) / (2.0 ** 15)
+
+
+def _adaptive_threshold(score, weight, st_step, floor_window=10.0):
+    """Per-frame threshold on a (smoothed) log-domain detection score: the
+    onset_threshold() of the whole signal, raised wherever the local noise
+    floor (the running minimum over floor_window seconds) is higher than the
+    global one by the same margin
+    """
+
+    from scipy.ndimage import minimum_filter1d
+
+    threshold = onset_threshold(score, weight)
+    floor = np.sort(score)[:max(1, int(len(score) / 10))].mean()
+    local_floor = minimum_filter1d(score, max(1, int(floor_window / st_step)))
+    return np.maximum(threshold, local_floor + (threshold - floor))
+
+
+def energy_vad(signal, sampling_rate, st_win, st_step, smooth_window=0.5,
+               weight=0.5, extend=0.25):
+    """Lightweight silence removal for clean audio: frames whose smoothed log
+    energy exceeds an adaptive threshold are speech, and the boundaries are
+    extended by up to `extend` seconds over frames whose zero crossing rate
+    is above that of the quietest frames (unvoiced consonants)
+
+    Args:
+        signal : the input audio signal
+        sampling_rate : sampling freq
+        st_win, st_step : window size and step in seconds
+        smooth_window : (optinal) smooth window (in seconds)
+        weight : (optinal) weight factor (0 < weight < 1) the higher, the more strict
+        extend : (optinal) longest boundary extension on high ZCR frames (in seconds)
+
+    Returns:
+        seg_limits : list of segment limits in seconds
+    """
+
+    signal = stereo_to_mono(signal)
+    weight = min(max(weight, 0.01), 0.99)
+    energy, zcr = [], []
+    for frames in _frame_chunks(signal, sampling_rate, st_win, st_step):
+        energy.append(10 * np.log10(np.mean(frames ** 2, axis=1) + FE.eps))
+        signs = np.signbit(frames)
+        zcr.append(np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) /
+                   (frames.shape[1] - 1.0))
+    if not energy:
+        return []
+    energy, zcr = np.concatenate(energy), np.concatenate(zcr)
+
+    energy = smooth_moving_avg(energy, smooth_window / st_step)
+    speech = energy > _adaptive_threshold(energy, weight, st_step)
+
+    # ZCR of silence, from the 10% quietest frames
+    quiet = np.argsort(energy)[:max(1, int(len(energy) / 10))]
+    zcr_threshold = zcr[quiet].mean() + 2 * zcr[quiet].std()
+    from scipy.ndimage import maximum_filter1d
+
+    near_speech = maximum_filter1d(speech.astype(np.uint8),
+                                   2 * int(extend / st_step) + 1) > 0
+    speech |= near_speech & (zcr > zcr_threshold)
+
+    return group_onsets(np.nonzero(speech)[0], st_step, min_duration=0.2)
+
+
+def spectral_flux_vad(signal, sampling_rate, st_win, st_step,
+                      smooth_window=0.5, weight=0.5):
+    """Silence removal on spectral change: speech keeps changing its spectrum
+    while steady background noise does not. The score of a frame is the log
+    of the half-wave rectified difference of its magnitude spectrum with the
+    previous frame's, thresholded like energy_vad()
+
+    Args:
+        signal : the input audio signal
+        sampling_rate : sampling freq
+        st_win, st_step : window size and step in seconds
+        smooth_window : (optinal) smooth window (in seconds)
+        weight : (optinal) weight factor (0 < weight < 1) the higher, the more strict
+
+    Returns:
+        seg_limits : list of segment limits in seconds
+    """
+
+    signal = stereo_to_mono(signal)
+    weight = min(max(weight, 0.01), 0.99)
+    flux = []
+    previous = None
+    for frames in _frame_chunks(signal, sampling_rate, st_win, st_step):
+        magnitude = np.abs(np.fft.rfft(frames, axis=1))
+        if previous is None:
+            previous = magnitude[0]
+        before = np.vstack((previous, magnitude[:-1]))
+        flux.append(np.log10(np.sum(np.maximum(magnitude - before, 0.0),
+                                    axis=1) + FE.eps))
+        previous = magnitude[-1]
+    if not flux:
+        return []
+    flux = smooth_moving_avg(np.concatenate(flux), smooth_window / st_step)
+    speech = flux > _adaptive_threshold(flux, weight, st_step)
+    return group_onsets(np.nonzero(speech)[0], st_step, min_duration=0.2)
+
+
+# Silence removal engines selectable with --vad. Every engine takes
+# (signal, sampling_rate, st_win, st_step, smooth_window, weight) and returns
+# seg_limits, a list of [start, end] speech limits in seconds
+VAD_ENGINES = {
+    "svm": silence_removal,
+    "energy": energy_vad,
+    "flux": spectral_flux_vad,
+}
+
+
+def detect_speech(signal, sampling_rate, st_win, st_step, smooth_window=0.5,
+                  weight=0.5, vad="svm", profile="full",
+                  max_segment_seconds=None):
+    """Runs the selected VAD engine (see VAD_ENGINES) on a signal
+
+    Args:
+        vad : name of the engine
+        profile : feature profile of the "svm" engine
+        max_segment_seconds : longer segments are split, see
+                              split_long_segments
+        others : see silence_removal
+
+    Returns:
+        seg_limits : list of segment limits in seconds
+    """
+
+    if vad not in VAD_ENGINES:
+        raise ValueError(f"Unknown VAD engine: {vad}")
+    if vad == "svm":
+        return silence_removal(signal, sampling_rate, st_win, st_step,
+                               smooth_window, weight, profile,
+                               max_segment_seconds)
+    with profiler.stage(f"vad_{vad}"):
+        seg_limits = VAD_ENGINES[vad](signal, sampling_rate, st_win, st_step,
+                                      smooth_window, weight)
+        return limit_segment_length(seg_limits, signal, sampling_rate,
+                                    st_step, max_segment_seconds)
+
+
+class _Reservoir:
+    """Uniform random sample of at most size rows out of a stream of row
+    blocks (reservoir sampling), kept in stream order
+    """
+
+    def __init__(self, size, n_cols, rng):
+        self.rows = np.empty((size, n_cols))
+        self.index = np.empty(size, dtype=np.int64)
+        self.size = size
+        self.seen = 0
+        self.rng = rng
+
+    def add(self, block):
+        block = block.reshape(len(block), -1)
+        # fill the free slots first ...
+        free = min(max(0, self.size - self.seen), len(block))
+        if free > 0:
+            self.rows[self.seen:self.seen + free] = block[:free]
+            self.index[self.seen:self.seen + free] = np.arange(self.seen, self.seen + free)
+        # ... then row i replaces a random slot with probability size / (i + 1)
+        stream_index = np.arange(self.seen + free, self.seen + len(block))
+        if len(stream_index):
+            slots = self.rng.randint(0, stream_index + 1)
+            taken = np.nonzero(slots < self.size)[0]
+            # a slot drawn several times keeps the last row, as a sequential pass would
+            _, last = np.unique(slots[taken][::-1], return_index=True)
+            taken = taken[len(taken) - 1 - last]
+            self.rows[slots[taken]] = block[stream_index[taken] - self.seen]
+            self.index[slots[taken]] = stream_index[taken]
+        self.seen += len(block)
+
+    def sample(self):
+        n = min(self.seen, self.size)
+        order = np.argsort(self.index[:n], kind="stable")
+        return self.rows[:n][order]
+
+
+def stream_silence_removal(read_blocks, sampling_rate, st_win, st_step,
+                           smooth_window=0.5, weight=0.5, profile="full",
+                           reservoir_size=36000, chunk_frames=72000, seed=0):
+    """Event Detection (silence removal) with memory bounded independently
+    of the signal length
+
+    The signal is read in blocks three times: to find its normalization, to
+    train the svm on a reservoir sample of frames, and to score every frame.
+    The frame probabilities are spilled to a temporary file and the
+    probability threshold is estimated from a reservoir sample of their
+    smoothed values. When the reservoir holds every frame, the segments are
+    those of silence_removal().
+
+    Args:
+        read_blocks : callable returning a new iterator over the signal
+                      sample blocks
+        sampling_rate : sampling freq
+        st_win, st_step : window size and step in seconds
+        smooth_window : (optinal) smooth window (in seconds)
+        weight : (optinal) weight factor (0 < weight < 1) the higher, the more strict
+        profile : (optinal) feature profile, see featureExtraction.FEATURE_PROFILES
+        reservoir_size : (optinal) max number of frames sampled for training
+                         and thresholding
+        chunk_frames : (optinal) number of probabilities smoothed at once
+        seed : (optinal) seed of the reservoir sampling
+
+    Yields:
+        seg_limits : [start, end] limits (in seconds) of each segment, in order
+    """
+
+    if weight >= 1:
+        weight = 0.99
+    if weight <= 0:
+        weight = 0.01
+
+    window = int(st_win * sampling_rate)
+    step = int(st_step * sampling_rate)
+    rng = np.random.RandomState(seed)
+
+    def st_feature_blocks():
+        frame_blocks = FE.frame_stream(read_blocks(), window, step)
+        return FE.feature_blocks(frame_blocks, sampling_rate, window,
+                                 dc_offset, signal_max, profile=profile)
+
+    # Step 1: signal normalization and a sample of the frame features
+    dc_offset, signal_max = FE.normalization_params(read_blocks())
+    feature_names = FE.feature_names_for(FE.FEATURE_PROFILES[profile])
+    reservoir = _Reservoir(reservoir_size, len(feature_names), rng)
+    for st_feats in st_feature_blocks():
+        reservoir.add(st_feats.T)
+
+    # Step 2: train binary svm classifier of low vs high energy frames
+    svm, mean, std = train_onset_classifier(
+        reservoir.sample().T, feature_names.index("energy"))
+
+    with tempfile.TemporaryFile() as prob_file:
+        # Step 3: compute onset probability of every frame
+        n_frames = 0
+        for st_feats in st_feature_blocks():
+            prob_on_set = svm.predict_proba((st_feats.T - mean) / std)[:, 1]
+            prob_file.write(prob_on_set.astype(np.float64).tobytes())
+            n_frames += len(prob_on_set)
+        prob_file.flush()
+        if n_frames == 0:
+            return
+        prob_on_set = np.memmap(prob_file, dtype=np.float64, mode='r',
+                                shape=(n_frames,))
+
+        def smoothed_chunks():
+            # each smoothed value only depends on probabilities less than
+            # one smoothing window away, so chunks padded with that margin
+            # give the same values as smoothing the whole sequence
+            smooth_frames = smooth_window / st_step
+            margin = int(smooth_frames) + 1
+            for start in range(0, n_frames, chunk_frames):
+                end = min(start + chunk_frames, n_frames)
+                low, high = max(0, start - margin), min(n_frames, end + margin)
+                smoothed = smooth_moving_avg(np.array(prob_on_set[low:high]),
+                                             smooth_frames)
+                yield start, smoothed[start - low:end - low]
+
+        # Step 4A: estimate the probability threshold
+        prob_reservoir = _Reservoir(reservoir_size, 1, rng)
+        for _, smoothed in smoothed_chunks():
+            prob_reservoir.add(smoothed)
+        threshold = onset_threshold(prob_reservoir.sample()[:, 0], weight)
+
+        # Step 4B: group onset frames to segments, carrying the last
+        # (possibly unfinished) cluster over to the next chunk
+        def limits(first, last):
+            seg_limit = [float(first * st_step), float(last * st_step)]
+            return [seg_limit] if seg_limit[1] - seg_limit[0] > min_duration else []
+
+        min_duration = 0.2
+        cluster = None
+        for start, smoothed in smoothed_chunks():
+            max_indices = start + np.where(smoothed > threshold)[0]
+            if len(max_indices) == 0:
+                continue
+            breaks = np.nonzero(np.diff(max_indices) > 2)[0]
+            firsts = max_indices[np.r_[0, breaks + 1]]
+            lasts = max_indices[np.r_[breaks, len(max_indices) - 1]]
+            if cluster is not None:
+                if firsts[0] - cluster[1] <= 2:
+                    firsts[0] = cluster[0]
+                else:
+                    yield from limits(*cluster)
+            for first, last in zip(firsts[:-1], lasts[:-1]):
+                yield from limits(first, last)
+            cluster = (firsts[-1], lasts[-1])
+        if cluster is not None:
+            yield from limits(*cluster)
+        del prob_on_set
+
+
+def segment_audio_stream(blocks, sampling_rate, smoothing_window=1.0,
+                         weight=0.2, profile="full", file_prefix=None,
+                         vad="svm", max_segment_seconds=None):
+    """Remove silent segments from audio that arrives in blocks (e.g. from
+    audioProcessing.stream_audio), extracting the features of each block as
+    soon as it arrives so that decoding and analysis overlap.
+
+    The global DC offset and peak of the signal are not known while it is
+    still arriving, so frames are normalized to full scale instead. The
+    classifier sees z-normalized features, so the segments are essentially
+    those of remove_silent_segments() on the same audio.
+
+    Args:
+        blocks : iterable of int16 mono sample blocks
+        sampling_rate : sampling freq
+        smoothing : Smoothing window size in seconds. Defaults to 1.0.
+        weight : Weight factor in (0,1). Defaults to 0.2.
+        profile : Feature profile used for segmentation. Defaults to "full".
+        file_prefix : if given, also write every segment to
+                      <file_prefix>_<start>-<end>.wav, for debugging
+        vad : VAD engine (see VAD_ENGINES). Only "svm" works on the blocks
+              as they arrive, the others run once all audio is received.
+        max_segment_seconds : longer segments are split, see
+                              split_long_segments. Defaults to None.
+
+    Returns:
+        segments : list of Segment, views of the concatenated blocks
+    """
+
+    if vad != "svm":
+        blocks = list(blocks)
+        signal = np.concatenate(blocks) if blocks else np.zeros(0, np.int16)
+        del blocks[:]
+        seg_limits = detect_speech(signal, sampling_rate, 0.05, 0.05,
+                                   smoothing_window, weight, vad,
+                                   max_segment_seconds=max_segment_seconds)
+        return make_segments(signal, sampling_rate, seg_limits, file_prefix)
+
+    received = []
+
+    def keep(blocks):
+        for block in blocks:
+            received.append(block)
+            yield block
+
+    window = int(0.05 * sampling_rate)
+    feature_names = FE.feature_names_for(FE.FEATURE_PROFILES[profile])
+    frame_blocks = FE.frame_stream(keep(blocks), window, window)
+    st_feats = [np.zeros((len(feature_names), 0))]
+    with profiler.stage("feature_extraction"):
+        st_feats += FE.feature_blocks(frame_blocks, sampling_rate, window,
+                                      0.0, 1.0, profile=profile)
+    st_feats = np.hstack(st_feats)
+    signal = np.concatenate(received) if received else np.zeros(0, np.int16)
+    del received[:]
+
+    seg_limits = segment_features(st_feats, feature_names, 0.05,
+                                  smoothing_window, weight,
+                                  max_segment_seconds)
+    return make_segments(signal, sampling_rate, seg_limits, file_prefix)
+
+
+def stream_segments(blocks, sampling_rate, window_seconds=300,
+                    smoothing_window=1.0, weight=0.2, profile="full",
+                    vad="svm", max_segment_seconds=None):
+    """Yields the speech segments of audio arriving in blocks while it is
+    still arriving, for pipelines that start inference before decoding ends
+
+    Silence detection runs on analysis windows of about window_seconds, each
+    with its own thresholds. Segments ending too close to the end of a
+    window may still grow, so they are left to the next window, which starts
+    where the last emitted segment ended. Boundaries can therefore differ
+    slightly from a single remove_silent_segments() pass over the whole file.
+
+    Args:
+        blocks : iterable of int16 mono sample blocks
+        sampling_rate : sampling freq
+        window_seconds : length of the analysis windows in seconds
+        smoothing : Smoothing window size in seconds. Defaults to 1.0.
+        weight : Weight factor in (0,1). Defaults to 0.2.
+        profile : Feature profile used for segmentation. Defaults to "full".
+        vad : VAD engine (see VAD_ENGINES). Defaults to "svm".
+        max_segment_seconds : longer segments are split, see
+                              split_long_segments. Defaults to None.
+
+    Yields:
+        segment : Segment holding a copy of its samples, in timeline order
+    """
+
+    # segments ending less than this before the end of a window may grow
+    margin = int(max(2 * smoothing_window, 1.0) * sampling_rate)
+    window = int(window_seconds * sampling_rate)
+    pending = np.zeros(0, np.int16)
+    offset = 0
+    next_analysis = window + margin
+
+    def analyse(final):
+        try:
+            seg_limits = detect_speech(pending, sampling_rate, 0.05, 0.05,
+                                       smoothing_window, weight, vad, profile,
+                                       max_segment_seconds)
+        except ValueError:
+            # too little audio left to train the classifier
+            seg_limits = []
+        horizon = len(pending) - (0 if final else margin)
+        segments = []
+        for s in seg_limits:
+            start, end = int(sampling_rate * s[0]), int(sampling_rate * s[1])
+            if end >= horizon:
                 break
-        index += 1
-        time_clusters.append(cur_cluster)
-        seg_limits.append([cur_cluster[0] * st_step,
-                           cur_cluster[-1] * st_step])
+            segments.append(Segment(offset + start, offset + end,
+                                    sampling_rate, pending[start:end].copy()))
+        if segments:
+            consumed = segments[-1].end - offset
+        else:
+            consumed = max(0, len(pending) - margin) if not seg_limits else 0
+        return segments, consumed
+
+    for block in blocks:
+        pending = np.concatenate((pending, block))
+        if len(pending) < next_analysis:
+            continue
+        segments, consumed = analyse(False)
+        yield from segments
+        pending = pending[consumed:]
+        offset += consumed
+        # a segment longer than the window delays the next analysis until
+        # another window of audio has arrived
+        next_analysis = max(window + margin, len(pending) + window)
+    if len(pending):
+        segments, _ = analyse(True)
+        yield from segments
+
+
+def make_segments(signal, sampling_rate, seg_limits, file_prefix=None):
+    """Cuts the signal into Segment views at the given limits
 
-    # Step 5: Post process: remove very small segments:
-    min_duration = 0.2
-    seg_limits_2 = []
-    for s_lim in seg_limits:
-        if s_lim[1] - s_lim[0] > min_duration:
-            seg_limits_2.append(s_lim)
-    seg_limits = seg_limits_2
-    return seg_limits
+    Args:
+        signal : audio samples
+        sampling_rate : sampling freq
+        seg_limits : iterable of segment limits in seconds
+        file_prefix : if given, also write every segment to
+                      <file_prefix>_<start>-<end>.wav
+
+    Returns:
+        segments : list of Segment
+    """
 
+    if file_prefix is not None:
+        import scipy.io.wavfile as wavfile
 
-def remove_silent_segments(input_file, smoothing_window=1.0, weight=0.2):
+    segments = []
+    for s in seg_limits:
+        start, end = int(sampling_rate * s[0]), int(sampling_rate * s[1])
+        segments.append(Segment(start, end, sampling_rate, signal[start:end]))
+        if file_prefix is not None:
+            strOut = "{0:s}_{1:.3f}-{2:.3f}.wav".format(file_prefix, s[0], s[1])
+            wavfile.write(strOut, sampling_rate, signal[start:end])
+    return segments
+
+
+def remove_silent_segments(input_file, smoothing_window=1.0, weight=0.2,
+                           profile="full", streaming=False,
+                           file_prefix=None, vad="svm",
+                           max_segment_seconds=None):
     """Remove silent segments from an audio file and split on those segments
 
     Args:
         input_file : audio from input video file
         smoothing : Smoothing window size in seconds. Defaults to 1.0.
         weight : Weight factor in (0,1). Defaults to 0.5.
+        profile : Feature profile used for segmentation. Defaults to "full".
+        streaming : Read the file in blocks with bounded memory (see
+                    stream_silence_removal). Defaults to False.
+        file_prefix : if given, also write every segment to
+                      <file_prefix>_<start>-<end>.wav, for debugging.
+                      Defaults to None.
+        vad : VAD engine (see VAD_ENGINES). Defaults to "svm".
+        max_segment_seconds : longer segments are split at their lowest
+                              energy frames (see split_long_segments).
+                              Defaults to None.
+
+    Returns:
+        segments : list of Segment, in timeline order
     """
 
     if not os.path.isfile(input_file):
         raise Exception("Input audio file not found!")
 
-    [fs, x] = read_audio_file(input_file)
-    segmentLimits = silence_removal(x, fs, 0.05, 0.05, smoothing_window, weight)
-
-    for i, s in enumerate(segmentLimits):
-        strOut = "{0:s}_{1:.3f}-{2:.3f}.wav".format(input_file[0:-4], s[0], s[1])
-        wavfile.write(strOut, fs, x[int(fs * s[0]):int(fs * s[1])])
-
+    # 16-bit PCM WAVs are memory-mapped, so the segments are views of the
+    # file and nothing is loaded in memory up front
+    with profiler.stage("read_audio"):
+        [fs, x] = read_audio_file(input_file)
+    if streaming and vad == "svm":
+        with profiler.stage("feature_extraction"):
+            segmentLimits = list(stream_silence_removal(
+                lambda: read_audio_blocks(input_file), fs, 0.05, 0.05,
+                smoothing_window, weight, profile))
+        segmentLimits = limit_segment_length(segmentLimits, x, fs, 0.05,
+                                             max_segment_seconds)
+    else:
+        # the other engines scan the (memory-mapped) signal in bounded
+        # batches of frames, so they need no separate streaming mode
+        segmentLimits = detect_speech(x, fs, 0.05, 0.05, smoothing_window,
+                                      weight, vad, profile,
+                                      max_segment_seconds)
+
+    return make_segments(x, fs, segmentLimits, file_prefix)
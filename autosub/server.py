@@ -0,0 +1,393 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import queue
+import socket
+import threading
+import socketserver
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Local imports
+import logger
+from audioProcessing import stream_audio
+from segmentAudio import segment_audio_stream, VAD_ENGINES
+from inference import ds_process_audio
+from utils import remove_socket
+from writeToFile import SubtitleWriter
+
+_logger = logger.setup_applevel_logger(__name__)
+
+SUPPORTED_FORMATS = ("srt", "vtt", "txt")
+
+# Job states
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class ModelPool:
+    """A fixed set of preloaded models, lent to one job at a time"""
+
+    def __init__(self, model_factory, size):
+        self.size = size
+        self._models = queue.Queue()
+        for _ in range(size):
+            self._models.put(model_factory())
+
+    def acquire(self):
+        return self._models.get()
+
+    def release(self, model):
+        self._models.put(model)
+
+    def available(self):
+        return self._models.qsize()
+
+
+class _JobOutput:
+    """File-like subtitle output of a job, readable while it is being written"""
+
+    def __init__(self, job):
+        self._job = job
+        self._parts = []
+
+    def write(self, text):
+        with self._job.changed:
+            self._parts.append(text)
+            self._job.changed.notify_all()
+
+    def flush(self):
+        pass
+
+    def read_from(self, index):
+        """Text written since the index-th write, and the index to read from next"""
+
+        return "".join(self._parts[index:]), len(self._parts)
+
+    def getvalue(self):
+        return "".join(self._parts)
+
+
+class Job:
+    """A transcription request for a local file and its progress"""
+
+    def __init__(self, job_id, input_file, formats, split_duration, vad):
+        self.id = job_id
+        self.input_file = input_file
+        self.formats = formats
+        self.split_duration = split_duration
+        self.vad = vad
+        self.status = QUEUED
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.changed = threading.Condition()
+        self.outputs = {format: _JobOutput(self) for format in formats}
+
+    def finish(self, status, error=None):
+        with self.changed:
+            self.status = status
+            self.error = error
+            self.finished = time.time()
+            self.changed.notify_all()
+
+    def is_finished(self):
+        return self.status in (DONE, FAILED)
+
+    def describe(self):
+        info = {"id": self.id, "file": self.input_file, "formats": self.formats, "status": self.status,
+                "created": self.created, "started": self.started, "finished": self.finished}
+        if self.error is not None:
+            info["error"] = self.error
+        return info
+
+
+class TranscriptionService:
+    """Runs transcription jobs on a pool of warm models: at most `concurrency` jobs run at
+    once, the others wait in a queue of at most max_queue jobs
+
+    Args:
+        model_factory : function returning a loaded model (eg, utils.create_model), called
+                        once per pooled model
+        models : number of preloaded models
+        concurrency : number of jobs run at once (default: one per model)
+        max_queue : number of jobs waiting to run before new ones are refused
+        max_finished : number of finished jobs whose results are kept
+        profile, vad, max_segment_seconds : silence detection settings (see
+                                            segmentAudio.remove_silent_segments)
+        cache : (opt) transcriptCache.TranscriptCache
+        reader : function decoding an input file to blocks of 16 kHz int16 samples
+    """
+
+    def __init__(self, model_factory, models=1, concurrency=None, max_queue=100, max_finished=1000,
+                 profile="full", vad="svm", max_segment_seconds=None, cache=None, reader=stream_audio):
+        self.models = ModelPool(model_factory, models)
+        self.profile = profile
+        self.vad = vad
+        self.max_segment_seconds = max_segment_seconds
+        self.cache = cache
+        self.reader = reader
+        self.max_finished = max_finished
+        self._pending = queue.Queue(max_queue)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._workers = [threading.Thread(target=self._work, name=f"worker-{i}", daemon=True)
+                         for i in range(concurrency or models)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, input_file, formats=("srt",), split_duration=5, vad=None):
+        """Queue a transcription job
+
+        Returns:
+            job : the queued Job
+
+        Raises:
+            ValueError : on invalid job options
+            queue.Full : when the queue is full
+        """
+
+        if not os.path.isfile(input_file):
+            raise ValueError(f"Invalid file: {input_file}")
+        formats = list(formats)
+        if not formats or any(format not in SUPPORTED_FORMATS for format in formats):
+            raise ValueError(f"Formats must be among {', '.join(SUPPORTED_FORMATS)}")
+        vad = vad or self.vad
+        if vad not in VAD_ENGINES:
+            raise ValueError(f"Unknown VAD engine: {vad}")
+        with self._lock:
+            job = Job(str(self._next_id), input_file, formats, float(split_duration), vad)
+            self._pending.put_nowait(job)
+            self._next_id += 1
+            self._jobs[job.id] = job
+            self._forget_finished()
+        _logger.info(f"Job {job.id} queued: {input_file}")
+        return job
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.is_finished()]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def queue_stats(self):
+        with self._lock:
+            states = [job.status for job in self._jobs.values()]
+        return {"queued": states.count(QUEUED), "running": states.count(RUNNING), "done": states.count(DONE),
+                "failed": states.count(FAILED), "capacity": self._pending.maxsize,
+                "models_available": self.models.available()}
+
+    def health(self):
+        return {"status": "ok", "models": self.models.size, "workers": len(self._workers)}
+
+    def _work(self):
+        while True:
+            job = self._pending.get()
+            model = self.models.acquire()
+            try:
+                self._run(job, model)
+            finally:
+                self.models.release(model)
+
+    def _run(self, job, model):
+        job.started = time.time()
+        with job.changed:
+            job.status = RUNNING
+            job.changed.notify_all()
+        _logger.info(f"Job {job.id} running: {job.input_file}")
+        try:
+            writer = SubtitleWriter(job.outputs)
+            segments = segment_audio_stream(self.reader(job.input_file), 16000, profile=self.profile, vad=job.vad,
+                                            max_segment_seconds=self.max_segment_seconds)
+            line_count = 1
+            for segment in segments:
+                line_count = ds_process_audio(model, segment, writer, job.split_duration, line_count,
+                                              self.cache)
+        except (Exception, SystemExit) as e:
+            job.finish(FAILED, str(e) or type(e).__name__)
+            _logger.error(f"Job {job.id} failed: {job.error}")
+            return
+        job.finish(DONE)
+        _logger.info(f"Job {job.id} done in {job.finished - job.started:.2f}s")
+
+
+_CONTENT_TYPES = {"srt": "application/x-subrip", "vtt": "text/vtt", "txt": "text/plain"}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """HTTP API of a TranscriptionService:
+
+        GET  /health                          service status
+        GET  /queue                           number of jobs in each state
+        POST /jobs                            {"file": path, "formats": [...], "split_duration": s, "vad": name}
+        GET  /jobs/<id>                       job status
+        GET  /jobs/<id>/result?format=srt     subtitles of a finished job (add wait=1 to block until then)
+        GET  /jobs/<id>/stream?format=srt     subtitles sent as they are written, until the job ends
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_text(self, format, text):
+        data = text.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", f"{_CONTENT_TYPES[format]}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _job_and_format(self, job_id, query):
+        job = self.server.service.get(job_id)
+        if job is None:
+            self._send_json(404, {"error": f"Unknown job: {job_id}"})
+            return None, None
+        format = query.get("format", [job.formats[0]])[0]
+        if format not in job.outputs:
+            self._send_json(400, {"error": f"Job {job_id} has no {format} output"})
+            return None, None
+        return job, format
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [part for part in url.path.split("/") if part]
+        service = self.server.service
+
+        if parts == ["health"]:
+            return self._send_json(200, service.health())
+        if parts == ["queue"]:
+            return self._send_json(200, service.queue_stats())
+        if len(parts) == 2 and parts[0] == "jobs":
+            job = service.get(parts[1])
+            if job is None:
+                return self._send_json(404, {"error": f"Unknown job: {parts[1]}"})
+            return self._send_json(200, job.describe())
+        if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "result":
+            job, format = self._job_and_format(parts[1], query)
+            if job is None:
+                return
+            if query.get("wait", ["0"])[0] not in ("0", ""):
+                with job.changed:
+                    job.changed.wait_for(job.is_finished)
+            if job.status == FAILED:
+                return self._send_json(500, job.describe())
+            if job.status != DONE:
+                return self._send_json(202, job.describe())
+            return self._send_text(format, job.outputs[format].getvalue())
+        if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "stream":
+            job, format = self._job_and_format(parts[1], query)
+            if job is None:
+                return
+            return self._stream(job, format)
+        self._send_json(404, {"error": f"Not found: {url.path}"})
+
+    def _stream(self, job, format):
+        self.send_response(200)
+        self.send_header("Content-Type", f"{_CONTENT_TYPES[format]}; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        output = job.outputs[format]
+        index = 0
+        while True:
+            with job.changed:
+                job.changed.wait_for(lambda: output.read_from(index)[1] > index or job.is_finished())
+                text, index = output.read_from(index)
+                finished = job.is_finished()
+            if text:
+                data = text.encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+            if finished:
+                break
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_POST(self):
+        if urlparse(self.path).path.rstrip("/") != "/jobs":
+            return self._send_json(404, {"error": f"Not found: {self.path}"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            job = self.server.service.submit(request["file"], request.get("formats", ["srt"]),
+                                             request.get("split_duration", 5), request.get("vad"))
+        except queue.Full:
+            return self._send_json(503, {"error": "Job queue is full"})
+        except (KeyError, TypeError, ValueError) as e:
+            return self._send_json(400, {"error": f"Invalid job: {e}"})
+        self._send_json(202, job.describe())
+
+
+class _UnixHTTPServer(ThreadingHTTPServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return request, ("local", 0)
+
+
+def make_server(address, service):
+    """Create the HTTP server of a service
+
+    Args:
+        address : "HOST:PORT" or "unix://PATH"
+        service : TranscriptionService
+
+    Returns:
+        server : call serve_forever() to run it
+
+    Raises:
+        OSError : if the address can't be bound
+        ValueError : if something other than a socket is at the UNIX socket path
+    """
+
+    if address.startswith("unix://"):
+        path = address[len("unix://"):]
+        remove_socket(path)
+        server = _UnixHTTPServer(path, _Handler)
+    else:
+        host, _, port = address.rpartition(":")
+        host = host or "127.0.0.1"
+        if host not in ("127.0.0.1", "localhost", "::1"):
+            _logger.warn(f"Serving on {host}: jobs can read any file this process can access")
+        server = ThreadingHTTPServer((host, int(port)), _Handler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def run_server(address, service):
+    """Serve a TranscriptionService until interrupted"""
+
+    server = make_server(address, service)
+    _logger.info(f"Serving on {address} with {service.models.size} models")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if address.startswith("unix://"):
+            remove_socket(address[len("unix://"):])
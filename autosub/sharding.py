@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import json
+import math
+from collections import namedtuple
+
+import numpy as np
+
+# Local imports
+import logger
+from segmentAudio import Segment
+from tokenTimeline import TokenTimeline
+from writeToFile import SubtitleWriter
+
+_logger = logger.setup_applevel_logger(__name__)
+
+# Transcript of one time window of an input: shard number (from 1) and number of shards,
+# [start, end) sample offsets of the window in the input, and the (start, end, tokens) of
+# every speech segment found in it, with sample offsets in the input
+ShardTranscript = namedtuple("ShardTranscript", ["index", "count", "window", "sampling_rate", "segments"])
+
+
+def plan_shards(duration, count, overlap):
+    """Cut the timeline of an input into count windows, at whole seconds, each reaching
+    about overlap / 2 seconds into its neighbours so that the speech at the cuts is
+    heard whole by at least one shard
+
+    Args:
+        duration : length of the input in seconds
+        count : number of shards
+        overlap : seconds of audio shared by neighbouring windows
+
+    Returns:
+        windows : list of (start, end) times in seconds
+    """
+
+    bounds = [0.0] + [float(round(duration * k / count)) for k in range(1, count)] + [duration]
+    windows = []
+    for k in range(count):
+        start = max(0.0, float(math.floor(bounds[k] - overlap / 2))) if k else 0.0
+        end = min(duration, bounds[k + 1] + math.ceil(overlap / 2)) if k < count - 1 else duration
+        windows.append((start, end))
+    return windows
+
+
+class ShardWriter(SubtitleWriter):
+    """Collects the transcript of a shard instead of writing subtitles, so the usual
+    extract, segment and transcribe flow can run on the window of a shard
+
+    Args:
+        index, count : shard number (from 1) and number of shards
+        window : [start, end) sample offsets of the window in the input
+        sampling_rate : sampling rate of the extracted audio
+    """
+
+    def __init__(self, index, count, window, sampling_rate=16000):
+        super().__init__({})
+        self.index = index
+        self.count = count
+        self.window = window
+        self.sampling_rate = sampling_rate
+        self.segments = []
+
+    def record_segments(self, segments):
+        pass
+
+    def write(self, cues, segment=None, tokens=None):
+        if segment is not None:
+            offset = self.window[0]
+            self.segments.append((segment.start + offset, segment.end + offset, tokens))
+
+    def transcript(self):
+        return ShardTranscript(self.index, self.count, self.window, self.sampling_rate, self.segments)
+
+
+def shard_file(directory, prefix, index, count):
+    """Path of the transcript of shard index of count of the input named prefix"""
+
+    return os.path.join(directory, f"{prefix}.shard-{index}-of-{count}.json")
+
+
+def write_shard(path, transcript):
+    """Save a ShardTranscript as JSON, replacing the file only once it is complete"""
+
+    data = {"shard": transcript.index, "shards": transcript.count, "window": list(transcript.window),
+            "sampling_rate": transcript.sampling_rate,
+            "segments": [[start, end, tokens.tokens()] for start, end, tokens in transcript.segments]}
+    with open(path + ".part", "w") as f:
+        json.dump(data, f)
+    os.replace(path + ".part", path)
+
+
+def read_shard(path):
+    """Load a ShardTranscript saved by write_shard
+
+    Raises:
+        OSError : if the file can't be read
+        ValueError : if it is not a shard transcript
+    """
+
+    with open(path) as f:
+        data = json.load(f)
+    try:
+        return ShardTranscript(data["shard"], data["shards"], tuple(data["window"]), data["sampling_rate"],
+                               [(start, end, TokenTimeline.from_tokens(tokens))
+                                for start, end, tokens in data["segments"]])
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"{path} is not a shard transcript") from e
+
+
+def find_shards(directory, prefix):
+    """Load the transcripts of every shard of the input named prefix
+
+    Returns:
+        shards : list of ShardTranscript, in timeline order
+
+    Raises:
+        OSError : if a transcript can't be read
+        ValueError : if shards are missing, or come from runs with different shard counts
+    """
+
+    pattern = re.compile(re.escape(prefix) + r"\.shard-(\d+)-of-(\d+)\.json$")
+    found = {}
+    for name in os.listdir(directory):
+        match = pattern.match(name)
+        if match:
+            found[int(match.group(1)), int(match.group(2))] = os.path.join(directory, name)
+    counts = {count for _, count in found}
+    if not counts:
+        raise ValueError(f"No shard transcripts of {prefix} in {directory}")
+    if len(counts) > 1:
+        raise ValueError(f"Shard transcripts of {prefix} from runs with {sorted(counts)} shards in {directory}")
+    count = counts.pop()
+    missing = [index for index in range(1, count + 1) if (index, count) not in found]
+    if missing:
+        raise ValueError(f"Missing shards {missing} of {count} of {prefix} in {directory}")
+    return [read_shard(found[index, count]) for index in range(1, count + 1)]
+
+
+def _silent_cut(left, right, overlap_start, overlap_end):
+    """Sample offset inside the overlap of two shards where neither found speech, as close
+    to the middle of the overlap as possible, or None if speech runs through it"""
+
+    busy = sorted((max(start, overlap_start), min(end, overlap_end)) for start, end, _ in left + right
+                  if start < overlap_end and end > overlap_start)
+    gaps, position = [], overlap_start
+    for start, end in busy:
+        if start > position:
+            gaps.append((position, start))
+        position = max(position, end)
+    if not gaps:
+        return None
+    middle = (overlap_start + overlap_end) / 2
+    start, end = min(gaps, key=lambda gap: abs((gap[0] + gap[1]) / 2 - middle))
+    return (start + end) // 2
+
+
+def _word_cut(segment, overlap_start, overlap_end, sampling_rate):
+    """Sample offset between two words of a segment, inside the overlap of two shards and
+    as close to its middle as possible, so that the earlier word ends in the window of the
+    earlier shard and the later word starts in that of the later shard. The middle of the
+    overlap if there is no such gap."""
+
+    middle = (overlap_start + overlap_end) // 2
+    if segment is None:
+        return middle
+    start, _, tokens = segment
+    spaces = tokens.spaces[(tokens.spaces > 0) & (tokens.spaces < len(tokens) - 1)]
+    times = start + tokens.starts.astype(np.float64) * sampling_rate
+    # from the last token of a word to the first of the next, within the overlap
+    gap_starts = np.maximum(times[spaces - 1], overlap_start)
+    gap_ends = np.minimum(times[spaces + 1], overlap_end)
+    inside = gap_starts < gap_ends
+    if not inside.any():
+        return middle
+    cuts = (gap_starts[inside] + gap_ends[inside]) / 2
+    return int(cuts[np.argmin(np.abs(cuts - middle))])
+
+
+def _split_words(start, tokens, cut, sampling_rate):
+    """Split the tokens of a segment starting at sample start into the words starting
+    before sample cut and those starting at or after it, a word going with its first token
+
+    Returns:
+        before, after : the earlier words are tokens[:before] and the later ones tokens[after:],
+                        without the spaces at the cut
+    """
+
+    times = start + tokens.starts.astype(np.float64) * sampling_rate
+    i = int(np.searchsorted(times, cut))
+    if 0 < i < len(tokens) and tokens.chars[i - 1] != " " and tokens.chars[i] != " ":
+        # the word around the cut started before it
+        later = tokens.spaces[np.searchsorted(tokens.spaces, i):]
+        i = int(later[0]) if len(later) else len(tokens)
+    before = len(tokens.chars[:i].rstrip(" "))
+    after = len(tokens) - len(tokens.chars[i:].lstrip(" "))
+    return before, after
+
+
+def _join_words(left, right, cut, sampling_rate):
+    """One segment holding the words of the segment left (of the earlier shard) that start
+    before sample cut, and the words of the segment right (of the later shard) from the cut.
+    Either can be None."""
+
+    # the words before the cut belong to the earlier shard
+    start = left[0] if left is not None else cut
+    end = right[1] if right is not None else cut
+    tokens = TokenTimeline("", [])
+    if left is not None:
+        before, _ = _split_words(left[0], left[2], cut, sampling_rate)
+        tokens = left[2][:before]
+    if right is not None:
+        _, after = _split_words(right[0], right[2], cut, sampling_rate)
+        part = right[2][after:]
+        if len(tokens) and len(part):
+            # keep the word boundary in front of the first word, or add one at its time
+            part = right[2][after - 1:] if after else TokenTimeline(" ", part.starts[:1]) + part
+        shift = np.float32((right[0] - start) / sampling_rate)
+        tokens = tokens + TokenTimeline(part.chars, part.starts + shift)
+    return start, end, tokens
+
+
+def _join(left, right, overlap_start, overlap_end, sampling_rate):
+    """Join the segments of two neighbouring shards that share [overlap_start, overlap_end)"""
+
+    if overlap_start >= overlap_end:
+        return left + right
+    cut = _silent_cut(left, right, overlap_start, overlap_end)
+    if cut is not None:
+        # both shards found the same silence: each segment is whole on one side of it
+        return [s for s in left if s[1] <= cut] + [s for s in right if s[0] >= cut]
+
+    # speech runs through the overlap: cut between two words, and keep every word once,
+    # from the shard that heard it whole, by the time of its first token
+    middle = (overlap_start + overlap_end) // 2
+    cut = _word_cut(next((s for s in left if s[0] < middle < s[1]), None), overlap_start, overlap_end,
+                    sampling_rate)
+    _logger.info(f"No silence shared by shards at {cut / sampling_rate:.1f}s, joining them word by word")
+    straddling_left = next((s for s in left if s[0] < cut < s[1]), None)
+    # the later shard may have found the speech starting right at the cut
+    straddling_right = next((s for s in right if s[0] <= cut < s[1]), None)
+    joined = [s for s in left if s[1] <= cut]
+    if straddling_left is not None or straddling_right is not None:
+        segment = _join_words(straddling_left, straddling_right, cut, sampling_rate)
+        if len(segment[2]):
+            joined.append(segment)
+    return joined + [s for s in right if s[0] >= cut and s is not straddling_right]
+
+
+def merge_shards(shards):
+    """Reconcile the transcripts of the shards of an input into the transcript of the
+    whole input. In the overlap of two shards, the cut is made in a silence both found,
+    so every segment comes whole from one shard. If speech runs through the overlap, the
+    segments around it are joined word by word at a gap between two words: words starting
+    before it come from the earlier shard, the others from the later one, so words heard
+    twice are kept once and words cut by a window edge are taken from the other shard.
+
+    Args:
+        shards : list of ShardTranscript, in timeline order
+
+    Returns:
+        transcript : list of (segmentAudio.Segment, tokenTimeline.TokenTimeline) in timeline
+                     order, the segments hold no audio
+    """
+
+    sampling_rate = shards[0].sampling_rate
+    segments = list(shards[0].segments)
+    for previous, shard in zip(shards, shards[1:]):
+        segments = _join(segments, list(shard.segments), shard.window[0], previous.window[1], sampling_rate)
+    return [(Segment(start, end, sampling_rate, None), tokens) for start, end, tokens in segments]
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+
+class TokenTimeline:
+    """The transcript of a segment, copied out of the STT metadata once: its token
+    characters, their start times in seconds from the segment start (float32, the
+    precision of the STT metadata) and the indices of the word boundaries (space tokens).
+    Coqui STT tokens are single characters.
+    """
+
+    __slots__ = ("chars", "starts", "spaces")
+
+    def __init__(self, chars, starts):
+        starts = np.asarray(starts, dtype=np.float32)
+        if len(chars) != len(starts):
+            raise ValueError(f"{len(chars)} token characters for {len(starts)} start times")
+        self.chars = chars
+        self.starts = starts
+        self.spaces = np.flatnonzero(np.frombuffer(chars.encode("utf-32-le"), dtype="<u4") == ord(" "))
+
+    @classmethod
+    def from_metadata(cls, metadata):
+        """Timeline of the best transcript of sttWithMetadata() (or of a stream)"""
+
+        tokens = metadata.transcripts[0].tokens
+        return cls("".join([token.text for token in tokens]), [token.start_time for token in tokens])
+
+    @classmethod
+    def from_tokens(cls, tokens):
+        """Timeline of a list of (text, start_time) tuples"""
+
+        return cls("".join([text for text, _ in tokens]), [start_time for _, start_time in tokens])
+
+    def tokens(self):
+        """The timeline as a list of (text, start_time) tuples"""
+
+        return list(zip(self.chars, self.starts.tolist()))
+
+    def __len__(self):
+        return len(self.chars)
+
+    def __getitem__(self, index):
+        """Timeline of a slice of the tokens"""
+
+        if not isinstance(index, slice):
+            raise TypeError("TokenTimeline only supports slicing")
+        return TokenTimeline(self.chars[index], self.starts[index])
+
+    def __add__(self, other):
+        return TokenTimeline(self.chars + other.chars, np.concatenate([self.starts, other.starts]))
+
+    def startswith(self, prefix):
+        """Whether the timeline begins with the tokens of prefix, at the same times"""
+
+        return (self.chars.startswith(prefix.chars) and
+                np.array_equal(self.starts[:len(prefix)], prefix.starts))
+
+    def __eq__(self, other):
+        return (isinstance(other, TokenTimeline) and self.chars == other.chars and
+                np.array_equal(self.starts, other.starts))
+
+    def split(self, split_duration):
+        """Split the transcript into subtitle lines: a line ends at the first word boundary
+        more than split_duration seconds after the end of the previous line, or at the
+        last token
+
+        Args:
+            split_duration : longest line in seconds, though a word is never cut
+
+        Returns:
+            lines : list of (first, last) token index ranges, last excluded
+        """
+
+        if not len(self.chars):
+            return []
+        # the same float64 arithmetic as comparing the start times one by one
+        boundaries = self.starts[self.spaces].astype(np.float64)
+        lines = []
+        first, boundary, previous_end = 0, 0, 0.0
+        while True:
+            later = np.flatnonzero(boundaries[boundary:] - previous_end > split_duration)
+            if not len(later):
+                break
+            boundary += later[0]
+            last = int(self.spaces[boundary]) + 1
+            lines.append((first, last))
+            first, previous_end = last, float(boundaries[boundary])
+            boundary += 1
+        if first < len(self.chars):
+            lines.append((first, len(self.chars)))
+        return lines
@@ -2,7 +2,6 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
-import sklearn.svm
 
 eps = 0.00000001
 shortTermStep = 0.050
@@ -31,9 +30,14 @@ def train_svm(features, c_param, kernel='linear'):
         For a different kernel, other types of parameters should be provided.
     """
 
+    # sklearn takes over a second to import, only the svm VAD needs it
+    import sklearn.svm
+
     feature_matrix, labels = features_to_matrix(features)
+    # probability=True calibrates with a random cross-validation, seed it so the
+    # same audio always gives the same segments (which resuming relies on)
     svm = sklearn.svm.SVC(C=c_param, kernel=kernel, probability=True,
-                          gamma='auto')
+                          gamma='auto', random_state=0)
     svm.fit(feature_matrix, labels)
     return svm
 
@@ -64,12 +68,7 @@ def normalize_features(features):
     mean = np.mean(temp_feats, axis=0) + 1e-14
     std = np.std(temp_feats, axis=0) + 1e-14
 
-    features_norm = []
-    for f in features:
-        ft = f.copy()
-        for n_samples in range(f.shape[0]):
-            ft[n_samples, :] = (ft[n_samples, :] - mean) / std
-        features_norm.append(ft)
+    features_norm = [(f - mean) / std for f in features]
     return features_norm, mean, std
 
 
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+import numpy as np
+
+# Local imports
+from tokenTimeline import TokenTimeline
+
+DEFAULT_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "autosub", "transcripts.sqlite")
+
+# Separates the token texts of a transcript in the texts column
+_SEPARATOR = "\x1f"
+
+
+def model_identity(*paths):
+    """Identify model files by path, size and modification time, so replacing a model
+    or scorer file invalidates the transcripts inferred with the old one
+
+    Args:
+        paths : model and scorer files (missing files are identified by path only)
+
+    Returns:
+        identity : bytes digest
+    """
+
+    digest = hashlib.sha256()
+    for path in paths:
+        path = os.path.abspath(path) if path else ""
+        try:
+            stat = os.stat(path)
+            digest.update(f"{path}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+        except OSError:
+            digest.update(f"{path}\n".encode())
+    return digest.digest()
+
+
+class TranscriptCache:
+    """On-disk cache of the tokens inferred for a segment, keyed by a hash of the segment
+    PCM and of the model and scorer identity. Entries are evicted least recently used
+    first once the stored tokens exceed max_bytes. Safe to share between threads, and
+    between processes using the same file.
+    """
+
+    def __init__(self, path, model, scorer, max_bytes=512 * 1024 ** 2):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.model_key = model_identity(model, scorer)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS transcripts (key BLOB PRIMARY KEY, texts TEXT, "
+                         "starts BLOB, size INTEGER, last_used REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS transcripts_last_used ON transcripts (last_used)")
+        # total size of the stored tokens, kept in the file as processes running
+        # --shards share the cache, and updated in the transaction of every change
+        self._db.execute("CREATE TABLE IF NOT EXISTS total (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER)")
+        self._db.execute("INSERT OR IGNORE INTO total VALUES (0, (SELECT COALESCE(SUM(size), 0) FROM transcripts))")
+        self._size = self._db.execute("SELECT size FROM total").fetchone()[0]
+
+    def key(self, audio):
+        """Cache key of a segment
+
+        Args:
+            audio : int16 segment samples
+
+        Returns:
+            key : bytes digest
+        """
+
+        digest = hashlib.sha256(self.model_key)
+        digest.update(np.ascontiguousarray(audio, dtype=np.int16))
+        return digest.digest()
+
+    def get(self, audio):
+        """Look up the tokens of a segment
+
+        Args:
+            audio : int16 segment samples
+
+        Returns:
+            tokens : tokenTimeline.TokenTimeline, or None on a miss
+        """
+
+        key = self.key(audio)
+        with self._lock:
+            row = self._db.execute("SELECT texts, starts FROM transcripts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute("UPDATE transcripts SET last_used = ? WHERE key = ?", (time.time(), key))
+        texts, starts = row
+        return TokenTimeline("".join(texts.split(_SEPARATOR)), np.frombuffer(starts, dtype=np.float64))
+
+    def put(self, audio, tokens):
+        """Store the tokens of a segment, then evict the least recently used entries
+        over the size limit
+
+        Args:
+            audio : int16 segment samples
+            tokens : tokenTimeline.TokenTimeline (see inference.ds_transcribe)
+        """
+
+        texts = _SEPARATOR.join(tokens.chars)
+        starts = tokens.starts.astype(np.float64).tobytes()
+        size = len(texts.encode()) + len(starts)
+        key = self.key(audio)
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so other processes can't change the total in between
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                previous = self._db.execute("SELECT size FROM transcripts WHERE key = ?", (key,)).fetchone()
+                self._db.execute("INSERT OR REPLACE INTO transcripts VALUES (?, ?, ?, ?, ?)",
+                                 (key, texts, starts, size, time.time()))
+                self._db.execute("UPDATE total SET size = size + ?", (size - (previous[0] if previous else 0),))
+                self._size = self._db.execute("SELECT size FROM total").fetchone()[0]
+                if self._size > self.max_bytes:
+                    self._evict()
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _evict(self):
+        # drop the oldest entries down to 90% of the limit, so eviction doesn't run on every put
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for key, size in self._db.execute("SELECT key, size FROM transcripts ORDER BY last_used").fetchall():
+            if self._size - removed <= target:
+                break
+            self._db.execute("DELETE FROM transcripts WHERE key = ?", (key,))
+            removed += size
+        self._db.execute("UPDATE total SET size = size - ?", (removed,))
+        self._size -= removed
+
+    def summary(self):
+        """One line hit/miss summary of the run"""
+
+        lookups = self.hits + self.misses
+        rate = 100.0 * self.hits / lookups if lookups else 0.0
+        with self._lock:
+            # other processes may have changed it since our last put
+            self._size = self._db.execute("SELECT size FROM total").fetchone()[0]
+        return (f"Transcript cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate), "
+                f"{self._size / 1024 ** 2:.2f} MB in {self.path}")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
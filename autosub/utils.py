@@ -4,12 +4,15 @@
 import re
 import os
 import sys
+import stat
 import shutil
+import tempfile
+import contextlib
 import subprocess
-from stt import Model as SModel
 
 # Local package
 import logger
+import profiler
 
 _logger = logger.setup_applevel_logger(__name__)
 _models = {
@@ -51,6 +54,44 @@ def clean_folder(folder):
             _logger.warn(f"Failed to delete {file_path}. Reason: {e}")
 
 
+@contextlib.contextmanager
+def scratch_directory(base=None):
+    """Private temporary directory of a run, deleted with its contents on exit,
+    so that concurrent runs never touch each other's files
+
+    Args:
+        base : directory to create it in (eg, a tmpfs), defaults to the system temp directory
+
+    Yields:
+        path of the directory
+    """
+
+    if base is not None:
+        os.makedirs(base, exist_ok=True)
+    path = tempfile.mkdtemp(prefix="autosub-", dir=base)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def remove_socket(path):
+    """Remove the UNIX socket at path (left by an earlier run, or ours once closed),
+    refusing to remove anything else
+
+    Raises:
+        ValueError : if path exists and is not a socket
+    """
+
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise ValueError(f"{path} exists and is not a socket")
+    os.remove(path)
+
+
 def download_model(engine, fname):
     """Download model files, if not available locally
 
@@ -124,14 +165,17 @@ def create_model(engine, model, scorer):
         scorer : .scorer file
     """
 
-    try:
-        ds = SModel(model)
-    except:
-        _logger.error("Invalid model file")
-        sys.exit(1)
+    with profiler.stage("model_load"):
+        # stt loads TensorFlow Lite, so only import it once a model is needed
+        from stt import Model as SModel
+        try:
+            ds = SModel(model)
+        except:
+            _logger.error("Invalid model file")
+            sys.exit(1)
 
-    try:
-        ds.enableExternalScorer(scorer)
-    except:
-        _logger.warn("Invalid scorer file. Running inference using only model file")
+        try:
+            ds.enableExternalScorer(scorer)
+        except:
+            _logger.warn("Invalid scorer file. Running inference using only model file")
     return(ds)
@@ -1,68 +1,295 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import datetime
+import os
+import json
+import time
+from collections import namedtuple
 
+# Local imports
+import logger
+from tokenTimeline import TokenTimeline
+
+_logger = logger.setup_applevel_logger(__name__)
+
+# Subtitle files are written through large buffers and only flushed when they are complete
+BUFFER_SIZE = 1024 * 1024
+
+HEADERS = {"vtt": "WEBVTT\nKind: captions\n\n"}
+
+
+class Cue(namedtuple("Cue", ["index", "start", "end", "text", "word_starts", "last"])):
+    """A subtitle line: its number, start and end in seconds, its text, the start times of
+    its words (the first one is the line start, VTT times the other words with them) and
+    whether it is the last line of its speech segment (TXT starts a paragraph after it)
+    """
+
+    __slots__ = ()
 
 
 def format_seconds(seconds, format=None):
     """Convert the timing limits into something that can be used by a subtitle file.
+    Hours are not wrapped after 24 hours.
 
     Args:
         seconds : timing limits
         format : subtitle format
     """
-    
-    fmt = '%H:%M:%S,%f' if format == "srt" else '%H:%M:%S.%f'
-    
-    # -3: cut microseconds to milliseconds
-    return datetime.datetime.fromtimestamp(seconds, tz=datetime.timezone.utc).strftime(fmt)[:-3]
-    
 
+    # rounded to microseconds, then cut to milliseconds
+    milliseconds = round(seconds * 1000000) // 1000
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    separator = "," if format == "srt" else "."
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+
+def render_srt(cue):
+    return f"{cue.index}\n{format_seconds(cue.start, 'srt')} --> {format_seconds(cue.end, 'srt')}\n{cue.text}\n\n"
+
+
+def render_vtt(cue):
+    # Write out WebVTT (Video Timed Text) format, where words may be associated with a timestamp cue so each
+    # word can be displayed by the player at a certain point (like YouTube autogenerated subtitles or karaoke
+    # song lyrics). The first line is for text without a cue, so it is left empty.
+    # The first word in any VTT subtitle from YouTube does not have a cue timing associated with it,
+    # presumably because it uses the timestamp of the subtitle line itself as the first cue.
+    # This approach is taken here too
+    words = cue.text.split(" ")
+    timed_words = "".join([f"<{format_seconds(start, 'vtt')}><c> {word}</c>"
+                           for start, word in zip(cue.word_starts[1:], words[1:])])
+    return (f"{format_seconds(cue.start, 'vtt')} --> {format_seconds(cue.end, 'vtt')} align:start position:0%\n"
+            f"\n{words[0]} {timed_words}\n\n")
+
+
+def render_txt(cue):
+    return cue.text + (". \n\n" if cue.last else ". ")
+
+
+RENDERERS = {"srt": render_srt, "vtt": render_vtt, "txt": render_txt}
+
+
+def render(cues, format):
+    """Text of a list of cues in a subtitle format, without the file header"""
+
+    return "".join([RENDERERS[format](cue) for cue in cues])
 
 
 def write_to_file(output_file_handle_dict, inferred_text, line_count, limits, cues):
-    """Write the inferred text to SRT file
-    Follows a specific format for SRT files
+    """Write the inferred text as one subtitle line in every format
 
     Args:
         output_file_handle_dict : Mapping of subtitle format (eg, 'srt') to open file_handle
         inferred_text : text to be written
         line_count : subtitle line count
         limits : starting and ending times for text
+        cues : start times of the words of the text
+    """
+
+    cue = Cue(line_count, limits[0], limits[1], inferred_text, tuple(cues), False)
+    for format, file_handle in output_file_handle_dict.items():
+        file_handle.write(RENDERERS[format](cue))
+
+
+class SubtitleWriter:
+    """Writes cues to open file-like outputs in every format, starting with the format's
+    header
+
+    Args:
+        outputs : Mapping of subtitle format (eg, 'srt') to file-like output
+        flush : flush the outputs after every write, for outputs read while they are
+                written (eg, live captions on stdout)
+    """
+
+    def __init__(self, outputs, flush=False):
+        self.outputs = outputs
+        self._flush = flush
+        for format, output in outputs.items():
+            if format in HEADERS:
+                output.write(HEADERS[format])
+            if flush:
+                output.flush()
+
+    def write(self, cues, segment=None, tokens=None):
+        """Write the cues of a segment, given with the segment and its tokens for writers
+        that journal them"""
+
+        for format, output in self.outputs.items():
+            output.write(render(cues, format))
+            if self._flush:
+                output.flush()
+
+    def flush(self):
+        """Push the cues written so far to the outputs, for readers of partial output"""
+
+        for output in self.outputs.values():
+            output.flush()
+
+    def record_tokens(self, segment, tokens):
+        pass
+
+    def close(self, commit=True):
+        pass
+
+
+class SubtitleFiles(SubtitleWriter):
+    """Writes the subtitle files <prefix>.<format> of an input in a directory
+
+    The files are written through large buffers to <file>.part and renamed over their
+    final name once complete, so a subtitle file is either absent or whole. Instead of
+    flushing every line, the progress of the run is appended to a journal
+    (.<prefix>.journal): a header identifying the run, the segmentation result, then the
+    tokens of every segment as it is written. The journal is synced to disk at most every
+    checkpoint_interval seconds, so a crash loses at most that much inference, and a
+    resumed run (see read_journal) rebuilds the same output from it.
+
+    Args:
+        directory : output directory
+        prefix : name of the subtitle files, without extension
+        formats : subtitle formats (eg, ['srt', 'vtt'])
+        checkpoint_interval : seconds between journal syncs
+        header : JSON-serializable description of the run, written first in the journal
+        progress : (opt) Progress read from the journal of an interrupted run, which is
+                   appended to instead of being replaced
+    """
+
+    def __init__(self, directory, prefix, formats, checkpoint_interval=10.0, header=None, progress=None):
+        os.makedirs(directory, exist_ok=True)
+        self.paths = {format: os.path.join(directory, f"{prefix}.{format}") for format in formats}
+        self.journal_path = journal_file(directory, prefix)
+        self.checkpoint_interval = checkpoint_interval
+        # segments whose tokens are already in the journal
+        self._journaled = set(progress.tokens) if progress is not None else set()
+        outputs = {}
+        try:
+            for format, path in self.paths.items():
+                outputs[format] = open(path + ".part", "w", buffering=BUFFER_SIZE)
+            self._journal = open(self.journal_path, "w" if progress is None else "a", buffering=BUFFER_SIZE)
+        except OSError:
+            for output in outputs.values():
+                output.close()
+                os.remove(output.name)
+            raise
+        self._last_checkpoint = time.monotonic()
+        self._progress = progress is not None
+        if progress is None:
+            # sync the header at once: a --pipeline run journals no segmentation, and its
+            # first checkpoint is checkpoint_interval seconds away
+            self._record({"header": header})
+            self.checkpoint()
+        super().__init__(outputs)
+
+    def _record(self, entry):
+        self._journal.write(json.dumps(entry) + "\n")
+
+    def record_segments(self, segments):
+        """Journal the segmentation result, and sync it as it is costly to recompute
+
+        Args:
+            segments : list of segmentAudio.Segment
+        """
+
+        sampling_rate = segments[0].sampling_rate if segments else None
+        self._record({"segments": [[segment.start, segment.end] for segment in segments],
+                      "sampling_rate": sampling_rate})
+        self._progress = True
+        self.checkpoint()
+
+    def write(self, cues, segment=None, tokens=None):
+        super().write(cues)
+        if segment is not None:
+            self.record_tokens(segment, tokens)
+
+    def record_tokens(self, segment, tokens):
+        """Journal the tokens of a segment, once. Called by write(), or earlier by
+        transcription that finishes segments out of order."""
+
+        if (segment.start, segment.end) in self._journaled:
+            return
+        # one line per segment, the cues are rebuilt from the tokens
+        self._record({"segment": [segment.start, segment.end], "tokens": tokens.tokens()})
+        self._journaled.add((segment.start, segment.end))
+        self._progress = True
+        if time.monotonic() - self._last_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Sync the journal to disk"""
+
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._last_checkpoint = time.monotonic()
+
+    def close(self, commit=True):
+        """Finish the subtitle files
+
+        Args:
+            commit : rename the complete files to their final names and remove the journal.
+                     If False (the run failed), the partial files are removed and the
+                     journal is kept.
+        """
+
+        if commit:
+            for format, output in self.outputs.items():
+                output.flush()
+                os.fsync(output.fileno())
+                output.close()
+                os.replace(output.name, self.paths[format])
+                _logger.info(f"{format.upper()}, file saved to, {self.paths[format]}")
+            self._journal.close()
+            os.remove(self.journal_path)
+        else:
+            self.checkpoint()
+            self._journal.close()
+            for output in self.outputs.values():
+                output.close()
+                os.remove(output.name)
+            if self._progress:
+                _logger.info(f"Progress saved to {self.journal_path}, rerun with --resume to continue")
+            else:
+                os.remove(self.journal_path)
+
+
+# Content of a journal: header of the run, segment limits in samples (None if the
+# segmentation was not journaled) and their sampling rate, and the tokens of every
+# journaled segment keyed by its (start, end) limits
+Progress = namedtuple("Progress", ["header", "segments", "sampling_rate", "tokens"])
+
+
+def journal_file(directory, prefix):
+    """Path of the journal of the subtitle files <prefix>.<format>"""
+
+    return os.path.join(directory, f".{prefix}.journal")
+
+
+def read_journal(path):
+    """Read a journal written by SubtitleFiles, up to its last complete line
+
+    Returns:
+        progress : Progress
+
+    Raises:
+        OSError : if the journal can't be read
+        ValueError : if it is not a journal
     """
 
-    for format in output_file_handle_dict.keys():
-        from_dur = format_seconds(limits[0], format)
-        to_dur = format_seconds(limits[1], format)
-
-        file_handle = output_file_handle_dict[format]
-        if format == 'srt':
-            file_handle.write(str(line_count) + "\n")
-            file_handle.write(from_dur + " --> " + to_dur + "\n")
-            file_handle.write(inferred_text + "\n\n")
-        elif format == 'vtt':
-            file_handle.write(from_dur + " --> " + to_dur + " align:start position:0%\n")
-            # Write out WebVTT (Video Timed Text) format, where words may be associated with a timestamp cue so each
-            # word can be displayed by the player at a certain point (like YouTube autogenerated subtitles or karaoke
-            # song lyrics).
-            # Insert an empty line as the first line is for text without a cue
-            file_handle.write("\n")
-            words = inferred_text.split(" ")
-            # The first word in any VTT subtitle from YouTube does not have a cue timing associated with it,
-            # presumably because it uses the timestamp of the subtitle line itself as the first cue.
-            # This approach is taken here too
-            file_handle.write(words[0] + " ")
-            cue_timed_text = ""
-            for pair in zip(cues[1:], words[1:]):
-                timestamp = format_seconds(pair[0], "vtt")
-                word = pair[1]
-                cue_timed_text += f"<{timestamp}><c> {word}</c>".format(timestamp=timestamp, word=word)
-
-            # Insert the cue timed text
-            file_handle.write(cue_timed_text + "\n\n")
-        elif format == 'txt':
-            file_handle.write(inferred_text + ". ")
-
-        # write to disk often, so we dont lose output on crash
-        file_handle.flush()
+    header, segments, sampling_rate, tokens = None, None, None, {}
+    with open(path) as f:
+        for number, line in enumerate(f):
+            if not line.endswith("\n"):
+                # cut short by a crash
+                break
+            entry = json.loads(line)
+            if number == 0:
+                if "header" not in entry:
+                    raise ValueError(f"{path} is not a journal")
+                header = entry["header"]
+            elif "segments" in entry:
+                segments = [tuple(limits) for limits in entry["segments"]]
+                sampling_rate = entry["sampling_rate"]
+            elif "segment" in entry:
+                tokens[tuple(entry["segment"])] = TokenTimeline.from_tokens(entry["tokens"])
+    if header is None:
+        raise ValueError(f"{path} is empty")
+    return Progress(header, segments, sampling_rate, tokens)
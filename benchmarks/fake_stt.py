@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Deterministic local stand-in for stt.Model (Coqui STT), so inference can
+be benchmarked and exercised without network access or model files.
+
+Audio is cut in 100 ms steps; every run of loud steps becomes a word, with
+one letter per step derived from the step's loudness. Tokens carry start
+times like the real metadata, and the same audio always gives the same
+transcript. An optional delay emulates the cost of real inference: like the
+acoustic model of the real engine, a stream pays it as audio is fed, and its
+intermediate decodes are cheap.
+"""
+
+import time
+
+import numpy as np
+
+STEP = 0.1
+LOUD = 500
+
+
+class Token:
+    def __init__(self, text, timestep, start_time):
+        self.text = text
+        self.timestep = timestep
+        self.start_time = start_time
+
+
+class CandidateTranscript:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.confidence = -float(len(tokens))
+
+
+class Metadata:
+    def __init__(self, tokens):
+        self.transcripts = [CandidateTranscript(tokens)]
+
+
+def decode(audio, sampling_rate=16000):
+    """Token list of the fake transcript of int16 audio"""
+
+    audio = np.asarray(audio, dtype=np.float64)
+    step = int(STEP * sampling_rate)
+    n_steps = len(audio) // step
+    tokens = []
+    in_word = False
+    for i in range(n_steps):
+        rms = np.sqrt(np.mean(audio[i * step:(i + 1) * step] ** 2))
+        start_time = float(np.float32(i * STEP))
+        if rms > LOUD:
+            if not in_word and tokens:
+                tokens.append(Token(" ", i * 50, start_time))
+            tokens.append(Token(chr(ord("a") + int(rms) % 26), i * 50, start_time))
+            in_word = True
+        else:
+            in_word = False
+    return tokens
+
+
+class Stream:
+    """Stand-in for stt.Stream"""
+
+    def __init__(self, model):
+        self.model = model
+        self.blocks = []
+
+    def feedAudioContent(self, audio):
+        if self.model.delay:
+            time.sleep(self.model.delay * len(audio) / 16000.0)
+        self.blocks.append(np.array(audio, dtype=np.int16))
+
+    def _audio(self):
+        return np.concatenate(self.blocks) if self.blocks else np.zeros(0, np.int16)
+
+    def intermediateDecode(self):
+        return "".join(token.text for token in self.intermediateDecodeWithMetadata().transcripts[0].tokens)
+
+    def intermediateDecodeWithMetadata(self, num_results=1):
+        return Metadata(decode(self._audio()))
+
+    def finishStreamWithMetadata(self, num_results=1):
+        metadata = self.intermediateDecodeWithMetadata(num_results)
+        self.blocks = []
+        return metadata
+
+    def finishStream(self):
+        return "".join(token.text for token in self.finishStreamWithMetadata().transcripts[0].tokens)
+
+    def freeStream(self):
+        self.blocks = []
+
+
+class Model:
+    """Stand-in for stt.Model
+
+    Args:
+        model_path : ignored, kept for signature compatibility
+        delay : seconds of simulated compute per second of audio
+    """
+
+    def __init__(self, model_path=None, delay=0.0):
+        self.model_path = model_path
+        self.delay = delay
+        self.scorer = None
+
+    def enableExternalScorer(self, scorer_path):
+        self.scorer = scorer_path
+
+    def sampleRate(self):
+        return 16000
+
+    def sttWithMetadata(self, audio, num_results=1):
+        if self.delay:
+            time.sleep(self.delay * len(audio) / 16000.0)
+        return Metadata(decode(audio))
+
+    def stt(self, audio):
+        return "".join(token.text for token in self.sttWithMetadata(audio).transcripts[0].tokens)
+
+    def createStream(self):
+        return Stream(self)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Segmentation speed and boundary agreement of each feature profile
+against the "full" profile, on synthetic speech-like audio.
+
+    $ python3 benchmarks/feature_profiles.py --duration 600
+"""
+
+import argparse
+
+from common import synth_speech, timed, segment_agreement, preload_dependencies, SAMPLE_RATE
+
+import featureExtraction as FE
+from segmentAudio import silence_removal
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark VAD feature profiles")
+    parser.add_argument("--duration", type=float, default=300, help="Length of the test audio in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic audio")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions, the best is reported")
+    args = parser.parse_args()
+    preload_dependencies()
+
+    signal, _ = synth_speech(args.duration, seed=args.seed)
+    reference, full_time = timed(silence_removal, signal, SAMPLE_RATE, 0.05, 0.05, 1.0, 0.2,
+                                 profile="full", repeat=args.repeat)
+
+    print(f"{'profile':<22}{'time (s)':>10}{'speedup':>9}{'agreement':>11}{'bound err (s)':>15}{'segments':>10}")
+    for profile in FE.FEATURE_PROFILES:
+        if profile == "full":
+            seg_limits, elapsed = reference, full_time
+        else:
+            seg_limits, elapsed = timed(silence_removal, signal, SAMPLE_RATE, 0.05, 0.05, 1.0, 0.2,
+                                        profile=profile, repeat=args.repeat)
+        stats = segment_agreement(reference, seg_limits, args.duration)
+        print(f"{profile:<22}{elapsed:>10.3f}{full_time / elapsed:>9.2f}{stats['frame_agreement']:>11.4f}"
+              f"{stats['boundary_error']:>15.3f}{stats['n_hypothesis']:>10d}")
+
+
+if __name__ == "__main__":
+    main()
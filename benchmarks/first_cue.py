@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Time to first cue of whole-segment inference against --stream-inference, on
+synthetic continuous speech whose pauses are too short for silence detection
+to split it, so the speech is one long monologue. For each chunk length it also
+reports the total inference time, the longest single call into the model and
+whether the subtitles are the same as with whole-segment inference. The
+stand-in model takes --stt-delay seconds per second of audio.
+
+    $ python3 benchmarks/first_cue.py --duration 120 --chunks 10 5 2
+"""
+
+import io
+import time
+import argparse
+
+from common import synth_speech, preload_dependencies, SAMPLE_RATE
+import fake_stt
+
+from segmentAudio import detect_speech, Segment
+from inference import ds_process_audio, stream_process_audio
+from writeToFile import SubtitleWriter
+
+FORMATS = ["srt", "vtt", "txt"]
+
+
+class TimedModel(fake_stt.Model):
+    """Stand-in model recording the duration of every call that runs inference"""
+
+    def __init__(self, delay):
+        super().__init__(delay=delay)
+        self.calls = []
+
+    def _timed(self, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.calls.append(time.perf_counter() - start)
+        return result
+
+    def sttWithMetadata(self, audio, num_results=1):
+        return self._timed(super().sttWithMetadata, audio, num_results)
+
+    def createStream(self):
+        return TimedStream(self)
+
+
+class TimedStream(fake_stt.Stream):
+
+    def feedAudioContent(self, audio):
+        return self.model._timed(super().feedAudioContent, audio)
+
+    def intermediateDecodeWithMetadata(self, num_results=1):
+        return self.model._timed(super().intermediateDecodeWithMetadata, num_results)
+
+
+class FirstCueWriter(SubtitleWriter):
+    """Writer to memory noting when the first cue is written"""
+
+    def __init__(self):
+        super().__init__({fmt: io.StringIO() for fmt in FORMATS})
+        self.first_cue = None
+
+    def write(self, cues, segment=None, tokens=None):
+        if cues and self.first_cue is None:
+            self.first_cue = time.perf_counter()
+        super().write(cues)
+
+
+def transcribe(segments, delay, split_duration, chunk_seconds=None):
+    ds = TimedModel(delay)
+    writer = FirstCueWriter()
+    line_count = 1
+    start = time.perf_counter()
+    for segment in segments:
+        if chunk_seconds is None:
+            line_count = ds_process_audio(ds, segment, writer, split_duration, line_count)
+        else:
+            line_count = stream_process_audio(ds, segment, writer, split_duration, chunk_seconds, line_count)
+    elapsed = time.perf_counter() - start
+    first_cue = writer.first_cue - start if writer.first_cue is not None else None
+    outputs = {fmt: output.getvalue() for fmt, output in writer.outputs.items()}
+    return first_cue, elapsed, max(ds.calls, default=0.0), line_count - 1, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the time to first cue of streamed inference")
+    parser.add_argument("--duration", type=float, default=120, help="Length of the test audio in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic audio")
+    parser.add_argument("--chunks", type=float, nargs="+", default=[10, 5, 2],
+                        help="Values of --stream-inference to compare")
+    parser.add_argument("--split-duration", dest="split_duration", type=float, default=5,
+                        help="Subtitle line length in seconds")
+    parser.add_argument("--stt-delay", dest="stt_delay", type=float, default=0.1,
+                        help="Simulated inference seconds per second of audio")
+    args = parser.parse_args()
+    preload_dependencies()
+
+    signal, _ = synth_speech(args.duration, seed=args.seed, gaps=(0.02, 0.2))
+    seg_limits = detect_speech(signal, SAMPLE_RATE, 0.05, 0.05, 1.0, 0.2)
+    segments = []
+    for start, end in seg_limits:
+        start, end = int(start * SAMPLE_RATE), int(end * SAMPLE_RATE)
+        segments.append(Segment(start, end, SAMPLE_RATE, signal[start:end]))
+    longest = max((segment.duration for segment in segments), default=0.0)
+    print(f"{len(segments)} segments, longest {longest:.1f} s")
+
+    print(f"{'inference':<16}{'first cue (s)':>15}{'total (s)':>11}{'longest call (s)':>18}{'lines':>7}"
+          f"{'same output':>13}")
+    baseline = None
+    for chunk_seconds in [None] + args.chunks:
+        first_cue, elapsed, longest_call, lines, outputs = transcribe(segments, args.stt_delay,
+                                                                      args.split_duration, chunk_seconds)
+        if baseline is None:
+            baseline = outputs
+        name = "whole segment" if chunk_seconds is None else f"stream {chunk_seconds:g} s"
+        first_cue = f"{first_cue:.3f}" if first_cue is not None else "-"
+        print(f"{name:<16}{first_cue:>15}{elapsed:>11.3f}{longest_call:>18.3f}{lines:>7d}"
+              f"{str(outputs == baseline):>13}")
+
+
+if __name__ == "__main__":
+    main()
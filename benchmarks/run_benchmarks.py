@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Reproducible offline benchmark of the AutoSub pipeline.
+
+Generates synthetic speech-like and silence-only audio, then times each stage
+on its own and end to end, reporting real-time factor (processing time /
+audio duration), frames per second and peak RSS. Inference runs against the
+deterministic stand-in in fake_stt.py, so no network or model files are
+needed. Results can be saved as JSON and compared with an earlier run.
+
+    $ python3 benchmarks/run_benchmarks.py --duration 600 --output before.json
+    $ python3 benchmarks/run_benchmarks.py --duration 600 --compare before.json
+"""
+
+import io
+import os
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+
+import numpy as np
+
+from common import synth_speech, synth_silence, write_wav, timed, peak_rss_mb, length_distribution, \
+    preload_dependencies, SAMPLE_RATE
+import fake_stt
+
+import featureExtraction as FE
+import segmentAudio as SA
+from inference import ds_process_audio
+from writeToFile import Cue, SubtitleWriter
+
+FORMATS = ["srt", "vtt", "txt"]
+
+
+def output_writer():
+    return SubtitleWriter({fmt: io.StringIO() for fmt in FORMATS})
+
+
+def transcribe(ds, segments, split_duration=5):
+    writer = output_writer()
+    line_count = 1
+    for segment in segments:
+        line_count = ds_process_audio(ds, segment, writer, split_duration, line_count)
+    return writer, line_count - 1
+
+
+def subtitle_lines(n_lines):
+    """Synthetic subtitle lines of 8 words with word cues, for the writer benchmark"""
+
+    lines = []
+    for i in range(n_lines):
+        start = 3.0 * i
+        words = [f"word{j}" for j in range(8)]
+        word_starts = tuple([start] + [start + 0.3 * j for j in range(1, 8)])
+        lines.append(Cue(i + 1, start, start + 2.7, " ".join(words), word_starts, i % 4 == 3))
+    return lines
+
+
+def write_lines(lines):
+    writer = output_writer()
+    for cue in lines:
+        writer.write([cue])
+    return writer
+
+
+def record(results, name, seconds, audio_seconds, frames=None, **extra):
+    stats = {
+        "seconds": seconds,
+        "rtf": seconds / audio_seconds if audio_seconds else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if frames is not None:
+        stats["frames"] = frames
+        stats["frames_per_second"] = frames / seconds if seconds else None
+    stats.update(extra)
+    results[name] = stats
+    print(f"{name:<32}{seconds:>10.3f}s  rtf {stats['rtf'] or 0:>8.4f}  rss {stats['peak_rss_mb']:>8.1f} MB")
+
+
+def run(args):
+    preload_dependencies()
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="autosub-bench-")
+    try:
+        speech, _ = synth_speech(args.duration, seed=args.seed)
+        silence = synth_silence(args.duration, seed=args.seed)
+        speech_wav = os.path.join(workdir, "speech.wav")
+        silence_wav = os.path.join(workdir, "silence.wav")
+        write_wav(speech_wav, speech)
+        write_wav(silence_wav, silence)
+        ds = fake_stt.Model(delay=args.stt_delay)
+
+        feats, elapsed = timed(FE.feature_extraction, speech, SAMPLE_RATE, 0.05 * SAMPLE_RATE,
+                               0.05 * SAMPLE_RATE, repeat=args.repeat)
+        record(results, "feature_extraction", elapsed, args.duration, frames=feats[0].shape[1])
+        del feats
+
+        seg_limits, elapsed = timed(SA.silence_removal, speech, SAMPLE_RATE, 0.05, 0.05, 1.0, 0.2,
+                                    repeat=args.repeat)
+        record(results, "silence_removal", elapsed, args.duration, frames=int(args.duration / 0.05),
+               segments=len(seg_limits))
+
+        segments, elapsed = timed(SA.remove_silent_segments, speech_wav, repeat=args.repeat)
+        record(results, "remove_silent_segments", elapsed, args.duration, segments=len(segments),
+               segment_seconds=length_distribution([(s.start_time, s.end_time) for s in segments]))
+
+        silent_segments, elapsed = timed(SA.remove_silent_segments, silence_wav, repeat=args.repeat)
+        record(results, "remove_silent_segments_silence", elapsed, args.duration, segments=len(silent_segments))
+
+        (_, n_lines), elapsed = timed(transcribe, ds, segments, repeat=args.repeat)
+        speech_seconds = sum(s.end - s.start for s in segments) / SAMPLE_RATE
+        record(results, "ds_process_audio", elapsed, speech_seconds, segments=len(segments), lines=n_lines)
+
+        lines = subtitle_lines(max(n_lines, 1000))
+        _, elapsed = timed(write_lines, lines, repeat=args.repeat)
+        record(results, "write_to_file", elapsed, 3.0 * len(lines), lines=len(lines))
+
+        def end_to_end():
+            return transcribe(ds, SA.remove_silent_segments(speech_wav))
+
+        _, elapsed = timed(end_to_end, repeat=args.repeat)
+        record(results, "end_to_end", elapsed, args.duration)
+    finally:
+        shutil.rmtree(workdir)
+    return results
+
+
+def compare(results, baseline):
+    print(f"\n{'stage':<32}{'before (s)':>12}{'after (s)':>12}{'speedup':>9}")
+    for name, stats in results.items():
+        if name in baseline:
+            before = baseline[name]["seconds"]
+            print(f"{name:<32}{before:>12.3f}{stats['seconds']:>12.3f}{before / stats['seconds']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline AutoSub benchmark")
+    parser.add_argument("--duration", type=float, default=300, help="Length of the test audio in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic audio")
+    parser.add_argument("--repeat", type=int, default=1, help="Timing repetitions, the best is reported")
+    parser.add_argument("--stt-delay", dest="stt_delay", type=float, default=0.0,
+                        help="Simulated inference seconds per second of audio")
+    parser.add_argument("--output", help="Save the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare against")
+    args = parser.parse_args()
+
+    started = time.time()
+    results = run(args)
+    report = {
+        "meta": {
+            "duration": args.duration,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "stt_delay": args.stt_delay,
+            "started": started,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "stages": results,
+    }
+    if args.output:
+        with open(args.output, "w") as fout:
+            json.dump(report, fout, indent=2)
+    if args.compare:
+        with open(args.compare) as fin:
+            compare(results, json.load(fin)["stages"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Segment length distribution with and without --max-segment-seconds, on
+synthetic continuous speech whose pauses are too short for silence detection
+to split it. Each limit also reports the segmentation time and the longest
+inference call, with the stand-in model taking --stt-delay seconds per
+second of audio.
+
+    $ python3 benchmarks/segment_lengths.py --duration 600 --limits 0 30 15 8
+"""
+
+import argparse
+
+from common import synth_speech, timed, length_distribution, preload_dependencies, SAMPLE_RATE
+
+from segmentAudio import detect_speech, VAD_ENGINES
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark segment length limits")
+    parser.add_argument("--duration", type=float, default=300, help="Length of the test audio in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic audio")
+    parser.add_argument("--vad", choices=list(VAD_ENGINES), default="svm", help="VAD engine")
+    parser.add_argument("--limits", type=float, nargs="+", default=[0, 30, 15, 8],
+                        help="Values of --max-segment-seconds to compare, 0 for no limit")
+    parser.add_argument("--stt-delay", dest="stt_delay", type=float, default=0.1,
+                        help="Simulated inference seconds per second of audio")
+    args = parser.parse_args()
+    preload_dependencies()
+
+    signal, _ = synth_speech(args.duration, seed=args.seed, gaps=(0.02, 0.2))
+
+    print(f"{'limit (s)':<11}{'time (s)':>9}{'segments':>10}{'mean':>8}{'p50':>8}{'p95':>8}{'max':>8}"
+          f"{'speech (s)':>12}{'longest call (s)':>18}")
+    for limit in args.limits:
+        seg_limits, elapsed = timed(detect_speech, signal, SAMPLE_RATE, 0.05, 0.05, 1.0, 0.2, vad=args.vad,
+                                    max_segment_seconds=limit)
+        lengths = length_distribution(seg_limits)
+        if not lengths["count"]:
+            print(f"{limit or 'none':<11}{elapsed:>9.3f}{0:>10d}")
+            continue
+        speech = sum(end - start for start, end in seg_limits)
+        print(f"{limit or 'none':<11}{elapsed:>9.3f}{lengths['count']:>10d}{lengths['mean']:>8.2f}"
+              f"{lengths['p50']:>8.2f}{lengths['p95']:>8.2f}{lengths['max']:>8.2f}{speech:>12.2f}"
+              f"{lengths['max'] * args.stt_delay:>18.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Drive the --serve HTTP API locally with the stand-in model. Starts
+make_server() on a free port in a thread, serving a TranscriptionService
+whose models are fake_stt.Model and which reads the WAV files directly instead
+of through FFMPEG. Checks /health and /queue, submits --jobs jobs of synthetic
+speech with POST /jobs, and reads the subtitles of every job from /stream
+while it runs and from /result?wait=1. The table shows the time to the first
+streamed subtitles and to the result of every job, and whether the stream is
+the same as the result. Exits with status 1 if a check fails.
+
+    $ python3 benchmarks/server_api.py --duration 120 --jobs 3 --models 2
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+
+from common import synth_speech, write_wav
+import fake_stt
+
+from segmentAudio import read_audio_blocks, VAD_ENGINES
+from server import TranscriptionService, make_server
+
+
+def request(base, path, body=None):
+    """(status, decoded JSON body) of a request to the API"""
+
+    data = json.dumps(body).encode() if body is not None else None
+    try:
+        with urllib.request.urlopen(base + path, data=data) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def read_stream(base, job_id, started, out):
+    """Read /jobs/<id>/stream to the end, noting when the first subtitles arrived"""
+
+    chunks = []
+    with urllib.request.urlopen(f"{base}/jobs/{job_id}/stream?format=srt") as response:
+        while True:
+            chunk = response.read1(65536)
+            if not chunk:
+                break
+            if not chunks:
+                out["first"] = time.perf_counter() - started
+            chunks.append(chunk)
+    out["text"] = b"".join(chunks).decode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the HTTP API of --serve with the stand-in model")
+    parser.add_argument("--duration", type=float, default=120, help="Length of the audio of each job in seconds")
+    parser.add_argument("--jobs", type=int, default=3, help="Number of jobs submitted at once")
+    parser.add_argument("--models", type=int, default=2, help="Number of pooled models")
+    parser.add_argument("--vad", choices=list(VAD_ENGINES), default="svm", help="VAD engine of the jobs")
+    parser.add_argument("--stt-delay", dest="stt_delay", type=float, default=0.05,
+                        help="Simulated inference seconds per second of audio")
+    args = parser.parse_args()
+
+    failures = []
+
+    def check(ok, message):
+        if not ok:
+            failures.append(message)
+
+    workdir = tempfile.mkdtemp(prefix="autosub-bench-")
+    service = TranscriptionService(lambda: fake_stt.Model(delay=args.stt_delay), args.models, vad=args.vad,
+                                   reader=read_audio_blocks)
+    server = make_server("127.0.0.1:0", service)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        status, health = request(base, "/health")
+        check(status == 200 and health["status"] == "ok" and health["models"] == args.models,
+              f"/health returned {status} {health}")
+
+        jobs = []
+        for seed in range(args.jobs):
+            wav = os.path.join(workdir, f"speech-{seed}.wav")
+            write_wav(wav, synth_speech(args.duration, seed=seed)[0])
+            started = time.perf_counter()
+            status, job = request(base, "/jobs", {"file": wav, "formats": ["srt", "vtt"]})
+            check(status == 202, f"POST /jobs returned {status} {job}")
+            stream = {}
+            reader = threading.Thread(target=read_stream, args=(base, job["id"], started, stream))
+            reader.start()
+            jobs.append((job["id"], started, stream, reader))
+
+        status, stats = request(base, "/queue")
+        check(status == 200 and stats["queued"] + stats["running"] + stats["done"] == args.jobs,
+              f"/queue returned {status} {stats}")
+        status, _ = request(base, "/jobs/0")
+        check(status == 404, f"GET of an unknown job returned {status}")
+
+        print(f"{'job':<6}{'first cue (s)':>15}{'result (s)':>12}{'lines':>7}{'stream = result':>17}")
+        for job_id, started, stream, reader in jobs:
+            with urllib.request.urlopen(f"{base}/jobs/{job_id}/result?format=srt&wait=1") as response:
+                result = response.read().decode()
+            elapsed = time.perf_counter() - started
+            with urllib.request.urlopen(f"{base}/jobs/{job_id}/result?format=vtt") as response:
+                check(response.read().decode().startswith("WEBVTT"), f"job {job_id} has no VTT result")
+            reader.join()
+            same = stream.get("text") == result
+            lines = result.count(" --> ")
+            check(same, f"job {job_id} streamed other subtitles than its result")
+            check(lines > 0, f"job {job_id} has no subtitles")
+            first = f"{stream['first']:.3f}" if "first" in stream else "-"
+            print(f"{job_id:<6}{first:>15}{elapsed:>12.3f}{lines:>7d}{str(same):>17}")
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(workdir)
+
+    for failure in failures:
+        print(f"Failed: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
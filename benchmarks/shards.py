@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Sharded transcription against a single process, on synthetic speech.
+Each shard runs in its own local process, standing in for a machine: it cuts
+its window out of the audio (as FFMPEG -ss/-t does), finds its speech segments
+and transcribes them. The shard transcripts are then merged. The table shows
+the wall time of every shard count, how much of the timeline the merged
+segments label as speech or silence like the single process does, and whether
+the merged subtitles are the same. The stand-in model takes --stt-delay seconds per second of audio.
+
+Silence detection adapts to the audio of each window. On the clean audio
+(--audio clean, with digital silence between the bursts) the energy and flux
+engines find the same segments in every window, and the merged subtitles are
+the same. The svm engine trains its classifier on each window, and needs the
+noisy --audio speech, on which merged subtitles differ from an unsharded run.
+
+    $ python3 benchmarks/shards.py --duration 600 --shards 2 4 8
+    $ python3 benchmarks/shards.py --duration 600 --shards 2 4 8 --audio speech --vad svm
+"""
+
+import io
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+
+from common import synth_clean_speech, synth_speech, write_wav, segment_agreement, preload_dependencies, SAMPLE_RATE
+import fake_stt
+
+from segmentAudio import remove_silent_segments, VAD_ENGINES
+from inference import ds_process_audio, write_transcript
+from sharding import plan_shards, ShardWriter, merge_shards
+from writeToFile import SubtitleWriter
+
+FORMATS = ["srt", "vtt", "txt"]
+
+
+def output_writer():
+    return SubtitleWriter({fmt: io.StringIO() for fmt in FORMATS})
+
+
+def outputs(writer):
+    return {fmt: output.getvalue() for fmt, output in writer.outputs.items()}
+
+
+def limits(segments):
+    return [(segment.start_time, segment.end_time) for segment in segments]
+
+
+def single_process(wav, vad, delay, split_duration):
+    """Subtitles and segment limits of a single process run"""
+
+    ds = fake_stt.Model(delay=delay)
+    writer = output_writer()
+    line_count = 1
+    segments = remove_silent_segments(wav, vad=vad)
+    for segment in segments:
+        line_count = ds_process_audio(ds, segment, writer, split_duration, line_count)
+    return outputs(writer), limits(segments)
+
+
+def transcribe_shard(job):
+    """Shard process: (signal, index, count, window, workdir, vad, delay, split_duration) -> ShardTranscript"""
+
+    signal, index, count, (start, end), workdir, vad, delay, split_duration = job
+    window = (int(round(start * SAMPLE_RATE)), int(round(end * SAMPLE_RATE)))
+    wav = os.path.join(workdir, f"shard-{index}.wav")
+    write_wav(wav, signal[window[0]:window[1]])
+    ds = fake_stt.Model(delay=delay)
+    writer = ShardWriter(index, count, window, SAMPLE_RATE)
+    line_count = 1
+    for segment in remove_silent_segments(wav, vad=vad):
+        line_count = ds_process_audio(ds, segment, writer, split_duration, line_count)
+    return writer.transcript()
+
+
+def sharded(signal, count, overlap, workdir, vad, delay, split_duration):
+    windows = plan_shards(len(signal) / SAMPLE_RATE, count, overlap)
+    jobs = [(signal, index, count, window, workdir, vad, delay, split_duration)
+            for index, window in enumerate(windows, 1)]
+    with multiprocessing.Pool(count) as pool:
+        shards = pool.map(transcribe_shard, jobs)
+    writer = output_writer()
+    line_count = 1
+    transcript = merge_shards(shards)
+    for segment, tokens in transcript:
+        line_count = write_transcript(tokens, segment, writer, split_duration, line_count)
+    return outputs(writer), limits(segment for segment, _ in transcript)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sharded transcription")
+    parser.add_argument("--duration", type=float, default=600, help="Length of the test audio in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic audio")
+    parser.add_argument("--shards", type=int, nargs="+", default=[2, 4, 8], help="Shard counts to compare")
+    parser.add_argument("--overlap", type=float, default=10, help="Seconds shared by neighbouring shards")
+    parser.add_argument("--audio", choices=["clean", "speech"], default="clean",
+                        help="Test audio: clean tone bursts between digital silence, or noisy speech-like audio")
+    parser.add_argument("--vad", choices=list(VAD_ENGINES), default="energy",
+                        help="VAD engine, svm needs --audio speech")
+    parser.add_argument("--split-duration", dest="split_duration", type=float, default=5,
+                        help="Subtitle line length in seconds")
+    parser.add_argument("--stt-delay", dest="stt_delay", type=float, default=0.05,
+                        help="Simulated inference seconds per second of audio")
+    args = parser.parse_args()
+    preload_dependencies()
+
+    if args.audio == "clean":
+        signal = synth_clean_speech(args.duration, seed=args.seed)
+    else:
+        signal, _ = synth_speech(args.duration, seed=args.seed)
+    workdir = tempfile.mkdtemp(prefix="autosub-bench-")
+    try:
+        wav = os.path.join(workdir, "speech.wav")
+        write_wav(wav, signal)
+        start = time.perf_counter()
+        baseline, baseline_limits = single_process(wav, args.vad, args.stt_delay, args.split_duration)
+        single = time.perf_counter() - start
+        lines = baseline["srt"].count(" --> ")
+
+        print(f"{'shards':<8}{'time (s)':>10}{'speedup':>9}{'lines':>7}{'segments':>10}{'agreement':>11}"
+              f"{'same output':>13}")
+        print(f"{1:<8d}{single:>10.3f}{1.0:>9.2f}{lines:>7d}{len(baseline_limits):>10d}{'-':>11}{'-':>13}")
+        for count in args.shards:
+            start = time.perf_counter()
+            merged, merged_limits = sharded(signal, count, args.overlap, workdir, args.vad, args.stt_delay, args.split_duration)
+            elapsed = time.perf_counter() - start
+            agreement = segment_agreement(baseline_limits, merged_limits, args.duration)["frame_agreement"]
+            print(f"{count:<8d}{elapsed:>10.3f}{single / elapsed:>9.2f}{merged['srt'].count(' --> '):>7d}"
+                  f"{len(merged_limits):>10d}{agreement:>11.1%}{str(merged == baseline):>13}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
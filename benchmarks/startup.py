@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Cold start time of the AutoSub CLI. Every scenario runs in a fresh
+interpreter with python -X importtime: main.py --help, main.py --dry-run
+(which loads the model) and a run up to the first transcribed segment of a
+short synthetic recording. The table shows the best wall time, the time spent
+importing modules and the heavy dependencies that were imported. --help and
+--dry-run must not import sklearn, scipy, pydub or tqdm, and --help must not
+import stt either. The script exits with status 1 when they do, or when a
+scenario is more than --max-slowdown times slower than in the --compare run.
+The stand-in model of fake_stt.py is used when stt is not installed.
+
+    $ python3 benchmarks/startup.py --output before.json
+    $ python3 benchmarks/startup.py --compare before.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import importlib.util
+
+from common import synth_speech, write_wav, AUTOSUB_DIR
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+MAIN = os.path.join(AUTOSUB_DIR, "main.py")
+
+HEAVY_MODULES = ["stt", "sklearn", "scipy", "pydub", "tqdm"]
+
+# The imports of a CLI run, then the work up to the first subtitle line
+FIRST_SEGMENT = """
+import io
+import sys
+
+import main
+from utils import create_model
+from segmentAudio import remove_silent_segments
+from inference import ds_process_audio
+from writeToFile import SubtitleWriter
+
+model, scorer, audio, vad = sys.argv[1:]
+ds = create_model("stt", model, scorer)
+segments = remove_silent_segments(audio, vad=vad)
+ds_process_audio(ds, segments[0], SubtitleWriter({"srt": io.StringIO()}), 5)
+"""
+
+
+def scenarios(workdir, vad):
+    """name -> (command, heavy modules it must not import)"""
+
+    model, scorer, audio = (os.path.join(workdir, name) for name in ["model.tflite", "model.scorer", "speech.wav"])
+    options = ["--model", model, "--scorer", scorer]
+    return {
+        "help": ([MAIN, "--help"], HEAVY_MODULES),
+        "dry-run": ([MAIN, "--dry-run"] + options, [name for name in HEAVY_MODULES if name != "stt"]),
+        "first segment": (["-c", FIRST_SEGMENT, model, scorer, audio, vad], []),
+    }
+
+
+def environment(workdir):
+    """Environment of the runs: the autosub modules importable, and the stand-in
+    model installed as the stt module if the real one is missing"""
+
+    path = [os.path.abspath(AUTOSUB_DIR)]
+    if importlib.util.find_spec("stt") is None:
+        with open(os.path.join(workdir, "stt.py"), "w") as f:
+            f.write("from fake_stt import *  # noqa: F401,F403\n")
+        path += [workdir, BENCHMARK_DIR]
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(path + [env["PYTHONPATH"]] if env.get("PYTHONPATH") else path)
+    return env
+
+
+def parse_importtime(stderr):
+    """Import time report of python -X importtime
+
+    Returns:
+        modules : {name: cumulative seconds} of the modules imported at the top level
+        imported : set of the names of every imported module
+    """
+
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((len(name) - len(name.lstrip()), int(cumulative) / 1e6, name.strip()))
+    if not rows:
+        return {}, set()
+    top = min(depth for depth, _, _ in rows)
+    modules = {name: seconds for depth, seconds, name in rows if depth == top}
+    return modules, {name for _, _, name in rows}
+
+
+def measure(command, env, cwd, repeat):
+    best, report = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-X", "importtime"] + command, env=env, cwd=cwd,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(command[:2])} failed:\n{result.stderr[-2000:]}")
+        if best is None or elapsed < best:
+            best, report = elapsed, result.stderr
+    modules, imported = parse_importtime(report)
+    heavy = [name for name in HEAVY_MODULES if name in imported]
+    return {"seconds": best, "import_seconds": sum(modules.values()), "heavy_imports": heavy,
+            "slowest_imports": sorted(modules.items(), key=lambda item: -item[1])[:5]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cold start of the AutoSub CLI")
+    parser.add_argument("--duration", type=float, default=30, help="Length of the test audio in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic audio")
+    parser.add_argument("--vad", default="svm", help="VAD engine of the first segment run")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of every scenario, the best is reported")
+    parser.add_argument("--top", type=int, default=3, help="Slowest top level imports to list per scenario")
+    parser.add_argument("--output", help="Save the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare against")
+    parser.add_argument("--max-slowdown", dest="max_slowdown", type=float, default=1.25,
+                        help="Fail when a scenario takes more than this times its --compare time")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="autosub-bench-")
+    try:
+        for name in ["model.tflite", "model.scorer"]:
+            open(os.path.join(workdir, name), "w").close()
+        signal, _ = synth_speech(args.duration, seed=args.seed)
+        write_wav(os.path.join(workdir, "speech.wav"), signal)
+        env = environment(workdir)
+
+        results, failures = {}, []
+        print(f"{'scenario':<16}{'wall (s)':>10}{'imports (s)':>13}  heavy imports")
+        for name, (command, forbidden) in scenarios(workdir, args.vad).items():
+            stats = results[name] = measure(command, env, workdir, args.repeat)
+            print(f"{name:<16}{stats['seconds']:>10.3f}{stats['import_seconds']:>13.3f}  "
+                  f"{', '.join(stats['heavy_imports']) or '-'}")
+            for module, seconds in stats["slowest_imports"][:args.top]:
+                print(f"{'':<16}{'':>10}{seconds:>13.3f}    {module}")
+            unexpected = [module for module in stats["heavy_imports"] if module in forbidden]
+            if unexpected:
+                failures.append(f"{name} imports {', '.join(unexpected)}")
+    finally:
+        shutil.rmtree(workdir)
+
+    if args.output:
+        with open(args.output, "w") as fout:
+            json.dump({"meta": {"duration": args.duration, "seed": args.seed, "vad": args.vad,
+                                "repeat": args.repeat, "python": platform.python_version(),
+                                "platform": platform.platform()},
+                       "scenarios": results}, fout, indent=2)
+    if args.compare:
+        with open(args.compare) as fin:
+            baseline = json.load(fin)["scenarios"]
+        print(f"\n{'scenario':<16}{'before (s)':>12}{'after (s)':>12}{'speedup':>9}")
+        for name, stats in results.items():
+            if name in baseline:
+                before = baseline[name]["seconds"]
+                print(f"{name:<16}{before:>12.3f}{stats['seconds']:>12.3f}{before / stats['seconds']:>9.2f}")
+                if stats["seconds"] > before * args.max_slowdown:
+                    failures.append(f"{name} is {stats['seconds'] / before:.2f} times slower than before")
+    for failure in failures:
+        print(f"Regression: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Segmentation speed of each VAD engine, and its agreement with the "svm"
+engine and with the true speech bursts of synthetic speech-like audio.
+
+    $ python3 benchmarks/vad_engines.py --duration 600
+"""
+
+import argparse
+
+from common import synth_speech, timed, segment_agreement, preload_dependencies, SAMPLE_RATE
+
+from segmentAudio import detect_speech, VAD_ENGINES
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark VAD engines")
+    parser.add_argument("--duration", type=float, default=300, help="Length of the test audio in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic audio")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions, the best is reported")
+    args = parser.parse_args()
+    preload_dependencies()
+
+    signal, truth = synth_speech(args.duration, seed=args.seed)
+    results = {}
+    for vad in VAD_ENGINES:
+        results[vad] = timed(detect_speech, signal, SAMPLE_RATE, 0.05, 0.05, 1.0, 0.2, vad=vad,
+                             repeat=args.repeat)
+    reference, svm_time = results["svm"]
+
+    print(f"{'engine':<10}{'time (s)':>10}{'speedup':>9}{'vs svm':>9}{'vs truth':>10}{'bound err (s)':>15}"
+          f"{'segments':>10}")
+    for vad, (seg_limits, elapsed) in results.items():
+        against_svm = segment_agreement(reference, seg_limits, args.duration)
+        against_truth = segment_agreement(truth, seg_limits, args.duration)
+        print(f"{vad:<10}{elapsed:>10.3f}{svm_time / elapsed:>9.2f}{against_svm['frame_agreement']:>9.4f}"
+              f"{against_truth['frame_agreement']:>10.4f}{against_truth['boundary_error']:>15.3f}"
+              f"{against_truth['n_hypothesis']:>10d}")
+    print(f"{'truth':<10}{'':>10}{'':>9}{'':>9}{'':>10}{'':>15}{len(truth):>10d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Decode time and peak RSS of the memory-mapped WAV reader against the
+pydub decode, on a multi-hour synthetic 16 kHz mono WAV. Each reader runs in
+a fresh process so the peak RSS figures do not interfere.
+
+    $ python3 benchmarks/wav_reader.py --hours 3
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+from common import write_long_wav, AUTOSUB_DIR
+
+# Runs in a child process: read the file, touch every sample and report
+CHILD = """
+import sys, json, time, resource
+sys.path.insert(0, {autosub_dir!r})
+import numpy as np
+import segmentAudio as SA
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+fs, signal = SA.read_audio_file({path!r}, use_mmap={use_mmap!r})
+decode = time.perf_counter() - start
+if {segment!r}:
+    SA.silence_removal(signal, fs, 0.05, 0.05, 1.0, 0.2)
+else:
+    int(np.max(signal))
+total = time.perf_counter() - start
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{"decode_s": decode, "total_s": total, "peak_rss_mb": peak / 1024.0,
+                  "rss_over_imports_mb": (peak - baseline) / 1024.0}}))
+"""
+
+
+def run_reader(path, use_mmap, segment):
+    code = CHILD.format(autosub_dir=os.path.abspath(AUTOSUB_DIR), path=path, use_mmap=use_mmap,
+                        segment=segment)
+    output = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, check=True).stdout
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark WAV readers")
+    parser.add_argument("--hours", type=float, default=2.0, help="Length of the test file in hours")
+    parser.add_argument("--segment", action="store_true", help="Also run silence_removal on the samples")
+    parser.add_argument("--keep", help="Write the test WAV to this path and keep it")
+    args = parser.parse_args()
+
+    path = args.keep or os.path.join(tempfile.mkdtemp(prefix="autosub-bench-"), "long.wav")
+    if not os.path.isfile(path):
+        write_long_wav(path, args.hours * 3600)
+    try:
+        print(f"{'reader':<8}{'decode (s)':>12}{'total (s)':>12}{'peak RSS (MB)':>15}{'over imports (MB)':>19}")
+        for name, use_mmap in (("pydub", False), ("mmap", True)):
+            stats = run_reader(path, use_mmap, args.segment)
+            print(f"{name:<8}{stats['decode_s']:>12.3f}{stats['total_s']:>12.3f}{stats['peak_rss_mb']:>15.1f}"
+                  f"{stats['rss_over_imports_mb']:>19.1f}")
+    finally:
+        if not args.keep:
+            os.remove(path)
+            os.rmdir(os.path.dirname(path))
+
+
+if __name__ == "__main__":
+    main()